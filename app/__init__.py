@@ -1,5 +1,21 @@
-from app.models import *
-from app.functions import  *
-from app.main import trashcan_monitor
+from importlib import import_module
 
-__all__ = ['trashcan_monitor']
\ No newline at end of file
+# The package used to import everything up front. Names are now resolved on first use, see app.functions.
+_PACKAGES = ['app.models', 'app.functions']
+
+__all__ = ['trashcan_monitor']
+
+
+def __getattr__(name: str):
+    if name == 'trashcan_monitor':
+        value = import_module('app.main').trashcan_monitor
+    else:
+        for package in _PACKAGES:
+            module = import_module(package)
+            if name in module.__all__:
+                value = getattr(module, name)
+                break
+        else:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
@@ -0,0 +1,69 @@
+"""
+    Streams stored results out of MongoDB as flat csv, ndjson or parquet, with memory that does not grow with the
+    number of documents.
+
+        python -m app.export --start 2026-01-01 --end 2026-01-08 --out week.csv
+        python -m app.export --format ndjson --metrics cell_5g_stats_SNRCurrent,cell_5g_stats_RSRPCurrent --gateway gw1
+        python -m app.export --format parquet --out results.parquet --workers 4 --batch-size 5000
+        python -m app.export --format ndjson --raw --fields radio_raw_data --start 2026-01-01T12:00
+
+    The connection falls back to the mongodb_uri, results_db and db_collection environment variables.
+"""
+import sys
+import argparse
+from os import environ
+from datetime import datetime, timezone
+from pymongo import MongoClient
+from app.transport.mongodb.exporter import ResultExporter, EXPORT_FORMATS
+
+
+def parse_time(value: str) -> datetime:
+    """
+    ISO 8601 date or date and time, UTC unless it carries an offset.
+    """
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(prog="python -m app.export", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=environ.get("mongodb_uri", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default=environ.get("results_db"), required=not environ.get("results_db"))
+    parser.add_argument("--collection", default=environ.get("db_collection", "trashcan_results"))
+    parser.add_argument("--meta-field", default="gateway_id", help="The field gateways are told apart by.")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--out", default="-", help="Output file, - for stdout. Parts are named after it.")
+    parser.add_argument("--start", type=parse_time, default=None, help="First timestamp, inclusive.")
+    parser.add_argument("--end", type=parse_time, default=None, help="Last timestamp, exclusive.")
+    parser.add_argument("--gateway", default=None, help="Only this gateway.")
+    parser.add_argument("--metrics", default=None, help="Comma separated metric names, all by default.")
+    parser.add_argument("--raw", action="store_true", help="Whole documents instead of flat records, ndjson only.")
+    parser.add_argument("--fields", default=None, help="Comma separated top level fields of --raw documents.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documents per cursor round trip.")
+    parser.add_argument("--workers", type=int, default=1, help="Parallel time slices, one output file each.")
+    args = parser.parse_args(argv)
+
+    if args.out == "-" and (args.workers > 1 or args.format == "parquet"):
+        parser.error("--workers and the parquet format need --out.")
+
+    client = MongoClient(args.uri)
+    try:
+        exporter = ResultExporter(client[args.db][args.collection],
+                                  metrics=args.metrics.split(",") if args.metrics else None, raw=args.raw,
+                                  fields=args.fields.split(",") if args.fields else None,
+                                  batch_size=args.batch_size, meta_field=args.meta_field)
+        if args.out == "-":
+            exporter.export(exporter.writer(args.format, stream=sys.stdout), args.start, args.end, args.gateway)
+            return
+        written = exporter.export_files(args.format, args.out, args.start, args.end, args.gateway, args.workers)
+        for file_path, count in written.items():
+            print(f"{file_path}: {count} documents", file=sys.stderr)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,33 @@
-from app.functions.config_init import ConfigApp
-from app.functions.trashcan_monitor import TrashcanMonitor
+from importlib import import_module
 
-__all__ = ['ConfigApp', 'TrashcanMonitor']
+# Exported name to the module it is defined in. Modules are imported on first use, so importing one function does
+# not load requests, asyncio and pydantic for all the others.
+_EXPORTS = {
+    'CellChangeTracker': 'app.functions.cell_tracker',
+    'ConfigApp': 'app.functions.config_init',
+    'EventDetector': 'app.functions.event_detector',
+    'FleetCollector': 'app.functions.fleet_collector',
+    'GatewaySession': 'app.functions.gateway_session',
+    'GridScheduler': 'app.functions.scheduler',
+    'MetricsServer': 'app.functions.metrics_server',
+    'Pipeline': 'app.functions.pipeline',
+    'RateEngine': 'app.functions.rate_engine',
+    'RollupEngine': 'app.functions.rollups',
+    'SampleBuffer': 'app.functions.sample_buffer',
+    'TrashcanMonitor': 'app.functions.trashcan_monitor',
+}
+
+__all__ = ['CellChangeTracker', 'ConfigApp', 'EventDetector', 'FleetCollector', 'GatewaySession', 'GridScheduler',
+           'MetricsServer', 'Pipeline', 'RateEngine', 'RollupEngine', 'SampleBuffer', 'TrashcanMonitor']
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,154 @@
+from time import time, monotonic
+from threading import Lock
+from collections import deque
+from datetime import datetime, timezone
+from logging import getLogger, Logger
+from app.models.metric_map import metric_extractor
+
+__all__ = ['CellChangeTracker', 'CELL_FIELDS', 'dwell_by_value']
+
+# (technology, field) to the metric it is read from. A change of cell is a handover.
+CELL_FIELDS = {
+    ("5g", "cell"): "cell_5g_stats_PhysicalCellID",
+    ("5g", "band"): "cell_5g_stats_Band",
+    ("5g", "channel"): "cell_5g_stats_Downlink_NR_ARFCN",
+    ("lte", "cell"): "cell_lte_stats_PhysicalCellID",
+    ("lte", "band"): "cell_lte_stats_Band",
+    ("lte", "channel"): "cell_lte_stats_DownlinkEarfcn",
+}
+
+
+def _epoch(value) -> float:
+    if isinstance(value, datetime):
+        # pymongo returns naive UTC datetimes.
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+    return value
+
+
+def dwell_by_value(changes: list, since: float, until: float) -> dict:
+    """
+    Adds up how long each value was held between since and until. changes are the change records of one gateway,
+    technology and field, oldest first, starting with the last one at or before since. Each holds its value from
+    its changed_at to the changed_at of the next one, the last one until until.
+
+    :param changes: list, Dicts with changed_at (epoch seconds or datetime) and new_value.
+    :return: dict, {value: seconds}
+    """
+    dwell = {}
+    for index, change in enumerate(changes):
+        start = max(_epoch(change["changed_at"]), since)
+        end = min(_epoch(changes[index + 1]["changed_at"]) if index + 1 < len(changes) else until, until)
+        if end > start:
+            dwell[change["new_value"]] = dwell.get(change["new_value"], 0.0) + end - start
+    return dwell
+
+
+class CellChangeTracker:
+    """
+        CellChangeTracker follows the serving cell, band and channel of each gateway, for 5G and LTE, and reports a
+        change record whenever one of them changes: the old and the new value, when it changed and how long the old
+        value was held. The first value seen for a gateway is reported with old_value None, so the records of a
+        field always tell what it was from then on.
+
+        Samples without a value, e.g. while the gateway is down, change nothing, the old value is held through them.
+        A sample costs one comparison per field, the state is the current value of each field per gateway. Records
+        the sink fails to take are kept and sent again with a sample at least retry_interval seconds later, so a
+        sink that is down does not hold up every sample, and by flush.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, sink=None, fields: dict = None, max_unwritten: int = 10000, retry_interval: float = 60.0):
+        """
+            :param sink: object, Gets add_cell_changes(documents). Changes are only logged when there is no sink.
+            :param fields: dict, {(technology, field): metric name}, CELL_FIELDS by default.
+            :param max_unwritten: int, Records kept while the sink fails, the oldest are dropped beyond that.
+            :param retry_interval: float, Seconds after a failed write before the sink is tried again.
+        """
+        self.sink = sink
+        self.retry_interval = retry_interval
+        self._fields = [(technology, field, metric_extractor.names.index(metric))
+                        for (technology, field), metric in (fields or CELL_FIELDS).items()]
+        # {gateway_id: {(technology, field): (value, since)}}
+        self._current = {}
+        self._lock = Lock()
+        # Records the sink failed to take, oldest first.
+        self._unwritten = deque(maxlen=max_unwritten)
+        self._retry_at = None
+        self._write_lock = Lock()
+
+    def observe(self, results: dict) -> list:
+        """
+        :return: list, The change records of this sample.
+        """
+        timestamp = results["timestamp"].timestamp() if results.get("timestamp") else time()
+        gateway_id = results.get("gateway_id") or results.get("container_id")
+        values = metric_extractor.extract_values(results)
+
+        changes = []
+        with self._lock:
+            current = self._current.setdefault(gateway_id, {})
+            for technology, field, position in self._fields:
+                value = values[position]
+                if value is None:
+                    continue
+                held = current.get((technology, field))
+                if held is not None and held[0] == value:
+                    continue
+                current[(technology, field)] = (value, timestamp)
+                changes.append({
+                    "gateway_id": gateway_id,
+                    "technology": technology,
+                    "field": field,
+                    "old_value": held[0] if held else None,
+                    "new_value": value,
+                    "changed_at": datetime.fromtimestamp(timestamp, tz=timezone.utc),
+                    "dwell_seconds": round(timestamp - held[1], 3) if held else None
+                })
+
+        for change in changes:
+            if change["old_value"] is not None:
+                self.log.info(f"{change['technology']} {change['field']} of {gateway_id} changed from "
+                              f"{change['old_value']} to {change['new_value']} after {change['dwell_seconds']}s")
+        if self.sink is not None and (changes or self._unwritten):
+            self._write(changes)
+        return changes
+
+    def _write(self, changes: list, retry_now: bool = False) -> bool:
+        """
+        Hands records to the sink after the ones it failed to take before. A record is identified by its gateway,
+        technology, field and changed_at, so the sink can store one sent twice only once. When the sink fails, all
+        of them are kept, and until retry_interval has passed new records are only added to them, unless retry_now
+        is set.
+        """
+        with self._write_lock:
+            if not retry_now and self._retry_at is not None and monotonic() < self._retry_at:
+                self._keep(changes)
+                return False
+            pending = [*self._unwritten, *changes]
+            try:
+                self.sink.add_cell_changes(pending)
+            except Exception as err:
+                self._keep(changes)
+                self._retry_at = monotonic() + self.retry_interval
+                self.log.critical(f"Writing {len(pending)} cell changes failed, {len(self._unwritten)} are kept to be "
+                                  f"written again in {self.retry_interval}s: {str(err)}")
+                return False
+            self._unwritten.clear()
+            self._retry_at = None
+            return True
+
+    def _keep(self, changes: list) -> None:
+        dropped = max(len(self._unwritten) + len(changes) - self._unwritten.maxlen, 0)
+        self._unwritten.extend(changes)
+        if dropped:
+            self.log.error(f"Dropped the {dropped} oldest unwritten cell changes, at most {self._unwritten.maxlen} "
+                           f"are kept.")
+
+    def flush(self) -> bool:
+        """
+        Tries once more to write the records the sink failed to take, e.g. before shutting down.
+        :return: bool, True when none are left.
+        """
+        if self.sink is None or not self._unwritten:
+            return True
+        return self._write([], retry_now=True)
@@ -76,6 +76,25 @@ class ConfigApp:
         cls.start_new_log(cls)
         return super().__new__(cls)
 
+    def retention_seconds(self, level: str):
+        """
+            How long data of a level is kept.
+
+            :param level: str, raw, minute, hour or day.
+            :return: int seconds, or None to keep it forever.
+        """
+        days = getattr(self, f"retention_{level}_days", None)
+        return int(days * 86400) if days else None
+
+    def selected_transports(self) -> list:
+        """
+            The transports results are written to, transports when it is set and transport otherwise.
+
+            :return: list of TransportEnum, without duplicates.
+        """
+        selected = self.transports or [self.transport]
+        return list(dict.fromkeys(selected))
+
     def start_new_log(self) -> None:
         # Logging basic setup.
         self.log_path = path.abspath(self.log_path)
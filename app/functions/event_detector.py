@@ -0,0 +1,280 @@
+from math import exp, sqrt
+from time import time, monotonic
+from threading import Lock
+from collections import deque
+from datetime import datetime, timezone
+from logging import getLogger, Logger
+from app.models.metric_map import metric_extractor
+
+__all__ = ['EventDetector', 'DETECTOR_METRICS', 'EVENT_KINDS']
+
+EVENT_KINDS = ("degradation", "flapping", "outage")
+
+# (metric, direction, min_delta) of the watched metrics. A direction of -1 means a drop is bad, +1 a rise. A change
+# also has to be at least min_delta, in the unit of the metric, so a very steady signal does not alarm on noise.
+# collect_ms is read from the timings of the result, the others from the metric map.
+DETECTOR_METRICS = (
+    ("cell_5g_stats_SNRCurrent", -1, 3.0),
+    ("cell_5g_stats_RSRPCurrent", -1, 4.0),
+    ("cell_5g_stats_RSRQCurrent", -1, 3.0),
+    ("cell_lte_stats_SNRCurrent", -1, 3.0),
+    ("cell_lte_stats_RSRPCurrent", -1, 4.0),
+    ("cell_lte_stats_RSRQCurrent", -1, 3.0),
+    ("cellular_bytes_received_per_s", -1, 125000.0),
+    ("cellular_bytes_sent_per_s", -1, 125000.0),
+    ("collect_ms", 1, 250.0),
+)
+
+
+class _Baseline:
+    """
+    Exponentially weighted mean and variance of one metric, with the degradation event it has open.
+    """
+    __slots__ = ("mean", "variance", "count", "event")
+
+    def __init__(self, value: float):
+        self.mean = value
+        self.variance = 0.0
+        self.count = 1
+        self.event = None
+
+    def update(self, value: float, alpha: float) -> None:
+        diff = value - self.mean
+        increment = alpha * diff
+        self.mean += increment
+        self.variance = (1 - alpha) * (self.variance + diff * increment)
+        self.count += 1
+
+
+class _GatewayState:
+    __slots__ = ("baselines", "up", "failed", "first_failure", "outage", "transitions", "last_seen", "flapping")
+
+    def __init__(self):
+        self.baselines = {}
+        self.up = None
+        self.failed = 0
+        self.first_failure = None
+        self.outage = None
+        self.transitions = 0.0
+        self.last_seen = None
+        self.flapping = None
+
+
+class EventDetector:
+    """
+        EventDetector watches the results of every gateway as they arrive and reports episodes as events, each with
+        a start and, once it is over, an end:
+
+            degradation  a metric of DETECTOR_METRICS moved z_threshold standard deviations the bad way from its
+                         exponentially weighted mean, until it is back within half that.
+            flapping     the gateway check changed state flap_transitions times within about flap_window seconds.
+            outage       outage_after or more samples in a row failed the gateway check.
+
+        Each gateway keeps a fixed amount of state, a mean and a variance per metric and a few counters, so a
+        sample costs the same no matter how long the detector has run. An event is handed to the sink when it
+        starts, with end None, and again when it ends, under the same event_id, so the sink can upsert it. Events
+        the sink fails to take are kept and sent again with a sample at least retry_interval seconds later, so a
+        sink that is down does not hold up every sample, and by flush.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, sink=None, metrics: tuple = DETECTOR_METRICS, z_threshold: float = 4.0, alpha: float = 0.05,
+                 warmup: int = 20, outage_after: int = 2, flap_window: float = 600.0, flap_transitions: int = 4,
+                 max_unwritten: int = 10000, retry_interval: float = 60.0):
+        """
+            :param sink: object, Gets add_events(documents). Events are only logged when there is no sink.
+            :param metrics: tuple, (metric, direction, min_delta) of the watched metrics.
+            :param z_threshold: float, Standard deviations from the mean that count as a degradation.
+            :param alpha: float, Weight of the newest sample in the mean and variance.
+            :param warmup: int, Samples a metric needs before it can degrade.
+            :param outage_after: int, Failed samples in a row that make an outage.
+            :param flap_window: float, Seconds over which state changes are counted, as a decaying count.
+            :param flap_transitions: int, State changes within flap_window that count as flapping.
+            :param max_unwritten: int, Events kept while the sink fails, the oldest are dropped beyond that.
+            :param retry_interval: float, Seconds after a failed write before the sink is tried again.
+        """
+        self.sink = sink
+        self.z_threshold = z_threshold
+        self.alpha = alpha
+        self.warmup = warmup
+        self.outage_after = outage_after
+        self.flap_window = flap_window
+        self.flap_transitions = flap_transitions
+        self.retry_interval = retry_interval
+        self.recent = deque(maxlen=100)
+
+        self._metrics = []
+        for name, direction, min_delta in metrics:
+            position = metric_extractor.names.index(name) if name in metric_extractor.names else None
+            self._metrics.append((name, position, direction, min_delta))
+        self._gateways = {}
+        self._lock = Lock()
+        # Events the sink failed to take, oldest first.
+        self._unwritten = deque(maxlen=max_unwritten)
+        self._retry_at = None
+        self._write_lock = Lock()
+
+    @classmethod
+    def from_config(cls, config, sink=None):
+        return cls(sink=sink, z_threshold=config.event_z_threshold, alpha=config.event_alpha,
+                   warmup=config.event_warmup, outage_after=config.outage_after, flap_window=config.flap_window,
+                   flap_transitions=config.flap_transitions)
+
+    def observe(self, results: dict) -> list:
+        """
+        Folds one result into the state of its gateway.
+
+        :return: list, The event documents that started or ended with this sample.
+        """
+        timestamp = results["timestamp"].timestamp() if results.get("timestamp") else time()
+        gateway_id = results.get("gateway_id") or results.get("container_id")
+        up = results.get("gateway_check") is not False
+
+        with self._lock:
+            state = self._gateways.get(gateway_id)
+            if state is None:
+                state = self._gateways[gateway_id] = _GatewayState()
+            events = self._availability(state, gateway_id, up, timestamp)
+            if up:
+                events += self._degradation(state, gateway_id, results, timestamp)
+
+        for event in events:
+            self.recent.append(event)
+            self.log.warning(f"{event['kind']} of {gateway_id}{' ' + event['metric'] if event['metric'] else ''} "
+                             f"{'ended' if event['end'] else 'started'} at {event['end'] or event['start']}")
+        if self.sink is not None and (events or self._unwritten):
+            self._write(events)
+        return events
+
+    def _write(self, events: list, retry_now: bool = False) -> bool:
+        """
+        Hands events to the sink after the ones it failed to take before. The sink upserts by event_id, so an
+        event sent twice is stored once. When the sink fails, all of them are kept, and until retry_interval has
+        passed new events are only added to them, unless retry_now is set.
+        """
+        with self._write_lock:
+            if not retry_now and self._retry_at is not None and monotonic() < self._retry_at:
+                self._keep(events)
+                return False
+            pending = [*self._unwritten, *events]
+            try:
+                self.sink.add_events(pending)
+            except Exception as err:
+                self._keep(events)
+                self._retry_at = monotonic() + self.retry_interval
+                self.log.critical(f"Writing {len(pending)} events failed, {len(self._unwritten)} are kept to be "
+                                  f"written again in {self.retry_interval}s: {str(err)}")
+                return False
+            self._unwritten.clear()
+            self._retry_at = None
+            return True
+
+    def _keep(self, events: list) -> None:
+        dropped = max(len(self._unwritten) + len(events) - self._unwritten.maxlen, 0)
+        self._unwritten.extend(events)
+        if dropped:
+            self.log.error(f"Dropped the {dropped} oldest unwritten events, at most {self._unwritten.maxlen} are kept.")
+
+    def flush(self) -> bool:
+        """
+        Tries once more to write the events the sink failed to take, e.g. before shutting down.
+        :return: bool, True when none are left.
+        """
+        if self.sink is None or not self._unwritten:
+            return True
+        return self._write([], retry_now=True)
+
+    def _availability(self, state: _GatewayState, gateway_id, up: bool, timestamp: float) -> list:
+        events = []
+
+        # Flapping, state changes are counted with an exponential decay so no history has to be kept.
+        if state.last_seen is not None:
+            state.transitions *= exp(-max(timestamp - state.last_seen, 0.0) / self.flap_window)
+        state.last_seen = timestamp
+        if state.up is not None and up != state.up:
+            state.transitions += 1
+        state.up = up
+        if state.flapping is None and state.transitions >= self.flap_transitions:
+            state.flapping = self._event(gateway_id, "flapping", None, timestamp)
+            events.append(dict(state.flapping))
+        elif state.flapping is not None and state.transitions < self.flap_transitions / 2:
+            events.append(self._end(state.flapping, timestamp, transitions=round(state.transitions, 3)))
+            state.flapping = None
+
+        # Outages.
+        if up:
+            if state.outage is not None:
+                events.append(self._end(state.outage, timestamp, failed_samples=state.failed))
+                state.outage = None
+            state.failed = 0
+            state.first_failure = None
+            return events
+        state.failed += 1
+        if state.first_failure is None:
+            state.first_failure = timestamp
+        if state.outage is None and state.failed >= self.outage_after:
+            state.outage = self._event(gateway_id, "outage", None, state.first_failure)
+            events.append(dict(state.outage))
+        return events
+
+    def _degradation(self, state: _GatewayState, gateway_id, results: dict, timestamp: float) -> list:
+        events = []
+        values = metric_extractor.extract_values(results)
+        timings = results.get("timings") or {}
+        for name, position, direction, min_delta in self._metrics:
+            value = values[position] if position is not None else timings.get(name)
+            if not isinstance(value, (int, float)):
+                continue
+            baseline = state.baselines.get(name)
+            if baseline is None:
+                state.baselines[name] = _Baseline(float(value))
+                continue
+
+            threshold = max(self.z_threshold * sqrt(baseline.variance), min_delta)
+            deviation = direction * (value - baseline.mean)
+            if baseline.event is None:
+                if baseline.count >= self.warmup and deviation >= threshold:
+                    baseline.event = self._event(gateway_id, "degradation", name, timestamp,
+                                                 baseline=round(baseline.mean, 3), value=value,
+                                                 z=round(deviation / sqrt(baseline.variance), 3)
+                                                 if baseline.variance else None)
+                    events.append(dict(baseline.event))
+            elif deviation < threshold / 2:
+                events.append(self._end(baseline.event, timestamp, recovered_value=value))
+                baseline.event = None
+            elif direction * (value - baseline.event["value"]) > 0:
+                # Keep the worst value of the episode.
+                baseline.event["value"] = value
+            baseline.update(float(value), self.alpha)
+        return events
+
+    @staticmethod
+    def _event(gateway_id, kind: str, metric, start: float, **details) -> dict:
+        return {
+            "event_id": f"{gateway_id}/{kind}/{metric or ''}/{int(start * 1000)}",
+            "gateway_id": gateway_id,
+            "kind": kind,
+            "metric": metric,
+            "start": datetime.fromtimestamp(start, tz=timezone.utc),
+            "end": None,
+            "duration_seconds": None,
+            **details
+        }
+
+    @staticmethod
+    def _end(event: dict, end: float, **details) -> dict:
+        ended = dict(event, **details)
+        ended["end"] = datetime.fromtimestamp(end, tz=timezone.utc)
+        ended["duration_seconds"] = round(end - event["start"].timestamp(), 3)
+        return ended
+
+    def open_events(self) -> list:
+        """
+        :return: list, The events that have started and not ended yet.
+        """
+        with self._lock:
+            opened = []
+            for state in self._gateways.values():
+                opened += [event for event in (state.outage, state.flapping) if event is not None]
+                opened += [baseline.event for baseline in state.baselines.values() if baseline.event is not None]
+            return [dict(event) for event in opened]
@@ -0,0 +1,27 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+__all__ = ['loads', 'BACKEND']
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def loads(data):
+    """
+    Parses JSON straight from the bytes of a response, without decoding them to str first. orjson is used when it is
+    installed. Documents it refuses but the json module accepts, NaN or integers above 64 bits, are parsed again with
+    json, so both backends return the same results.
+
+    :param data: bytes or str, The JSON document.
+    :return: The parsed document.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
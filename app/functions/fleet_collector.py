@@ -0,0 +1,170 @@
+import asyncio
+from time import perf_counter
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger, Logger
+from requests.exceptions import Timeout
+from app.functions import ConfigApp
+from app.functions.trashcan_monitor import TrashcanMonitor
+from app.functions.scheduler import GridScheduler, DegradationDetector
+
+__all__ = ['FleetCollector']
+
+
+class FleetCollector:
+    """
+        FleetCollector polls many gateways from one process. Every gateway gets its own TrashcanMonitor and polling
+        task on a single asyncio event loop, while a shared semaphore caps the number of requests in flight.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, targets: list, max_in_flight: int = 32, sleep_time: int = 60, collection_deadline: int = 10,
+                 jitter: float = 0.0, burst: dict = None):
+        """
+            :param targets: list, (GatewayTarget, TrashcanMonitor) pairs to poll.
+            :param max_in_flight: int, The most gateway requests running at the same time across the fleet.
+            :param sleep_time: int, Seconds between samples for targets that do not set their own.
+            :param collection_deadline: int, Overall time limit for one sample for targets that do not set their own.
+            :param jitter: float, The most seconds each sample is pushed back at random.
+            :param burst: dict, Turns on adaptive sampling, {"drop_db", "burst_interval", "burst_hold"}.
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1.")
+
+        self.targets = targets
+        self.max_in_flight = max_in_flight
+        self.sleep_time = sleep_time
+        self.collection_deadline = collection_deadline
+        self.jitter = jitter
+        self.burst = burst
+        self.schedulers = {}
+        self.on_result = None
+        self._semaphore = None
+        self._executor = None
+        self._submitter = None
+        self._stopping = None
+        self._loop = None
+
+    @classmethod
+    def from_config(cls, config: ConfigApp):
+        if not config.gateways:
+            raise ValueError("Fleet mode needs at least one entry in gateways.")
+
+        gateway_ids = [target.gateway_id for target in config.gateways]
+        if len(set(gateway_ids)) != len(gateway_ids):
+            raise ValueError("Each gateway in gateways needs a unique gateway_id.")
+
+        targets = [(target, TrashcanMonitor.from_target(config, target)) for target in config.gateways]
+        burst = None
+        if config.adaptive_sampling:
+            burst = {"drop_db": config.burst_drop_db, "burst_interval": config.burst_interval,
+                     "burst_hold": config.burst_hold}
+        return cls(targets, max_in_flight=config.fleet_max_in_flight, sleep_time=config.sleep_time,
+                   collection_deadline=config.collection_deadline, jitter=config.fleet_jitter, burst=burst)
+
+    def run(self, on_result) -> None:
+        """
+        Polls every gateway until stop is called. Blocks the calling thread.
+
+        :param on_result: callable, Called with each tagged result dict, one at a time on a thread of its own, so a
+            handler that blocks, e.g. on a full pipeline queue, does not stall the event loop.
+        """
+        asyncio.run(self.run_async(on_result))
+
+    async def run_async(self, on_result) -> None:
+        self.on_result = on_result
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._stopping = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="tcm-fleet")
+        # A single thread hands results on in the order they were collected.
+        self._submitter = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tcm-fleet-submit")
+        self.log.info(f"Fleet mode polling {len(self.targets)} gateways, {self.max_in_flight} requests in flight.")
+
+        try:
+            await asyncio.gather(*(self._poll(target, monitor, index) for index, (target, monitor)
+                                   in enumerate(self.targets)))
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._submitter.shutdown(wait=True)
+
+    def stop(self) -> None:
+        """
+        Stops polling, safe to call from any thread, including from on_result.
+        """
+        if self._stopping is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    async def _poll(self, target, monitor: TrashcanMonitor, index: int) -> None:
+        loop = asyncio.get_running_loop()
+        detector = None
+        burst = dict(self.burst or {})
+        if self.burst:
+            detector = DegradationDetector(drop_db=burst.pop("drop_db", 3.0))
+
+        # Spread the first samples over one interval, so hundreds of targets do not all fire on the same tick.
+        interval = target.sleep_time or self.sleep_time
+        scheduler = GridScheduler(interval, jitter=self.jitter, offset=interval * index / len(self.targets),
+                                  detector=detector, clock=loop.time, **burst)
+        self.schedulers[target.gateway_id] = scheduler
+
+        while not self._stopping.is_set():
+            if await self._wait_until(scheduler.next_run):
+                return
+
+            results = await self.sample(target, monitor)
+            scheduler.observe(results)
+            try:
+                await loop.run_in_executor(self._submitter, self.on_result, results)
+            except Exception as err:
+                self.log.critical(f"Result handler failed for {target.gateway_id}: {str(err)}")
+
+            # Skip ticks that were missed while sampling, instead of firing them back to back.
+            scheduler.advance()
+
+    async def _wait_until(self, deadline: float) -> bool:
+        delay = deadline - asyncio.get_running_loop().time()
+        if delay <= 0:
+            return self._stopping.is_set()
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def sample(self, target, monitor: TrashcanMonitor) -> dict:
+        """
+        Collects one sample from a gateway, every endpoint at once, under the target's collection deadline.
+        :return: dict, The same layout as TrashcanMonitor.start_concurrent_test, tagged with "gateway_id".
+        """
+        deadline = target.collection_deadline or self.collection_deadline
+        started = perf_counter()
+        results = {
+            "timestamp": datetime.now(timezone.utc),
+            "gateway_id": target.gateway_id,
+            "gateway_check": False
+        }
+
+        due = monitor.plan_collection(results)
+        if not due:
+            results["timings"]["collect_ms"] = (perf_counter() - started) * 1000
+            return results
+
+        tasks = {asyncio.ensure_future(self._fetch(fetch)): key for key, fetch in due.items()}
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+
+        for task in done:
+            err = task.exception()
+            monitor.record_endpoint(results, tasks[task], None if err else task.result(), err)
+
+        for task in pending:
+            task.cancel()
+            monitor.record_endpoint(results, tasks[task],
+                                    err=Timeout(f"No response within the {deadline}s collection deadline."))
+
+        results["timings"]["collect_ms"] = (perf_counter() - started) * 1000
+        return results
+
+    async def _fetch(self, fetch):
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fetch)
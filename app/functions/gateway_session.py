@@ -0,0 +1,155 @@
+from time import monotonic, perf_counter
+from threading import Lock, local
+from logging import getLogger, Logger
+from requests import Session, Response
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+
+__all__ = ['GatewaySession']
+
+
+class CountingAdapter(HTTPAdapter):
+    """
+        HTTPAdapter whose connections report every new TCP connect, and how long it took in milliseconds, to
+        on_connect. urllib3 reconnects a dropped connection object in place, so its own pool counters miss those
+        handshakes.
+    """
+
+    def __init__(self, on_connect, **kwargs):
+        self.on_connect = on_connect
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        on_connect = self.on_connect
+
+        class CountingHTTPConnection(HTTPConnection):
+            def connect(self):
+                started = perf_counter()
+                super().connect()
+                on_connect((perf_counter() - started) * 1000)
+
+        class CountingHTTPSConnection(HTTPSConnection):
+            def connect(self):
+                started = perf_counter()
+                super().connect()
+                on_connect((perf_counter() - started) * 1000)
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            ConnectionCls = CountingHTTPConnection
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            ConnectionCls = CountingHTTPSConnection
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool
+        }
+
+
+class StaleConnectionRetry(Retry):
+    """
+        Retry that never repeats a request after a read timeout. A pooled connection the gateway has hung up on fails
+        with a ProtocolError as soon as it is used, that is counted as an other error and retried, while a gateway
+        that is merely slow would otherwise be given the whole request_timeout a second time.
+    """
+
+    def _is_read_error(self, err: Exception) -> bool:
+        return isinstance(err, ReadTimeoutError)
+
+
+class GatewaySession:
+    """
+        GatewaySession is a pooled keep-alive HTTP session used to talk to a single gateway. Connections are reused
+        between samples, so each sample no longer pays a TCP handshake per endpoint.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, keep_alive: bool = True, pool_maxsize: int = 4, max_retries: int = 1,
+                 idle_timeout: float = 30):
+        """
+            :param keep_alive: bool, Reuse connections between requests. When False every request asks the gateway
+                to close the connection, which matches the old behaviour.
+            :param pool_maxsize: int, The most connections kept open to one host.
+            :param max_retries: int, How many times a request is retried on a fresh connection when connecting
+                fails or a pooled connection turns out to be stale. Read timeouts are never retried.
+            :param idle_timeout: float, Seconds a pooled connection may sit unused before it is dropped and
+                reconnected, instead of being handed to a request the gateway has already hung up on.
+        """
+        self.keep_alive = keep_alive
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.idle_timeout = idle_timeout
+
+        self.requests = 0
+        self.connections = 0
+        self.stale_resets = 0
+        self._last_used = None
+        self._lock = Lock()
+        # Connect time of the request running on each thread.
+        self._local = local()
+
+        self.session = Session()
+        self.adapter = CountingAdapter(
+            self._count_connection,
+            pool_connections=1,
+            pool_maxsize=pool_maxsize,
+            max_retries=StaleConnectionRetry(total=max_retries, connect=max_retries, read=False, other=max_retries,
+                                             status=0, redirect=0, backoff_factor=0, raise_on_status=False)
+        )
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    def get(self, url: str, timings: dict = None, **kwargs) -> Response:
+        """
+        Sends a GET through the pool, first dropping connections that have been idle for longer than idle_timeout.
+
+        :param timings: dict, Gets connect_ms, 0 on a reused connection, ttfb_ms, the time until the response
+            headers arrived, and total_ms, including the body.
+        """
+        with self._lock:
+            now = monotonic()
+            if self.keep_alive and self._last_used is not None and now - self._last_used > self.idle_timeout:
+                self._reset_pool()
+            self._last_used = now
+            self.requests += 1
+
+        self._local.connect_ms = 0.0
+        started = perf_counter()
+        response = self.session.get(url, **kwargs)
+        if timings is not None:
+            timings["connect_ms"] = self._local.connect_ms
+            timings["ttfb_ms"] = response.elapsed.total_seconds() * 1000
+            timings["total_ms"] = (perf_counter() - started) * 1000
+        return response
+
+    def _count_connection(self, milliseconds: float = 0.0) -> None:
+        self._local.connect_ms = getattr(self._local, "connect_ms", 0.0) + milliseconds
+        with self._lock:
+            self.connections += 1
+
+    def _reset_pool(self) -> None:
+        self.adapter.poolmanager.clear()
+        self.stale_resets += 1
+        self.log.debug("Dropped idle gateway connections.")
+
+    def stats(self) -> dict:
+        """
+        Connection reuse counters.
+        :return: dict: requests sent, connections opened, requests that reused an open connection, and how many times
+            the pool was dropped for being idle.
+        """
+        return {
+            "requests": self.requests,
+            "connections": self.connections,
+            "reused": max(self.requests - self.connections, 0),
+            "stale_resets": self.stale_resets
+        }
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,230 @@
+import sys
+import cProfile
+import pstats
+from os import path, makedirs, remove
+from time import perf_counter
+from datetime import datetime
+from threading import Lock
+from contextlib import contextmanager
+from logging import getLogger, Logger
+
+__all__ = ['LatencyHistogram', 'LatencyRecorder', 'SlowCycleProfiler', 'latency_recorder']
+
+# From Python 3.12 cProfile is built on sys.monitoring, so one profiler sees every thread and a second one cannot be
+# enabled while it runs.
+PROFILER_SEES_ALL_THREADS = sys.version_info >= (3, 12)
+
+
+class LatencyHistogram:
+    """
+        A fixed memory latency histogram in the style of HdrHistogram. Values in milliseconds are stored in
+        microseconds, in buckets that double in width every sub_buckets values, so every recorded value is kept to
+        within 1 / sub_buckets of itself, from a microsecond up to hours.
+    """
+
+    def __init__(self, sub_buckets: int = 128):
+        """
+            :param sub_buckets: int, Linear buckets per power of two, a power of two. 128 keeps values to within 1%.
+        """
+        self.sub_buckets = sub_buckets
+        self._sub_bits = sub_buckets.bit_length() - 1
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def _index(self, micros: int) -> int:
+        if micros < self.sub_buckets:
+            return micros
+        shift = micros.bit_length() - self._sub_bits - 1
+        return (shift + 1) * self.sub_buckets + (micros >> shift) - self.sub_buckets
+
+    def _value(self, index: int) -> float:
+        """
+        :return: float, The middle of a bucket in microseconds.
+        """
+        if index < self.sub_buckets:
+            return float(index)
+        shift = index // self.sub_buckets - 1
+        low = (index % self.sub_buckets + self.sub_buckets) << shift
+        return low + ((1 << shift) - 1) / 2
+
+    def record(self, milliseconds: float) -> None:
+        if milliseconds < 0:
+            return
+        index = self._index(int(milliseconds * 1000))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += milliseconds
+        if milliseconds > self.maximum:
+            self.maximum = milliseconds
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+
+    def percentile(self, p: float):
+        """
+        :param p: float, Between 0 and 100.
+        :return: float, The p percentile in milliseconds, or None when nothing was recorded.
+        """
+        if not self.count:
+            return None
+        rank = max(1, round(p / 100 * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._value(index) / 1000, self.maximum)
+        return self.maximum
+
+    def snapshot(self, percentiles: tuple = (50, 90, 99, 99.9)) -> dict:
+        snapshot = {"count": self.count, "mean": self.total / self.count if self.count else None,
+                    "max": self.maximum}
+        for p in percentiles:
+            snapshot[f"p{p:g}"] = self.percentile(p)
+        return snapshot
+
+
+class LatencyRecorder:
+    """
+        LatencyRecorder keeps one LatencyHistogram per stage name, e.g. "radio_raw_data.ttfb_ms" or "add_data.csv".
+        It is shared by every thread of the process.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self._lock = Lock()
+
+    def record(self, stage: str, milliseconds: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram()
+            histogram.record(milliseconds)
+
+    def record_timings(self, timings: dict, prefix: str = "") -> None:
+        """
+        Records every value of a results "timings" dict, nested dicts are joined with dots.
+        """
+        for key, value in timings.items():
+            if isinstance(value, dict):
+                self.record_timings(value, f"{prefix}{key}.")
+            elif isinstance(value, (int, float)):
+                self.record(f"{prefix}{key}", value)
+
+    @contextmanager
+    def time(self, stage: str):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (perf_counter() - started) * 1000)
+
+    def snapshot(self) -> dict:
+        """
+        :return: dict, {stage: LatencyHistogram.snapshot()}
+        """
+        with self._lock:
+            return {stage: histogram.snapshot() for stage, histogram in sorted(self.histograms.items())}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms = {}
+
+
+class SlowCycleProfiler:
+    """
+        SlowCycleProfiler runs every sampling cycle under cProfile and keeps the profiles of the slowest keep cycles
+        as .prof files, which load in pstats or snakeviz. A cycle that is faster than all kept ones costs the
+        profiler overhead and nothing else. The thread running the cycle is profiled, and so is every call wrapped
+        with task, e.g. the requests of a concurrent collection, their calls are merged into the cycle's profile.
+        From Python 3.12 the cycle's profiler sees every thread by itself and task leaves the call as it is. The
+        pipeline stages store a sample after its cycle ended and are not part of it.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, profile_path: str, keep: int = 5):
+        """
+            :param profile_path: str, The directory profiles are written to.
+            :param keep: int, How many of the slowest cycles are kept.
+        """
+        self.profile_path = profile_path
+        self.keep = keep
+        # (duration in ms, file) of the kept profiles, fastest first.
+        self.kept = []
+        # Profiles of the tasks run on worker threads during the open cycle, None between cycles.
+        self._tasks = None
+        self._lock = Lock()
+        makedirs(profile_path, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        if not config.profile_slowest:
+            return None
+        return cls(config.profile_path or path.join(config.log_path, "profiles"), keep=config.profile_slowest)
+
+    @contextmanager
+    def cycle(self):
+        profiler = cProfile.Profile()
+        with self._lock:
+            self._tasks = []
+        started = perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._lock:
+                tasks, self._tasks = self._tasks, None
+            self._consider((perf_counter() - started) * 1000, profiler, tasks)
+
+    def task(self, function):
+        """
+        Wraps function, which is run on another thread during the open cycle, so its calls are profiled there and
+        added to the cycle's profile. A task still running when its cycle ends is left out.
+        """
+        if PROFILER_SEES_ALL_THREADS:
+            return function
+        tasks = self._tasks
+
+        def profiled(*args, **kwargs):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as err:
+                # Another profiling tool is active, the call is left unprofiled rather than failing.
+                self.log.debug(f"Running a task unprofiled: {str(err)}")
+                return function(*args, **kwargs)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.disable()
+                with self._lock:
+                    if tasks is not None and tasks is self._tasks:
+                        tasks.append(profiler)
+        return profiled
+
+    def _consider(self, milliseconds: float, profiler: cProfile.Profile, tasks: list = ()) -> None:
+        if len(self.kept) >= self.keep and milliseconds <= self.kept[0][0]:
+            return
+        # Microseconds keep the names of cycles that end within the same second apart.
+        profile_file = path.join(self.profile_path,
+                                 f"cycle-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{milliseconds:.0f}ms.prof")
+        stats = pstats.Stats(profiler)
+        for task in tasks:
+            stats.add(task)
+        stats.dump_stats(profile_file)
+        self.kept.append((milliseconds, profile_file))
+        self.kept.sort()
+        if len(self.kept) > self.keep:
+            _, dropped = self.kept.pop(0)
+            if dropped != profile_file and path.exists(dropped):
+                remove(dropped)
+        self.log.debug(f"Kept the profile of a {milliseconds:.0f}ms cycle in {profile_file}.")
+
+
+latency_recorder = LatencyRecorder()
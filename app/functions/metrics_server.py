@@ -0,0 +1,260 @@
+import json
+from time import time
+from threading import Thread, Lock
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from logging import getLogger, Logger
+from app.models.metric_map import metric_extractor, COUNTER_METRICS
+from app.functions.latency import latency_recorder
+
+__all__ = ['MetricsServer', 'MetricsSnapshot']
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency stages exposed as collector health, matched by prefix against the LatencyRecorder stage names.
+HEALTH_LATENCIES = ("collect_ms", "add_data.", "schema_ms")
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsSnapshot:
+    """
+        MetricsSnapshot holds the latest flat record of every gateway and the collector health counters. Observing a
+        sample only stores its record. The Prometheus and JSON bodies are built from the stored records at most once
+        per sample, on the first request after it, and the same bytes are served to every request until the next
+        sample arrives. Many scrapers therefore cost the sampling loop nothing.
+
+        When buffers are given, rolling statistics over the recent samples of a gateway are computed on request.
+    """
+
+    def __init__(self, stats=None, prefix: str = "trashcan", buffers: dict = None):
+        """
+            :param stats: callable, Returns the pipeline stats, {stage: {depth, dropped, ...}}, for the health section.
+            :param prefix: str, Prefix of every Prometheus metric name.
+            :param buffers: dict, {gateway_id: SampleBuffer} The recent samples rolling serves statistics of.
+        """
+        self.stats = stats
+        self.prefix = prefix
+        self.buffers = buffers if buffers is not None else {}
+        self.samples = 0
+        self.failures = 0
+        self.started = time()
+        # {gateway_id: {"timestamp": epoch seconds, "gateway_check": bool, "endpoint_errors": int, "metrics": {}}}
+        self._gateways = {}
+        self._version = 0
+        self._built = None
+        self._lock = Lock()
+        self._build_lock = Lock()
+
+    def observe(self, results: dict) -> None:
+        """
+        Stores the flat record of one result, called once per sample.
+        """
+        timestamp = results.get("timestamp")
+        entry = {
+            "timestamp": timestamp.timestamp() if hasattr(timestamp, "timestamp") else time(),
+            "gateway_check": bool(results.get("gateway_check")),
+            "endpoint_errors": len(results.get("endpoint_errors") or {}),
+            "metrics": metric_extractor.extract(results)
+        }
+        with self._lock:
+            # Single gateway deployments are told apart by container_id, as in the stored documents.
+            self._gateways[results.get("gateway_id") or results.get("container_id")] = entry
+            self.samples += 1
+            if not entry["gateway_check"]:
+                self.failures += 1
+            self._version += 1
+
+    def observe_failure(self) -> None:
+        """
+        Counts a collection that raised before it produced a result.
+        """
+        with self._lock:
+            self.failures += 1
+            self._version += 1
+
+    def rolling(self, gateway_id, seconds: float, metrics: list = None) -> dict:
+        """
+        Rolling statistics of the recent samples of one gateway, see SampleBuffer.stats.
+
+        :param metrics: list, Metric names, every metric of the buffer by default.
+        :return: dict, {metric: {count, min, max, mean, p50, p95, p99}}
+        :exception: KeyError: When the gateway has no buffer or a metric is not kept.
+        """
+        buffer = self.buffers[gateway_id]
+        unknown = set(metrics or ()) - set(buffer.metrics)
+        if unknown:
+            raise KeyError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+        return {name: buffer.stats(name, seconds) for name in metrics or buffer.metrics}
+
+    def bodies(self) -> tuple:
+        """
+        :return: tuple, (Prometheus text, JSON) bodies as bytes, rebuilt only when a sample arrived since the last call.
+        """
+        built = self._built
+        if built is not None and built[0] == self._version:
+            return built[1], built[2]
+        with self._build_lock:
+            with self._lock:
+                version = self._version
+                gateways = dict(self._gateways)
+                counters = {"samples": self.samples, "failures": self.failures}
+            if self._built is None or self._built[0] != version:
+                document = self._document(gateways, counters)
+                self._built = (version, self._prometheus(document).encode(), json.dumps(document).encode())
+            return self._built[1], self._built[2]
+
+    def _document(self, gateways: dict, counters: dict) -> dict:
+        latencies = {stage: snapshot for stage, snapshot in latency_recorder.snapshot().items()
+                     if stage.startswith(HEALTH_LATENCIES)}
+        health = dict(counters, uptime_seconds=round(time() - self.started, 3), latency_ms=latencies,
+                      pipeline=self.stats() if self.stats else {})
+        return {"gateways": {str(gateway_id): entry for gateway_id, entry in gateways.items()}, "health": health}
+
+    def _prometheus(self, document: dict) -> str:
+        prefix = self.prefix
+        lines = []
+        gateways = sorted(document["gateways"].items())
+
+        def family(name: str, metric_type: str, samples: list) -> None:
+            if not samples:
+                return
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            lines.extend(f"{prefix}_{name}{labels} {value}" for labels, value in samples)
+
+        family("last_sample_timestamp_seconds", "gauge",
+               [(f'{{gateway_id="{_label(g)}"}}', entry["timestamp"]) for g, entry in gateways])
+        family("gateway_up", "gauge",
+               [(f'{{gateway_id="{_label(g)}"}}', int(entry["gateway_check"])) for g, entry in gateways])
+        family("endpoint_errors", "gauge",
+               [(f'{{gateway_id="{_label(g)}"}}', entry["endpoint_errors"]) for g, entry in gateways])
+
+        for name in metric_extractor.names:
+            numbers = []
+            texts = []
+            for gateway_id, entry in gateways:
+                value = entry["metrics"].get(name)
+                if value is None:
+                    continue
+                if isinstance(value, str):
+                    texts.append((f'{{gateway_id="{_label(gateway_id)}",value="{_label(value)}"}}', 1))
+                else:
+                    numbers.append((f'{{gateway_id="{_label(gateway_id)}"}}', value))
+            family(name, "counter" if name in COUNTER_METRICS else "gauge", numbers)
+            family(f"{name}_info", "gauge", texts)
+
+        health = document["health"]
+        family("collector_samples_total", "counter", [("", health["samples"])])
+        family("collector_failures_total", "counter", [("", health["failures"])])
+        family("collector_uptime_seconds", "gauge", [("", health["uptime_seconds"])])
+        quantiles = []
+        for stage, snapshot in health["latency_ms"].items():
+            for key, value in snapshot.items():
+                # p50, p99.9 and so on become quantile 0.5, 0.999.
+                if key.startswith("p") and value is not None:
+                    quantile = float(key[1:]) / 100
+                    quantiles.append((f'{{stage="{_label(stage)}",quantile="{quantile:g}"}}', round(value, 3)))
+        family("latency_ms", "gauge", quantiles)
+        family("pipeline_queue_depth", "gauge",
+               [(f'{{stage="{_label(stage)}"}}', stats["depth"]) for stage, stats in health["pipeline"].items()
+                if "depth" in stats])
+        family("pipeline_dropped_total", "counter",
+               [(f'{{stage="{_label(stage)}"}}', stats["dropped"]) for stage, stats in health["pipeline"].items()
+                if "dropped" in stats])
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+        A small HTTP server on its own thread serving a MetricsSnapshot, /metrics in the Prometheus text format and
+        /metrics.json as JSON. /rolling?gateway_id=<id>&seconds=<window>&metric=<name> returns rolling statistics
+        of the recent samples of a gateway, metric may be repeated and defaults to every buffered metric.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, snapshot: MetricsSnapshot, host: str = "0.0.0.0", port: int = 9464):
+        """
+            :param port: int, 0 picks a free port.
+        """
+        self.snapshot = snapshot
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, config, stats=None, buffers: dict = None):
+        """
+        :return: MetricsServer, started, or None when metrics_port is 0.
+        """
+        if not config.metrics_port:
+            return None
+        return cls(MetricsSnapshot(stats=stats, buffers=buffers), host=config.metrics_host,
+                   port=config.metrics_port).start()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "MetricsServer":
+        self._thread = Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        self.log.info(f"Serving metrics on {self.url}metrics")
+        return self
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    def _handler(self):
+        snapshot = self.snapshot
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path == "/rolling":
+                    self.rolling(parse_qs(url.query))
+                    return
+                if url.path not in ("/metrics", "/metrics.json"):
+                    self.send_error(404)
+                    return
+                text, document = snapshot.bodies()
+                if url.path == "/metrics":
+                    self.send_body(text, PROMETHEUS_CONTENT_TYPE)
+                else:
+                    self.send_body(document, "application/json")
+
+            def rolling(self, query: dict):
+                # A single gateway deployment may leave gateway_id out.
+                gateway_id = (query.get("gateway_id") or list(snapshot.buffers)[:1] or [None])[0]
+                try:
+                    seconds = float(query.get("seconds", ["3600"])[0])
+                except ValueError:
+                    self.send_error(400, "seconds must be a number")
+                    return
+                try:
+                    stats = snapshot.rolling(gateway_id, seconds, query.get("metric"))
+                except KeyError as err:
+                    self.send_error(404, str(err))
+                    return
+                self.send_body(json.dumps({"gateway_id": gateway_id, "seconds": seconds, "stats": stats}).encode(),
+                               "application/json")
+
+            def send_body(self, body: bytes, content_type: str):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
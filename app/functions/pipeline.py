@@ -0,0 +1,273 @@
+from os import path
+from time import monotonic, sleep
+from threading import Thread, Condition
+from collections import deque
+from logging import getLogger, Logger
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.transport.spool import Spool
+
+__all__ = ['Pipeline', 'Stage', 'StageQueue', 'BACKPRESSURE_POLICIES']
+
+BACKPRESSURE_POLICIES = ("block", "drop_oldest", "spill")
+
+
+class StageQueue:
+    """
+        StageQueue is the bounded queue in front of a pipeline stage. What happens when it is full depends on the
+        policy: "block" makes the producer wait for room, "drop_oldest" discards the oldest waiting item, and "spill"
+        writes the new item to a Spool on disk. Once an item is spilled, later items follow it to the spool until it
+        is empty again, so items are taken in the order they were put. Spilled items are read back, oldest first,
+        once the in memory items have been taken, and acknowledged once get has handed on all of a batch read.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, maxsize: int = 1000, policy: str = "block", spool: "Spool" = None):
+        """
+            :param maxsize: int, The most items held in memory.
+            :param policy: str, One of BACKPRESSURE_POLICIES.
+            :param spool: Spool, Where items go when the queue is full, required by the spill policy.
+        """
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        if policy == "spill" and spool is None:
+            raise ValueError("The spill policy needs a spool.")
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.spool = spool
+        self.dropped = 0
+        self.spilled = 0
+        self.blocked_seconds = 0.0
+
+        self._items = deque()
+        # (sequence, item) pairs read back from the spool, acknowledged once get has handed on the last of them.
+        self._unspilled = deque()
+        self._closed = False
+        self._condition = Condition()
+
+    def put(self, item) -> None:
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("StageQueue is closed.")
+            if self.policy == "spill" and (len(self._items) >= self.maxsize or self.spool.pending()):
+                self.spool.append(item)
+                self.spilled += 1
+                self._condition.notify()
+                return
+            if len(self._items) >= self.maxsize:
+                if self.policy == "drop_oldest":
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    started = monotonic()
+                    while len(self._items) >= self.maxsize and not self._closed:
+                        self._condition.wait()
+                    self.blocked_seconds += monotonic() - started
+            self._items.append(item)
+            self._condition.notify_all()
+
+    def get(self, timeout: float = None):
+        """
+        :return: The next item, or None when the queue is closed and empty, or nothing arrived within timeout.
+        """
+        acknowledge = None
+        with self._condition:
+            deadline = None if timeout is None else monotonic() + timeout
+            while not self._items:
+                if self.spool is not None and self.spool.pending() and self._unspill():
+                    sequence, item = self._unspilled.popleft()
+                    if not self._unspilled:
+                        acknowledge = sequence
+                    break
+                if self._closed:
+                    return None
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            else:
+                item = self._items.popleft()
+            self._condition.notify_all()
+
+        if acknowledge is not None:
+            # Outside the lock, the ack writes and syncs a file. Only the one consumer reads the spool back, and it
+            # does not read again before this returns.
+            try:
+                self.spool.ack(acknowledge)
+            except OSError as err:
+                # The batch stays in the spool and is read again, which sends it twice rather than losing it.
+                self.log.error(f"Acknowledging spilled items up to {acknowledge} failed: {str(err)}")
+        return item
+
+    def _unspill(self) -> bool:
+        """
+        Reads the next spilled items back, unless some are still waiting. Records stay in the spool until the whole
+        batch has been handed on, so a crash before then reads them again instead of losing them.
+        """
+        if not self._unspilled:
+            self._unspilled.extend(self.spool.read(self.maxsize))
+        return bool(self._unspilled)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def depth(self) -> int:
+        return len(self._items) + (self.spool.pending() if self.spool is not None else 0)
+
+    def close(self) -> None:
+        """
+        Stops accepting items. Items already queued can still be taken.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth(),
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "blocked_seconds": round(self.blocked_seconds, 3)
+        }
+
+
+class Stage:
+    """
+        A pipeline stage is one worker thread taking items from its StageQueue and passing each to handler. What the
+        handler returns, unless None, is put on every output queue. A handler that raises only loses that item, as
+        does an output queue that cannot take it, e.g. a full spool. The thread keeps running either way.
+    """
+    log: Logger = getLogger(__name__)
+    # Seconds to wait after the queue failed to give an item, e.g. a spool that cannot be read.
+    retry_interval: float = 1.0
+
+    def __init__(self, name: str, handler, queue: StageQueue, outputs: list = None):
+        self.name = name
+        self.handler = handler
+        self.queue = queue
+        self.outputs = list(outputs or [])
+        self.processed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self._started = None
+        self._thread = Thread(target=self._run, name=f"tcm-{name}", daemon=True)
+
+    def start(self) -> None:
+        self._started = monotonic()
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self.queue.get()
+            except Exception as err:
+                self.errors += 1
+                self.log.critical(f"Pipeline stage {self.name} could not take an item: {str(err)}")
+                if self.queue.closed:
+                    return
+                sleep(self.retry_interval)
+                continue
+            if item is None:
+                return
+            started = monotonic()
+            try:
+                result = self.handler(item)
+            except Exception as err:
+                self.errors += 1
+                self.log.critical(f"Pipeline stage {self.name} failed: {str(err)}")
+                result = None
+            self.busy_seconds += monotonic() - started
+            self.processed += 1
+
+            if result is not None:
+                for index, output in enumerate(self.outputs):
+                    # Every writer after the first gets its own copy, transports may change what they are given.
+                    try:
+                        output.put(result if index == 0 else dict(result))
+                    except Exception as err:
+                        output.dropped += 1
+                        self.log.critical(f"Pipeline stage {self.name} could not pass an item on: {str(err)}")
+
+    def join(self, timeout: float = None) -> None:
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        elapsed = monotonic() - self._started if self._started else 0
+        stats = self.queue.stats()
+        stats.update({
+            "processed": self.processed,
+            "errors": self.errors,
+            "per_second": round(self.processed / elapsed, 3) if elapsed else 0.0,
+            "utilization": round(self.busy_seconds / elapsed, 3) if elapsed else 0.0
+        })
+        return stats
+
+
+class Pipeline:
+    """
+        Pipeline decouples sampling from storage. The collector, the polling loop or FleetCollector, only submits
+        results. A processing stage validates and enriches them, and every transport has its own writer stage, so
+        a slow database delays neither the next sample nor the other transports. Stages are joined by bounded
+        StageQueues with the configured backpressure policy.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, process, writers: dict, queue_size: int = 1000, policy: str = "block", spool_path: str = None):
+        """
+            :param process: callable, Takes a result and returns it ready for storage, or None to discard it.
+            :param writers: dict, {name: callable} Each callable stores one processed result.
+            :param queue_size: int, Capacity of every stage queue.
+            :param policy: str, Backpressure policy of the writer queues, one of BACKPRESSURE_POLICIES. The
+                processing queue always blocks, its stage is fast and spilling there would only move the problem.
+            :param spool_path: str, Directory for spilled results, one sub directory per writer.
+        """
+        self.submitted = 0
+        self.writers = {}
+        for name, handler in writers.items():
+            spool = None
+            if policy == "spill":
+                # Imported here, the spool pulls in bson, which only the spill policy needs.
+                from app.transport.spool import Spool
+                spool = Spool(path.join(spool_path, name), fsync_policy="never")
+            self.writers[name] = Stage(f"writer-{name}", handler, StageQueue(queue_size, policy, spool))
+
+        self.processing = Stage("process", process, StageQueue(queue_size, "block"),
+                                outputs=[stage.queue for stage in self.writers.values()])
+        self.processing.start()
+        for stage in self.writers.values():
+            stage.start()
+
+    @classmethod
+    def from_config(cls, config, process, writers: dict):
+        return cls(process, writers, queue_size=config.pipeline_queue_size, policy=config.pipeline_backpressure,
+                   spool_path=path.join(config.log_path, "pipeline"))
+
+    def submit(self, results: dict) -> None:
+        """
+        Hands a result from the collector to the pipeline.
+        """
+        self.submitted += 1
+        self.processing.queue.put(results)
+
+    def stats(self) -> dict:
+        stats = {"collector": {"submitted": self.submitted}, "process": self.processing.stats()}
+        for name, stage in self.writers.items():
+            stats[f"writer-{name}"] = stage.stats()
+        return stats
+
+    def close(self, timeout: float = 30) -> None:
+        """
+        Lets every stage finish what is queued, up to timeout seconds per stage, then stops them.
+        """
+        self.processing.queue.close()
+        self.processing.join(timeout)
+        for stage in self.writers.values():
+            stage.queue.close()
+            stage.join(timeout)
+            if stage.queue.spool is not None:
+                stage.queue.spool.close()
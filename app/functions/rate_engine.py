@@ -0,0 +1,84 @@
+from time import time
+from logging import getLogger, Logger
+from app.models.metric_map import metric_extractor, COUNTER_METRICS
+
+__all__ = ['RateEngine']
+
+# Counter widths a gateway may wrap at, checked smallest first.
+WRAP_LIMITS = (2 ** 32, 2 ** 64)
+
+
+class RateEngine:
+    """
+        RateEngine turns the cumulative counters of consecutive samples into per-second rates. It keeps the previous
+        counters per gateway, so it costs one dict lookup and a handful of subtractions per sample.
+
+        A counter that goes down either wrapped, when the previous value was in the top quarter of a 32 or 64 bit
+        range, or was reset by a gateway reboot. A wrap is corrected, a reset gives no rate for that sample and the
+        new value becomes the baseline.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, counters: list = None):
+        """
+            :param counters: list, Metric map names of the cumulative counters. Defaults to COUNTER_METRICS.
+        """
+        self.counters = list(counters if counters is not None else COUNTER_METRICS)
+        self.rate_names = [f"{name}_per_s" for name in self.counters]
+        self._positions = [metric_extractor.names.index(name) for name in self.counters]
+        self._previous = {}
+
+    def process(self, data: dict) -> dict:
+        """
+        Adds a "rates" dict to a result from TrashcanMonitor.start_test and returns it. Rates are None for the first
+        sample of a gateway, for counters that are missing, and for counters that were reset.
+        """
+        timestamp = data["timestamp"].timestamp() if data.get("timestamp") else time()
+        values = metric_extractor.extract_values(data)
+        current = [values[position] for position in self._positions]
+        gateway_id = data.get("gateway_id")
+
+        previous = self._previous.get(gateway_id)
+        self._previous[gateway_id] = (timestamp, current)
+
+        rates = dict.fromkeys(self.rate_names)
+        if previous is None or timestamp <= previous[0]:
+            data["rates"] = rates
+            return data
+
+        elapsed = timestamp - previous[0]
+        resets = []
+        for name, rate_name, now, before in zip(self.counters, self.rate_names, current, previous[1]):
+            if now is None or before is None:
+                continue
+            delta = self.delta(now, before)
+            if delta is None:
+                resets.append(name)
+                continue
+            rates[rate_name] = delta / elapsed
+
+        if resets:
+            self.log.info(f"Counters reset on {gateway_id or 'gateway'}: {', '.join(resets)}")
+            rates["counter_resets"] = resets
+        data["rates"] = rates
+        return data
+
+    @staticmethod
+    def delta(now: int, before: int):
+        """
+        :return: The increase from before to now, corrected for a wrap, or None when the counter was reset.
+        """
+        if now >= before:
+            return now - before
+        for limit in WRAP_LIMITS:
+            if before < limit:
+                if before >= limit * 3 // 4:
+                    return now + limit - before
+                return None
+        return None
+
+    def forget(self, gateway_id: str = None) -> None:
+        """
+        Drops the previous counters of a gateway, the next sample starts a new baseline.
+        """
+        self._previous.pop(gateway_id, None)
@@ -0,0 +1,224 @@
+from math import ceil, log, inf
+from time import time
+from collections import deque
+from datetime import datetime, timezone
+from logging import getLogger, Logger
+from app.models.metric_map import metric_extractor
+
+__all__ = ['QuantileSketch', 'RollupEngine', 'ROLLUP_LEVELS']
+
+# Rollup level name and bucket width in seconds.
+ROLLUP_LEVELS = {"minute": 60, "hour": 3600, "day": 86400}
+
+
+class QuantileSketch:
+    """
+        A small mergeable quantile sketch with relative error guarantees, in the style of DDSketch. Values fall into
+        logarithmic buckets, so every quantile it returns is within relative_accuracy of a real sample, no matter
+        how many samples were added. Negative values, e.g. RSRP, use their own set of buckets.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = log(self._gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value > 0:
+            key = ceil(log(value) / self._log_gamma)
+            self.positive[key] = self.positive.get(key, 0) + 1
+        elif value < 0:
+            key = ceil(log(-value) / self._log_gamma)
+            self.negative[key] = self.negative.get(key, 0) + 1
+        else:
+            self.zeros += 1
+
+    def merge(self, other: "QuantileSketch") -> None:
+        for key, count in other.positive.items():
+            self.positive[key] = self.positive.get(key, 0) + count
+        for key, count in other.negative.items():
+            self.negative[key] = self.negative.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def _value(self, key: int) -> float:
+        return 2 * self._gamma ** key / (self._gamma + 1)
+
+    def quantile(self, q: float):
+        """
+        :param q: float, Between 0 and 1.
+        :return: float, The estimated q quantile, or None when the sketch is empty.
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+
+        seen = 0
+        # Negative values from the most negative (largest key) up.
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive)) if self.positive else 0.0
+
+
+class _Aggregate:
+    __slots__ = ("minimum", "maximum", "total", "count", "last", "sketch")
+
+    def __init__(self, relative_accuracy: float):
+        self.minimum = inf
+        self.maximum = -inf
+        self.total = 0.0
+        self.count = 0
+        self.last = None
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def add(self, value: float) -> None:
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+        self.total += value
+        self.count += 1
+        self.last = value
+        self.sketch.add(value)
+
+    def document(self, percentiles: tuple) -> dict:
+        document = {
+            "min": self.minimum,
+            "max": self.maximum,
+            "mean": self.total / self.count,
+            "count": self.count,
+            "last": self.last
+        }
+        for p in percentiles:
+            document[f"p{p}"] = self.sketch.quantile(p / 100)
+        return document
+
+
+class RollupEngine:
+    """
+        RollupEngine keeps running minute, hour and day aggregates of every numeric metric, per gateway, updated as
+        each sample arrives. Each gateway has one open bucket per level. When a sample lands in a later bucket the
+        open one is closed and handed to the sink, so storage only ever sees finished aggregates. Buckets the sink
+        fails to take are kept and sent again with the next closed bucket, or by flush. The sink merges a bucket
+        written twice, so sending one again is safe.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, sink=None, levels: dict = None, percentiles: tuple = (50, 95, 99),
+                 relative_accuracy: float = 0.01, max_unwritten: int = 10000):
+        """
+            :param sink: object, Gets add_rollups(level, documents) with closed buckets. Closed buckets are kept in
+                self.closed when there is no sink.
+            :param levels: dict, {level name: bucket width in seconds}. Defaults to ROLLUP_LEVELS.
+            :param percentiles: tuple, Percentiles stored with each aggregate, from the quantile sketch.
+            :param relative_accuracy: float, Relative error of the stored percentiles.
+            :param max_unwritten: int, Buckets kept while the sink fails, the oldest are dropped beyond that.
+        """
+        self.sink = sink
+        self.levels = dict(levels if levels is not None else ROLLUP_LEVELS)
+        self.percentiles = percentiles
+        self.relative_accuracy = relative_accuracy
+        self.closed = []
+        self.max_unwritten = max_unwritten
+        # (level, document) of the buckets the sink failed to take, oldest first.
+        self._unwritten = deque()
+
+        self._metrics = [(metric.name, index) for index, metric in enumerate(metric_extractor.metrics)
+                         if metric.type in (int, float)]
+        # {(level, gateway_id): (bucket start, {metric: _Aggregate})}
+        self._open = {}
+
+    def add(self, data: dict) -> None:
+        """
+        Folds one result from TrashcanMonitor.start_test into the open buckets of its gateway.
+        """
+        timestamp = data["timestamp"].timestamp() if data.get("timestamp") else time()
+        # Single gateway deployments are told apart by container_id, as in the stored results.
+        gateway_id = data.get("gateway_id") or data.get("container_id")
+        values = metric_extractor.extract_values(data)
+        present = [(name, values[index]) for name, index in self._metrics if values[index] is not None]
+
+        for level, width in self.levels.items():
+            bucket_start = timestamp - timestamp % width
+            key = (level, gateway_id)
+            bucket = self._open.get(key)
+            if bucket is None or bucket[0] != bucket_start:
+                if bucket is not None:
+                    self._close(level, gateway_id, bucket)
+                bucket = (bucket_start, {})
+                self._open[key] = bucket
+
+            aggregates = bucket[1]
+            for name, value in present:
+                aggregate = aggregates.get(name)
+                if aggregate is None:
+                    aggregate = aggregates[name] = _Aggregate(self.relative_accuracy)
+                aggregate.add(value)
+
+    def _close(self, level: str, gateway_id: str, bucket: tuple) -> None:
+        document = self._document(level, gateway_id, bucket)
+        if self.sink is None:
+            self.closed.append(document)
+            return
+        self._write([(level, document)])
+
+    def _document(self, level: str, gateway_id: str, bucket: tuple) -> dict:
+        return {
+            "level": level,
+            "gateway_id": gateway_id,
+            "bucket_start": datetime.fromtimestamp(bucket[0], tz=timezone.utc),
+            "metrics": {name: aggregate.document(self.percentiles) for name, aggregate in bucket[1].items()}
+        }
+
+    def _write(self, documents: list) -> bool:
+        """
+        Hands (level, document) pairs to the sink, one call per level, after the ones it failed to take before.
+        Those that fail again are kept for the next write.
+        """
+        pending = [*self._unwritten, *documents]
+        self._unwritten.clear()
+        for level in dict.fromkeys(level for level, _ in pending):
+            batch = [document for document_level, document in pending if document_level == level]
+            try:
+                self.sink.add_rollups(level, batch)
+            except Exception as err:
+                self.log.critical(f"Writing {len(batch)} {level} rollups failed, they are kept to be written again: "
+                                  f"{str(err)}")
+                self._unwritten.extend((level, document) for document in batch)
+
+        dropped = len(self._unwritten) - self.max_unwritten
+        if dropped > 0:
+            for _ in range(dropped):
+                self._unwritten.popleft()
+            self.log.error(f"Dropped the {dropped} oldest unwritten rollups, more than {self.max_unwritten} were kept.")
+        return not self._unwritten
+
+    def flush(self) -> bool:
+        """
+        Closes every open bucket, for shutdown, and tries once more to write the buckets the sink failed to take.
+        Buckets closed early are partial.
+        :return: bool, True when nothing is left unwritten.
+        """
+        documents = [(level, self._document(level, gateway_id, bucket))
+                     for (level, gateway_id), bucket in self._open.items()]
+        self._open = {}
+        if self.sink is None:
+            self.closed.extend(document for _, document in documents)
+            return True
+        if not documents and not self._unwritten:
+            return True
+        return self._write(documents)
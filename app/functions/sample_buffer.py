@@ -0,0 +1,149 @@
+from array import array
+from math import isnan, nan, floor, ceil
+from time import time
+from threading import Lock
+from app.models.metric_map import metric_extractor
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ['SampleBuffer']
+
+
+class SampleBuffer:
+    """
+        SampleBuffer keeps the most recent flattened samples in memory, one fixed size array of doubles per numeric
+        metric, used as a ring. Appends are O(1) and window queries only touch the columns they ask about. Missing
+        values are stored as NaN and skipped by the queries. NumPy is used for the window statistics when it is
+        installed.
+    """
+
+    def __init__(self, capacity: int, metrics: list = None):
+        """
+            :param capacity: int, The most samples kept. Older samples are overwritten.
+            :param metrics: list, Metric names to keep. Defaults to every numeric metric of the metric map.
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1.")
+
+        if metrics is None:
+            metrics = [metric.name for metric in metric_extractor.metrics if metric.type in (int, float)]
+        self.capacity = capacity
+        self.metrics = list(metrics)
+        self.size = 0
+        self._next = 0
+        self._lock = Lock()
+
+        self._positions = [metric_extractor.names.index(name) for name in self.metrics]
+        self._timestamps = array("d", [nan]) * capacity
+        self._columns = {name: array("d", [nan]) * capacity for name in self.metrics}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Sizes the buffer to hold buffer_hours of samples at the configured sleep_time.
+        """
+        return cls(capacity=max(int(config.buffer_hours * 3600 / config.sleep_time), 1))
+
+    def append(self, data: dict, timestamp: float = None) -> None:
+        """
+        Adds one result from TrashcanMonitor.start_test.
+
+        :param data: dict, The raw result, flattened through the shared metric map.
+        :param timestamp: float, Unix time of the sample. Taken from data["timestamp"] or the clock when unset.
+        """
+        if timestamp is None:
+            timestamp = data["timestamp"].timestamp() if data.get("timestamp") else time()
+
+        values = metric_extractor.extract_values(data)
+        with self._lock:
+            slot = self._next
+            self._timestamps[slot] = timestamp
+            for name, position in zip(self.metrics, self._positions):
+                value = values[position]
+                self._columns[name][slot] = nan if value is None else value
+            self._next = (slot + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+
+    def _window(self, name: str, seconds: float, now: float) -> list:
+        if name not in self._columns:
+            raise KeyError(f"{name} is not kept in this buffer.")
+
+        column = self._columns[name]
+        cutoff = (now if now is not None else time()) - seconds
+        with self._lock:
+            oldest = (self._next - self.size) % self.capacity
+
+            # Samples arrive in time order, so the window start is found with a binary search over the ring.
+            low, high = 0, self.size
+            while low < high:
+                middle = (low + high) // 2
+                if self._timestamps[(oldest + middle) % self.capacity] < cutoff:
+                    low = middle + 1
+                else:
+                    high = middle
+            start = (oldest + low) % self.capacity
+            count = self.size - low
+
+            if start + count <= self.capacity:
+                values = column[start:start + count]
+            else:
+                values = column[start:] + column[:start + count - self.capacity]
+
+        # NaN is the only value that is not equal to itself.
+        return [value for value in values if value == value]
+
+    def window(self, name: str, seconds: float, now: float = None) -> list:
+        """
+        :return: list, The values of one metric over the last seconds, oldest first, missing values left out.
+        """
+        return self._window(name, seconds, now)
+
+    def stats(self, name: str, seconds: float, percentiles: tuple = (50, 95, 99), now: float = None) -> dict:
+        """
+        Rolling statistics of one metric over the last seconds.
+        :return: dict: count, min, max, mean and one "p<n>" entry per requested percentile. Everything but count is
+            None when the window is empty.
+        """
+        values = self._window(name, seconds, now)
+        result = {"count": len(values)}
+        if not values:
+            result.update({"min": None, "max": None, "mean": None})
+            result.update({f"p{p}": None for p in percentiles})
+            return result
+
+        if numpy is not None:
+            column = numpy.frombuffer(array("d", values), dtype=numpy.float64)
+            result.update({"min": float(column.min()), "max": float(column.max()), "mean": float(column.mean())})
+            for p, value in zip(percentiles, numpy.percentile(column, percentiles)):
+                result[f"p{p}"] = float(value)
+            return result
+
+        values.sort()
+        result.update({"min": values[0], "max": values[-1], "mean": sum(values) / len(values)})
+        for p in percentiles:
+            result[f"p{p}"] = self._percentile(values, p)
+        return result
+
+    @staticmethod
+    def _percentile(ordered: list, p: float) -> float:
+        # Linear interpolation between closest ranks, the same as numpy.percentile's default.
+        rank = (len(ordered) - 1) * p / 100
+        low, high = floor(rank), ceil(rank)
+        return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+    def latest(self) -> dict:
+        """
+        :return: dict, The newest sample as {"timestamp": ..., metric: value}, or an empty dict.
+        """
+        with self._lock:
+            if not self.size:
+                return {}
+            slot = (self._next - 1) % self.capacity
+            record = {"timestamp": self._timestamps[slot]}
+            for name in self.metrics:
+                value = self._columns[name][slot]
+                record[name] = None if isnan(value) else value
+        return record
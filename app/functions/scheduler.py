@@ -0,0 +1,149 @@
+from math import ceil
+from random import Random
+from time import monotonic, sleep
+from logging import getLogger, Logger
+from app.models.metric_map import metric_extractor
+
+__all__ = ['GridScheduler', 'DegradationDetector', 'SIGNAL_METRICS']
+
+# Signal quality metrics watched for degradation, in dB or dBm, higher is better.
+SIGNAL_METRICS = ("cell_5g_stats_SNRCurrent", "cell_5g_stats_RSRPCurrent",
+                  "cell_lte_stats_SNRCurrent", "cell_lte_stats_RSRPCurrent")
+
+
+class DegradationDetector:
+    """
+        DegradationDetector flags a sample as degraded when the gateway check failed, or when a signal metric is
+        drop_db or more below its moving average. The average keeps following the signal, so a link that settles at
+        a lower level stops counting as degrading after a while.
+    """
+
+    def __init__(self, metrics: tuple = SIGNAL_METRICS, drop_db: float = 3.0, alpha: float = 0.1):
+        """
+            :param metrics: tuple, Metric map names of the signal metrics.
+            :param drop_db: float, How far below its average a metric has to fall.
+            :param alpha: float, Weight of the newest sample in the moving average.
+        """
+        self.drop_db = drop_db
+        self.alpha = alpha
+        self._positions = [(name, metric_extractor.names.index(name)) for name in metrics]
+        self._baselines = {}
+
+    def degraded(self, results: dict) -> bool:
+        degraded = results.get("gateway_check") is False
+        values = metric_extractor.extract_values(results)
+        for name, position in self._positions:
+            value = values[position]
+            if value is None:
+                continue
+            baseline = self._baselines.get(name)
+            if baseline is None:
+                self._baselines[name] = float(value)
+                continue
+            if value <= baseline - self.drop_db:
+                degraded = True
+            self._baselines[name] = baseline + self.alpha * (value - baseline)
+        return degraded
+
+
+class GridScheduler:
+    """
+        GridScheduler fires on a fixed grid of the monotonic clock, origin + n * interval, so the time spent
+        collecting never shifts later samples. Ticks missed while a sample ran long are skipped, not run back to
+        back. Each tick can be pushed back by a random jitter, which is not carried over to the next tick.
+
+        With a DegradationDetector it samples every burst_interval seconds while samples look degraded, and for
+        burst_hold seconds after the last one that did, then returns to the base grid.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, interval: float, jitter: float = 0.0, offset: float = 0.0, detector: DegradationDetector = None,
+                 burst_interval: float = None, burst_hold: float = 120.0, clock=monotonic, seed: int = None):
+        """
+            :param interval: float, Seconds between samples at the base rate.
+            :param jitter: float, The most seconds a tick is pushed back at random.
+            :param offset: float, Seconds from now to the first tick, spreads the start of many schedulers.
+            :param detector: DegradationDetector, Turns on adaptive sampling.
+            :param burst_interval: float, Seconds between samples while degraded.
+            :param burst_hold: float, Seconds burst sampling continues after the last degraded sample.
+            :param clock: callable, Monotonic clock in seconds, e.g. the event loop time in fleet mode.
+        """
+        if interval <= 0:
+            raise ValueError("interval must be above 0.")
+
+        self.interval = interval
+        self.jitter = min(jitter, interval / 2)
+        self.detector = detector
+        self.burst_interval = burst_interval if burst_interval else interval
+        self.burst_hold = burst_hold
+        self.clock = clock
+        self.skipped = 0
+        self.bursting = False
+
+        self._random = Random(seed)
+        self._origin = clock() + offset
+        self._anchor = self._origin
+        self._step = interval
+        self._tick = self._origin
+        self._burst_until = None
+        self.next_run = self._tick + self._jitter()
+
+    @classmethod
+    def from_config(cls, config, interval: float = None, jitter: float = 0.0, offset: float = 0.0, clock=monotonic):
+        detector = DegradationDetector(drop_db=config.burst_drop_db) if config.adaptive_sampling else None
+        return cls(interval or config.sleep_time, jitter=jitter, offset=offset, detector=detector,
+                   burst_interval=config.burst_interval, burst_hold=config.burst_hold, clock=clock)
+
+    def _jitter(self) -> float:
+        return self._random.uniform(0, self.jitter) if self.jitter else 0.0
+
+    def observe(self, results: dict) -> None:
+        """
+        Passes a sample to the detector, switching between the base and the burst rate as needed.
+        """
+        if self.detector is None:
+            return
+        now = self.clock()
+        if self.detector.degraded(results):
+            self._burst_until = now + self.burst_hold
+            if not self.bursting:
+                self.log.info(f"Samples look degraded, sampling every {self.burst_interval}s.")
+                self.bursting = True
+                self._anchor = self._tick
+                self._step = self.burst_interval
+        elif self.bursting and now >= self._burst_until:
+            self.log.info(f"Samples look healthy again, sampling every {self.interval}s.")
+            self.bursting = False
+            # Back onto the base grid, so the base rate keeps its phase.
+            self._anchor = self._origin
+            self._step = self.interval
+
+    def advance(self) -> float:
+        """
+        Moves to the next tick after the current one, skipping every tick that is already in the past.
+        :return: float, The clock time of the next sample.
+        """
+        now = self.clock()
+        ticks = ceil((self._tick - self._anchor) / self._step + 1e-9)
+        tick = self._anchor + ticks * self._step
+        if tick < now:
+            missed = int((now - tick) // self._step) + 1
+            self.skipped += missed
+            tick += missed * self._step
+        self._tick = tick
+        self.next_run = tick + self._jitter()
+        return self.next_run
+
+    def delay(self) -> float:
+        return max(0.0, self.next_run - self.clock())
+
+    def wait(self, stopping=None) -> bool:
+        """
+        Blocks until the next tick.
+        :param stopping: threading.Event, Ends the wait early when set.
+        :return: bool, True when stopping was set.
+        """
+        if stopping is not None:
+            return stopping.wait(self.delay())
+        sleep(self.delay())
+        return False
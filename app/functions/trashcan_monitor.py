@@ -1,8 +1,11 @@
-import json
-import requests
+from time import monotonic, perf_counter
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, wait
 from requests.exceptions import ConnectionError, Timeout, HTTPError
 from logging import getLogger, Logger
 from app.functions import ConfigApp
+from app.functions.gateway_session import GatewaySession
+from app.functions import fast_json
 
 __all__ = ['TrashcanMonitor']
 
@@ -14,21 +17,67 @@ class TrashcanMonitor:
     config = None
     log: Logger  = getLogger(__name__)
     target_gateway_url: str = "http://192.168.12.1/"
-    radio_info_url: str = target_gateway_url + "fastmile_radio_status_web_app.cgi"
-    inet_stats_url: str = target_gateway_url + "statistics_status_web_app.cgi"
-    lan_stats_url: str = target_gateway_url + "lan_status_web_app.cgi"
+    gateway_id: str = None
     request_timeout: int = 8
+    concurrent_collection: bool = False
+    collection_deadline: int = 10
+    http_keep_alive: bool = True
+    http_pool_maxsize: int = 4
+    http_max_retries: int = 1
+    http_idle_timeout: float = 30
+    endpoint_refresh: dict = None
+    _endpoint_cache: dict = None
+    _timings: dict = None
+    _executor: ThreadPoolExecutor = None
+    # SlowCycleProfiler whose cycles should include the concurrent requests, set by the caller.
+    profiler = None
+    _session: GatewaySession = None
     header = {'Accept': 'application/json',
               'Cache-Control': 'no-cache',
-              'Connection': 'close',
               'User-Agent': 'TrashcanMonitor'}
 
     @classmethod
     def from_config(cls, config: ConfigApp):
+        # Settings are kept on the instance, so several monitors (one per gateway) can live in one process.
         cls.log.debug(f"Starting {__name__} from config.")
-        cls.config = config
-        cls.target_gateway_url = config.target_gateway_url
-        return super().__new__(cls)
+        monitor = super().__new__(cls)
+        monitor.config = config
+        monitor.target_gateway_url = config.target_gateway_url
+        monitor.concurrent_collection = config.concurrent_collection
+        monitor.collection_deadline = config.collection_deadline
+        monitor.http_keep_alive = config.http_keep_alive
+        monitor.http_pool_maxsize = config.http_pool_maxsize
+        monitor.http_max_retries = config.http_max_retries
+        monitor.http_idle_timeout = config.http_idle_timeout
+        monitor.endpoint_refresh = dict(config.endpoint_refresh or {})
+        return monitor
+
+    @classmethod
+    def from_target(cls, config: ConfigApp, target):
+        """
+            Builds a monitor for one gateway of a fleet. Values set on the target override the shared config.
+
+            :param config: ConfigApp, The shared application configuration.
+            :param target: GatewayTarget, The gateway this monitor will poll.
+        """
+        monitor = cls.from_config(config)
+        monitor.gateway_id = target.gateway_id
+        monitor.target_gateway_url = target.target_gateway_url
+        if target.request_timeout:
+            monitor.request_timeout = target.request_timeout
+        return monitor
+
+    @property
+    def radio_info_url(self) -> str:
+        return self.target_gateway_url.rstrip("/") + "/fastmile_radio_status_web_app.cgi"
+
+    @property
+    def inet_stats_url(self) -> str:
+        return self.target_gateway_url.rstrip("/") + "/statistics_status_web_app.cgi"
+
+    @property
+    def lan_stats_url(self) -> str:
+        return self.target_gateway_url.rstrip("/") + "/lan_status_web_app.cgi"
 
     def check_gateway_url(self) -> bool:
         """
@@ -40,11 +89,11 @@ class TrashcanMonitor:
         header = {
             'Accept': 'text/html',
             'Cache-Control': 'no-cache',
-            'Connection': 'close',
             'User-Agent': 'TrashCanMonitor'
         }
         try:
-            requests.get(self.target_gateway_url, timeout=self.request_timeout, headers=header)
+            self._get_session().get(self.target_gateway_url, timeout=self.request_timeout, headers=header,
+                                    timings=self._timing("gateway_check"))
         except ConnectionError as err:
             raise ConnectionError(err)
         except Timeout as err:
@@ -62,7 +111,9 @@ class TrashcanMonitor:
         """
 
         try:
-            data = requests.get(self.radio_info_url, timeout=self.request_timeout, headers=self.header)
+            timings = self._timing("radio_raw_data")
+            data = self._get_session().get(self.radio_info_url, timeout=self.request_timeout, headers=self.header,
+                                           timings=timings)
         except ConnectionError as err:
             raise ConnectionError(err)
         except Timeout as err:
@@ -70,7 +121,7 @@ class TrashcanMonitor:
         except HTTPError as err:
             raise HTTPError(err)
         else:
-            return json.loads(data.text)
+            return self._decode(data, timings)
 
     def get_inet_data(self) -> dict:
         """
@@ -79,7 +130,9 @@ class TrashcanMonitor:
         """
 
         try:
-            interface_statistics = requests.get(self.inet_stats_url, timeout=self.request_timeout, headers=self.header)
+            timings = self._timing("interface_data_raw")
+            interface_statistics = self._get_session().get(self.inet_stats_url, timeout=self.request_timeout,
+                                                           headers=self.header, timings=timings)
         except ConnectionError as err:
             raise ConnectionError(err)
         except Timeout as err:
@@ -87,7 +140,7 @@ class TrashcanMonitor:
         except HTTPError as err:
             raise HTTPError(err)
         else:
-            return json.loads(interface_statistics.text)
+            return self._decode(interface_statistics, timings)
 
     def get_lanstat_data(self) -> dict:
         """
@@ -96,7 +149,9 @@ class TrashcanMonitor:
         """
 
         try:
-            lan_status = requests.get(self.inet_stats_url, timeout=self.request_timeout, headers=self.header)
+            timings = self._timing("lan_status_raw")
+            lan_status = self._get_session().get(self.lan_stats_url, timeout=self.request_timeout, headers=self.header,
+                                                 timings=timings)
         except ConnectionError as err:
             raise ConnectionError(err)
         except Timeout as err:
@@ -104,14 +159,134 @@ class TrashcanMonitor:
         except HTTPError as err:
             raise HTTPError(err)
         else:
-            return json.loads(lan_status.text)
+            return self._decode(lan_status, timings)
+
+
+    def _timing(self, key: str) -> dict:
+        """
+        :return: dict, Where the request timings of an endpoint go, kept under "timings" in the current results.
+        """
+        timings = {}
+        if self._timings is not None:
+            self._timings[key] = timings
+        return timings
+
+    @staticmethod
+    def _decode(response, timings: dict) -> dict:
+        # Parsed from the raw bytes, response.text would first guess the encoding and decode them to str.
+        started = perf_counter()
+        decoded = fast_json.loads(response.content)
+        timings["json_ms"] = (perf_counter() - started) * 1000
+        return decoded
+
+    def endpoints(self) -> dict:
+        """
+        Maps each result key to the method that collects it. Both collection modes walk this mapping, so the result
+        layout stays the same no matter how the requests are scheduled.
+        :return: dict: {result_key: bound fetch method}
+        """
+        return {
+            "gateway_check": self.check_gateway_url,
+            "radio_raw_data": self.get_radio_data,
+            "interface_data_raw": self.get_inet_data,
+            "lan_status_raw": self.get_lanstat_data,
+        }
+
+    def plan_collection(self, results: dict) -> dict:
+        """
+        Serves every endpoint whose refresh interval has not passed yet from the cache, listing it under
+        "cached_endpoints" in results.
+        :return: dict: {result_key: bound fetch method} of the endpoints that need a request this time.
+        """
+        if self._endpoint_cache is None:
+            self._endpoint_cache = {}
+        # Fetches of this sample add their timings here.
+        self._timings = results["timings"] = {}
+        now = monotonic()
+        due = {}
+        for key, fetch in self.endpoints().items():
+            cached = self._endpoint_cache.get(key)
+            if cached is not None and now - cached[0] < (self.endpoint_refresh or {}).get(key, 0):
+                results[key] = cached[1]
+                results.setdefault("cached_endpoints", []).append(key)
+            else:
+                due[key] = fetch
+        return due
+
+    def record_endpoint(self, results: dict, key: str, value=None, err: Exception = None) -> None:
+        """
+        Stores the outcome of a single endpoint in results. Failures are kept per endpoint under "endpoint_errors",
+        so one bad endpoint does not throw away the rest of the sample.
+        """
+        if err is None:
+            results[key] = value
+            if self._endpoint_cache is not None and (self.endpoint_refresh or {}).get(key):
+                self._endpoint_cache[key] = (monotonic(), value)
+            return
+
+        self.log.critical(f"Collection of {key} failed: {type(err).__name__}: {str(err)}")
+        results.setdefault("endpoint_errors", {})[key] = f"{type(err).__name__}: {str(err)}"
+        if key == "gateway_check" or "gateway_check" in results.get("cached_endpoints", ()):
+            # A cached gateway check says nothing about the gateway right now.
+            results["gateway_check"] = False
+        if self._endpoint_cache:
+            # Something changed on the gateway, request every endpoint next time.
+            self._endpoint_cache.clear()
+
+    def _get_session(self) -> GatewaySession:
+        if self._session is None:
+            self._session = GatewaySession(keep_alive=self.http_keep_alive, pool_maxsize=self.http_pool_maxsize,
+                                           max_retries=self.http_max_retries, idle_timeout=self.http_idle_timeout)
+        return self._session
+
+    def connection_stats(self) -> dict:
+        """
+        Connection reuse counters for the gateway session, see GatewaySession.stats.
+        """
+        return self._get_session().stats()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.endpoints()), thread_name_prefix="tcm-collect")
+        return self._executor
+
+    def start_concurrent_test(self) -> dict:
+        """
+        Requests every endpoint at the same time and waits for all of them under a single collection_deadline.
+        Endpoints that fail, or that have not answered by the deadline, are recorded in "endpoint_errors" instead of
+        raising.
+        :return: Returns the same dict as start_test, plus "endpoint_errors" when any endpoint failed.
+        """
+        started = perf_counter()
+        results = {
+            "timestamp": datetime.now(timezone.utc),
+            "gateway_check": False
+        }
+
+        executor = self._get_executor()
+        plan = self.plan_collection(results)
+        if self.profiler is not None:
+            plan = {key: self.profiler.task(fetch) for key, fetch in plan.items()}
+        futures = {executor.submit(fetch): key for key, fetch in plan.items()}
+        done, not_done = wait(futures, timeout=self.collection_deadline)
 
+        for future in done:
+            err = future.exception()
+            self.record_endpoint(results, futures[future], None if err else future.result(), err)
+
+        for future in not_done:
+            future.cancel()
+            deadline_error = Timeout(f"No response within the {self.collection_deadline}s collection deadline.")
+            self.record_endpoint(results, futures[future], err=deadline_error)
+
+        results["timings"]["collect_ms"] = (perf_counter() - started) * 1000
+        return results
 
     def start_test(self) -> dict:
 
         """
         This will check the connection to the gateway can be established, and then proceeds to collect information from
-        each of the modems api end points.
+        each of the modems api end points. When concurrent_collection is set, this hands off to start_concurrent_test.
         :return: Returns a dict of ResultsSchema and a time stamp. Using the following schema.
             {
                 "timestamp" : datetime.now(tz=utc)
@@ -122,68 +297,84 @@ class TrashcanMonitor:
             }
         """
 
+        if self.concurrent_collection:
+            return self.start_concurrent_test()
+
+        started = perf_counter()
         results = {
+            "timestamp": datetime.now(timezone.utc),
             "gateway_check": False
         }
 
-        # Check Connection to gateway,
+        due = self.plan_collection(results)
         try:
-            self.check_gateway_url()
-        except ConnectionError as err:
-            self.log.critical(f"Could not establish connection to gateway: {str(err)}")
-            raise ConnectionError(err)
-        except Timeout as err:
-            self.log.critical(f"Connection Timed out while trying to access gateway: {str(err)}")
-            raise Timeout(err)
-        except HTTPError as err:
-            self.log.critical(f"Gateway responded with a invalid status code: {str(err)}")
-            raise HTTPError(err)
-        else:
-            results["gateway_check"] = True
+            # Check Connection to gateway,
+            if "gateway_check" in due:
+                try:
+                    self.check_gateway_url()
+                except ConnectionError as err:
+                    self.log.critical(f"Could not establish connection to gateway: {str(err)}")
+                    raise ConnectionError(err)
+                except Timeout as err:
+                    self.log.critical(f"Connection Timed out while trying to access gateway: {str(err)}")
+                    raise Timeout(err)
+                except HTTPError as err:
+                    self.log.critical(f"Gateway responded with a invalid status code: {str(err)}")
+                    raise HTTPError(err)
+                else:
+                    self.record_endpoint(results, "gateway_check", True)
 
-        # Get Radio Info
-        try:
-            radio_data = self.get_radio_data()
-        except ConnectionError as err:
-            self.log.critical(f"Could not access radio information: {str(err)}")
-            raise ConnectionError(err)
-        except Timeout as err:
-            self.log.critical(f"Connection for radio information timed out: {str(err)}")
-            raise Timeout(err)
-        except HTTPError as err:
-            self.log.critical(f"Request for radio information returned an invalid status code: {str(err)}")
-            raise HTTPError(err)
-        else:
-            results['radio_raw_data'] = radio_data
+            # Get Radio Info
+            if "radio_raw_data" in due:
+                try:
+                    radio_data = self.get_radio_data()
+                except ConnectionError as err:
+                    self.log.critical(f"Could not access radio information: {str(err)}")
+                    raise ConnectionError(err)
+                except Timeout as err:
+                    self.log.critical(f"Connection for radio information timed out: {str(err)}")
+                    raise Timeout(err)
+                except HTTPError as err:
+                    self.log.critical(f"Request for radio information returned an invalid status code: {str(err)}")
+                    raise HTTPError(err)
+                else:
+                    self.record_endpoint(results, "radio_raw_data", radio_data)
 
-        # Get Interface Statistics
-        try:
-            interface_data = self.get_inet_data()
-        except ConnectionError as err:
-            self.log.critical(f"Could not access interface information: {str(err)}")
-            raise ConnectionError(err)
-        except Timeout as err:
-            self.log.critical(f"Connection for interface information timed out: {str(err)}")
-            raise Timeout(err)
-        except HTTPError as err:
-            self.log.critical(f"Request for interface information returned an invalid status code: {str(err)}")
-            raise HTTPError(err)
-        else:
-            results['interface_data_raw'] = interface_data
+            # Get Interface Statistics
+            if "interface_data_raw" in due:
+                try:
+                    interface_data = self.get_inet_data()
+                except ConnectionError as err:
+                    self.log.critical(f"Could not access interface information: {str(err)}")
+                    raise ConnectionError(err)
+                except Timeout as err:
+                    self.log.critical(f"Connection for interface information timed out: {str(err)}")
+                    raise Timeout(err)
+                except HTTPError as err:
+                    self.log.critical(f"Request for interface information returned an invalid status code: {str(err)}")
+                    raise HTTPError(err)
+                else:
+                    self.record_endpoint(results, "interface_data_raw", interface_data)
 
-        # Get Web Usage
-        try:
-            lan_status = self.get_lanstat_data()
-        except ConnectionError as err:
-            self.log.critical(f"Could not access lan status information: {str(err)}")
-            raise ConnectionError(err)
-        except Timeout as err:
-            self.log.critical(f"Connection for lan status information timed out: {str(err)}")
-            raise Timeout(err)
-        except HTTPError as err:
-            self.log.critical(f"Request for lan status information returned an invalid status code: {str(err)}")
-            raise HTTPError(err)
-        else:
-            results['lan_status_raw'] = lan_status
+            # Get Web Usage
+            if "lan_status_raw" in due:
+                try:
+                    lan_status = self.get_lanstat_data()
+                except ConnectionError as err:
+                    self.log.critical(f"Could not access lan status information: {str(err)}")
+                    raise ConnectionError(err)
+                except Timeout as err:
+                    self.log.critical(f"Connection for lan status information timed out: {str(err)}")
+                    raise Timeout(err)
+                except HTTPError as err:
+                    self.log.critical(f"Request for lan status information returned an invalid status code: {str(err)}")
+                    raise HTTPError(err)
+                else:
+                    self.record_endpoint(results, "lan_status_raw", lan_status)
+        except Exception:
+            # Request every endpoint again once the gateway is back.
+            self._endpoint_cache.clear()
+            raise
 
+        results["timings"]["collect_ms"] = (perf_counter() - started) * 1000
         return results
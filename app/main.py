@@ -1,8 +1,16 @@
 from logging import getLogger
 from os import environ
-from time import sleep
+from contextlib import nullcontext
+from socket import gethostname
+from datetime import datetime, timezone
 
-from app.functions import ConfigApp, TrashcanMonitor
+from app.functions import ConfigApp, GridScheduler, Pipeline, RateEngine, RollupEngine, SampleBuffer, \
+    TrashcanMonitor
+from app.functions.latency import SlowCycleProfiler, latency_recorder
+from app.functions.metrics_server import MetricsServer
+from app.functions.event_detector import EventDetector
+from app.functions.cell_tracker import CellChangeTracker
+from app.transport.registry import create_transport
 
 
 def trashcan_monitor():
@@ -21,30 +29,182 @@ def trashcan_monitor():
     # config = ConfigApp(**config_dict)
 
     log = getLogger(__name__)
+
+    # Only the selected backends are imported. Each transport gets its own writer, so a slow one holds up no other.
+    selected = config.selected_transports()
+    transports = {}
+    rollup_engines = {}
+    event_detectors = {}
+    cell_trackers = {}
+    for transport_enum in selected:
+        transport = create_transport(transport_enum, config)
+        if transport is None:
+            continue
+        name = transport_enum.value
+        if config.rollups and hasattr(transport, "add_rollups"):
+            rollup_engines[name] = RollupEngine(sink=transport)
+        if config.detect_events and hasattr(transport, "add_events"):
+            event_detectors[name] = EventDetector.from_config(config, sink=transport)
+        if config.track_cells and hasattr(transport, "add_cell_changes"):
+            cell_trackers[name] = CellChangeTracker(sink=transport)
+
+        # Results wait in a local spool, so an unavailable transport neither loses samples nor stalls the loop.
+        if config.spool_enabled:
+            from app.transport.spool import Spool, SpooledTransport
+            spool = Spool.from_config(config, name=name if len(selected) > 1 else None)
+            transport = SpooledTransport(transport, spool, replay_batch=config.spool_replay_batch)
+        transports[name] = transport
+
+    # Without a transport that stores events they are only logged, from the processing stage.
+    log_detector = None
+    if config.detect_events and not event_detectors:
+        log_detector = EventDetector.from_config(config)
+    log_cell_tracker = None
+    if config.track_cells and not cell_trackers:
+        log_cell_tracker = CellChangeTracker()
+    # What these could not write yet gets one more try at shutdown.
+    detectors = [*event_detectors.values(), *cell_trackers.values()]
+
+    rate_engine = RateEngine() if config.derive_rates else None
+
+    container_id = config.container_id or gethostname()
+
+    # The latest metrics and collector health over HTTP, for Prometheus or a quick look with curl. Recent samples per
+    # gateway are kept for its /rolling stats, without a database round trip.
+    buffers = {}
+    metrics_server = MetricsServer.from_config(config, buffers=buffers)
+    if config.buffer_hours and metrics_server is None:
+        log.warning("buffer_hours is set but the metrics server is off, recent samples are not kept.")
+    keep_samples = bool(config.buffer_hours) and metrics_server is not None
+
+    def process(results: dict) -> dict:
+        if not isinstance(results, dict):
+            raise TypeError(f"results is type({ type(results) }), and should be type({type(dict())})")
+        results.setdefault("container_id", container_id)
+        if results.get("collection_failed"):
+            # A collection that raised has nothing to store, it is counted and seen by the event detection.
+            if metrics_server is not None:
+                metrics_server.snapshot.observe_failure()
+            if log_detector is not None:
+                log_detector.observe(results)
+            return results
+        if results.get("timings"):
+            latency_recorder.record_timings(results["timings"])
+        if rate_engine is not None:
+            rate_engine.process(results)
+        if metrics_server is not None:
+            metrics_server.snapshot.observe(results)
+        if log_detector is not None:
+            log_detector.observe(results)
+        if log_cell_tracker is not None:
+            log_cell_tracker.observe(results)
+        log.debug(results)
+        if keep_samples:
+            gateway_id = results.get("gateway_id") or results.get("container_id")
+            if gateway_id not in buffers:
+                buffers[gateway_id] = SampleBuffer.from_config(config)
+            buffers[gateway_id].append(results)
+        return results
+
+    def writer(name: str):
+        transport = transports[name]
+        rollup_engine = rollup_engines.get(name)
+        event_detector = event_detectors.get(name)
+        cell_tracker = cell_trackers.get(name)
+
+        def write(results: dict) -> None:
+            if results.get("collection_failed"):
+                if event_detector is not None:
+                    event_detector.observe(results)
+                return
+            try:
+                with latency_recorder.time(f"add_data.{name}"):
+                    transport.add_data(results)
+            finally:
+                # Rollups, events and cell changes are written from this stage too, they go to the same transport.
+                if rollup_engine is not None:
+                    rollup_engine.add(results)
+                if event_detector is not None:
+                    event_detector.observe(results)
+                if cell_tracker is not None:
+                    cell_tracker.observe(results)
+        return write
+
+    pipeline = Pipeline.from_config(config, process, {name: writer(name) for name in transports})
+    if metrics_server is not None:
+        metrics_server.snapshot.stats = pipeline.stats
+
+    # Fleet mode, every gateway listed in the config is polled from this process.
+    if config.gateways:
+        # Imported here, single gateway deployments have no use for asyncio.
+        from app.functions.fleet_collector import FleetCollector
+        try:
+            FleetCollector.from_config(config).run(pipeline.submit)
+        finally:
+            shutdown(pipeline, rollup_engines, transports, metrics_server, detectors)
+        return
+
     tcm = TrashcanMonitor.from_config(config)
+    scheduler = GridScheduler.from_config(config)
+    profiler = SlowCycleProfiler.from_config(config)
+    tcm.profiler = profiler
+    cycles = 0
+
+    try:
+        while True:
+            scheduler.wait()
+            with profiler.cycle() if profiler else nullcontext():
+                try:
+                    results = tcm.start_test()
+                except Exception as err:
+                    results = {"gateway_check": False}
+                    log.critical(str(err))
+                    # A collection that raised is a failed sample for the outage and flapping detection. It goes
+                    # through the pipeline, so the detectors see it in order with the samples before it.
+                    pipeline.submit({"gateway_check": False, "collection_failed": True,
+                                     "timestamp": datetime.now(timezone.utc), "gateway_id": tcm.gateway_id})
+                else:
+                    pipeline.submit(results)
+            scheduler.observe(results)
+            log.debug(f"Gateway connections: {tcm.connection_stats()}")
+            log.debug(f"Pipeline: {pipeline.stats()}")
+
+            cycles += 1
+            if cycles % 60 == 0:
+                log.info(f"Latency in ms: {latency_recorder.snapshot()}")
 
-    while True:
+            scheduler.advance()
+            log.debug(f"Next test in {scheduler.delay():.1f}s, {scheduler.skipped} ticks skipped so far.")
+    finally:
+        shutdown(pipeline, rollup_engines, transports, metrics_server, detectors)
+
+
+def shutdown(pipeline: Pipeline, rollup_engines: dict, transports: dict, metrics_server: MetricsServer = None,
+             detectors: list = ()) -> None:
+    """
+    Drains the pipeline, then writes the open rollup buckets and what the detectors could not write before, and
+    closes the transports and the metrics server.
+
+    :param rollup_engines: dict, {transport name: RollupEngine}
+    :param transports: dict, {transport name: transport}
+    :param detectors: list, Detectors with a flush method, EventDetector and CellChangeTracker.
+    """
+    pipeline.close()
+    log = getLogger(__name__)
+    log.info(f"Latency in ms: {latency_recorder.snapshot()}")
+    for name, rollup_engine in rollup_engines.items():
+        if not rollup_engine.flush():
+            log.error(f"Not every rollup could be written to the {name} transport before shutting down.")
+    for detector in detectors:
+        if not detector.flush():
+            log.error(f"{type(detector).__name__} could not write everything before shutting down.")
+    for name, transport in transports.items():
         try:
-            results = tcm.start_test()
+            transport.close()
         except Exception as err:
-            results = {"gateway_check": False}
-            log.critical(str(err))
-        else:
-            log.debug(results)
-
-        log.debug(f"Pausing testing for {config.sleep_time}")
-        sleep(config.sleep_time)
-    #     mt = MongoTransport(from_config=config)
-
-    #
-    #     try:
-    #         mt.add_data(results)
-    #     except Exception as err:
-    #         log.critical(err)
-    #     else:
-    #         log.info(f"Testing complete, document id: {mt.recent_id} added to db.")
-    #
-    #     log.debug(f"Pausing testing for {config.sleep_time}")
+            log.error(f"Closing the {name} transport failed: {err}")
+    if metrics_server is not None:
+        metrics_server.close()
 
 
 if __name__ == "__main__":
@@ -1,3 +1,5 @@
-from app.models.config_model import ConfigForbidExtra, ConfigIgnoreExtra
+from app.models.config_model import ConfigForbidExtra, ConfigIgnoreExtra, GatewayTarget
+from app.models.metric_map import Metric, MetricExtractor, METRIC_MAP, metric_extractor
 
-__all__ = ['ConfigForbidExtra', 'ConfigIgnoreExtra']
+__all__ = ['ConfigForbidExtra', 'ConfigIgnoreExtra', 'GatewayTarget', 'Metric', 'MetricExtractor', 'METRIC_MAP',
+           'metric_extractor']
@@ -1,9 +1,9 @@
 from pydantic import Field, BaseModel, Extra, validator
-from pydantic.typing import Optional
+from pydantic.typing import Optional, List, Dict
 from enum import Enum
 
 
-__all__ = ['ConfigForbidExtra', 'ConfigIgnoreExtra', 'ConfigAllowExtra']
+__all__ = ['ConfigForbidExtra', 'ConfigIgnoreExtra', 'ConfigAllowExtra', 'GatewayTarget']
 
 class TransportEnum(Enum):
     api = "api"
@@ -11,8 +11,24 @@ class TransportEnum(Enum):
     csv = "csv"
     sql = "sql"
 
+class GatewayTarget(BaseModel):
+    """
+        One gateway polled in fleet mode. Unset values fall back to the application wide setting.
+    """
+    gateway_id: str = Field(description="The name results from this gateway are tagged with.")
+    target_gateway_url: str = Field(description="This is the admin url for the modem.")
+    sleep_time: Optional[int] = Field(default=None, description="Seconds between samples for this gateway.")
+    request_timeout: Optional[int] = Field(default=None, description="Timeout in seconds for each request.")
+    collection_deadline: Optional[int] = Field(default=None,
+                                               description="Overall time limit in seconds for one sample.")
+
+    class Config:
+        extra = Extra.forbid
+
+
 class ConfigFields:
-    container_id = Field(description="")
+    container_id = Field(default=None,
+                         description="Tags every result. Defaults to the host name, the container id in docker.")
 
     # Loging related fields.
     log_level = Field(default=10, description="The log level, using python standard log levels.")
@@ -26,6 +42,50 @@ class ConfigFields:
 
     target_gateway_url = Field(default="http://192.168.12.1", description="This is the admin url for the modem.")
     transport = Field(description="This will change which the data will use.")
+    transports = Field(default=None,
+                       description="Several transports to write every result to, each on its own writer. Takes the "
+                                   "place of transport when set.")
+    concurrent_collection = Field(default=False,
+                                  description="Request all gateway endpoints at once instead of one after another.")
+    collection_deadline = Field(default=10,
+                                description="Overall time limit in seconds for one concurrent collection.")
+    endpoint_refresh = Field(default={"gateway_check": 300, "lan_status_raw": 300},
+                             description="Seconds an endpoint result is reused, by result key. Unlisted endpoints "
+                                         "are requested every sample.")
+
+    # Fleet mode.
+    gateways = Field(default=None, description="Gateways to poll from one process. Enables fleet mode when set.")
+    fleet_max_in_flight = Field(default=32, description="The most gateway requests in flight at once in fleet mode.")
+    fleet_jitter = Field(default=1.0, description="The most seconds each fleet sample is pushed back at random.")
+
+    # Adaptive sampling.
+    adaptive_sampling = Field(default=False,
+                              description="Sample faster while the signal degrades or the gateway check fails.")
+    burst_interval = Field(default=5, description="Seconds between samples while degraded.")
+    burst_hold = Field(default=120, description="Seconds fast sampling continues after the last degraded sample.")
+    burst_drop_db = Field(default=3.0, description="dB below its moving average SNR or RSRP counts as degraded.")
+
+    # Derived metrics.
+    derive_rates = Field(default=True, description="Add per-second rates of the cumulative gateway counters.")
+    rollups = Field(default=True, description="Keep minute, hour and day aggregates of every metric.")
+
+    # Retention in days, unset keeps data forever.
+    retention_raw_days = Field(default=None, description="Days raw results are kept before they expire.")
+    retention_minute_days = Field(default=7, description="Days minute rollups are kept.")
+    retention_hour_days = Field(default=90, description="Days hour rollups are kept.")
+    retention_day_days = Field(default=None, description="Days day rollups are kept.")
+
+    # In memory history.
+    buffer_hours = Field(default=0, description="Hours of recent samples kept in memory per gateway for the rolling "
+                                                "stats of the metrics server, 0 to disable.")
+
+    # Gateway HTTP session.
+    http_keep_alive = Field(default=True, description="Keep connections to the gateway open between requests.")
+    http_pool_maxsize = Field(default=4, description="The most connections kept open to the gateway.")
+    http_max_retries = Field(default=1,
+                             description="Retries on a fresh connection when a pooled connection has gone stale.")
+    http_idle_timeout = Field(default=30,
+                              description="Seconds a pooled connection may sit idle before it is reconnected.")
 
     # Mongo transport defaults.
     mongo_user = Field(description="The username you would use to authenticate with mongodb.")
@@ -34,6 +94,82 @@ class ConfigFields:
     mongo_port = Field(default=27017, description="The port mongodb will be assigned on the host.")
     mongo_auth = Field(description="The database the user is going to authenticate to.")
     mongo_db = Field(description="The database that should be used for storing data.")
+    mongodb_uri = Field(default=None, description="The full connection uri for mongodb.")
+    results_db = Field(default=None, description="The database results are written to.")
+    db_collection = Field(default=None, description="The collection results are written to.")
+    mongo_timeseries = Field(default=True,
+                             description="Store results in a MongoDB time-series collection, created on startup.")
+    mongo_ts_meta_field = Field(default="gateway_id",
+                                description="The time-series metaField, groups samples by gateway.")
+    mongo_ts_granularity = Field(default=None,
+                                 description="seconds, minutes or hours. Picked from sleep_time when unset.")
+    mongo_ts_migrate = Field(default=True,
+                             description="Convert an existing plain results collection to a time-series collection.")
+    mongo_delta_storage = Field(default=False,
+                                description="Store the raw payloads as changes against periodic full snapshots.")
+    mongo_snapshot_every = Field(default=60, description="Deltas stored between two full snapshots.")
+    mongo_batch_size = Field(default=0,
+                             description="Documents per insert_many batch. 0 or 1 writes each result on its own.")
+    mongo_batch_bytes = Field(default=4 * 1024 * 1024, description="Flush a batch once it holds this many bytes.")
+    mongo_batch_age = Field(default=5.0, description="Flush a batch once its oldest document is this many seconds old.")
+    mongo_timeout_ms = Field(default=5000, description="Milliseconds to wait for the server before a write fails.")
+    mongo_trusted_results = Field(default=True,
+                                  description="Only shallow check the collector's results instead of fully validating "
+                                              "and copying them.")
+
+
+    # CSV transport defaults.
+    csv_path = Field(default="./results/", description="The directory csv results are written to.")
+    csv_compress = Field(default=False, description="gzip the csv files.")
+    csv_flush_interval = Field(default=30, description="Seconds buffered rows may wait before they are written.")
+    csv_flush_bytes = Field(default=64 * 1024, description="Write buffered rows once they reach this many bytes.")
+    csv_rotate_bytes = Field(default=100 * 1024 * 1024, description="Start a new csv file at this size.")
+    csv_rotate_daily = Field(default=True, description="Start a new csv file every UTC day.")
+
+    # SQL transport defaults.
+    sql_path = Field(default="./results/trashcan_results.sqlite3", description="The SQLite database file.")
+    sql_batch_size = Field(default=100, description="Results written per transaction.")
+    sql_batch_age = Field(default=5.0, description="Seconds buffered results may wait before they are written.")
+    sql_store_raw = Field(default=True, description="Keep the raw gateway payloads as JSON in raw_results.")
+
+    # Event detection.
+    detect_events = Field(default=False,
+                          description="Detect degradation, flapping and outages and store them as events.")
+    event_z_threshold = Field(default=4.0,
+                              description="Standard deviations from its moving average that make a degradation.")
+    event_alpha = Field(default=0.05, description="Weight of the newest sample in the moving averages of the detector.")
+    event_warmup = Field(default=20, description="Samples a metric needs before it can degrade.")
+    outage_after = Field(default=2, description="Failed gateway checks in a row that make an outage.")
+    flap_window = Field(default=600, description="Seconds over which gateway state changes are counted.")
+    flap_transitions = Field(default=4, description="State changes within flap_window that count as flapping.")
+
+    # Cell change tracking.
+    track_cells = Field(default=False,
+                        description="Record every change of serving cell, band and channel with its dwell time.")
+
+    # Metrics server.
+    metrics_port = Field(default=0,
+                         description="Serve the latest metrics and collector health on this port, 0 is off.")
+    metrics_host = Field(default="0.0.0.0", description="The address the metrics server listens on.")
+
+    # Profiling.
+    profile_slowest = Field(default=0, description="Keep cProfile dumps of this many of the slowest cycles, 0 is off.")
+    profile_path = Field(default=None, description="Where cycle profiles are written, log_path/profiles when unset.")
+
+    # Runtime pipeline between sampling and storage.
+    pipeline_queue_size = Field(default=1000, description="Results each pipeline stage may hold in memory.")
+    pipeline_backpressure = Field(default="block",
+                                  description="What a full writer queue does: block, drop_oldest or spill.")
+
+    # Local spool, results wait on disk under log_path while the transport is unavailable.
+    spool_enabled = Field(default=False,
+                          description="Write results to a local spool that is replayed to the transport.")
+    spool_fsync = Field(default="interval",
+                        description="When spooled results are synced to disk: always, interval or never.")
+    spool_fsync_interval = Field(default=1.0, description="Seconds between syncs with the interval policy.")
+    spool_segment_bytes = Field(default=16 * 1024 * 1024, description="Start a new spool segment at this size.")
+    spool_quota_bytes = Field(default=1024 ** 3, description="The most disk space the spool may use.")
+    spool_replay_batch = Field(default=1000, description="Spooled results handed to the transport at once.")
 
 
 class ConfigForbidExtra(BaseModel):
@@ -42,8 +178,35 @@ class ConfigForbidExtra(BaseModel):
         configuration file.
     """
     transport: TransportEnum = ConfigFields.transport
+    transports: Optional[List[TransportEnum]] = ConfigFields.transports
+    container_id: Optional[str] = ConfigFields.container_id
     sleep_time: int = ConfigFields.sleep_time
     target_gateway_url: str = ConfigFields.target_gateway_url
+    concurrent_collection: Optional[bool] = ConfigFields.concurrent_collection
+    collection_deadline: Optional[int] = ConfigFields.collection_deadline
+    endpoint_refresh: Optional[Dict[str, float]] = ConfigFields.endpoint_refresh
+
+    gateways: Optional[List[GatewayTarget]] = ConfigFields.gateways
+    fleet_max_in_flight: Optional[int] = ConfigFields.fleet_max_in_flight
+    fleet_jitter: Optional[float] = ConfigFields.fleet_jitter
+
+    adaptive_sampling: Optional[bool] = ConfigFields.adaptive_sampling
+    burst_interval: Optional[float] = ConfigFields.burst_interval
+    burst_hold: Optional[float] = ConfigFields.burst_hold
+    burst_drop_db: Optional[float] = ConfigFields.burst_drop_db
+
+    derive_rates: Optional[bool] = ConfigFields.derive_rates
+    rollups: Optional[bool] = ConfigFields.rollups
+    retention_raw_days: Optional[float] = ConfigFields.retention_raw_days
+    retention_minute_days: Optional[float] = ConfigFields.retention_minute_days
+    retention_hour_days: Optional[float] = ConfigFields.retention_hour_days
+    retention_day_days: Optional[float] = ConfigFields.retention_day_days
+    buffer_hours: Optional[float] = ConfigFields.buffer_hours
+
+    http_keep_alive: Optional[bool] = ConfigFields.http_keep_alive
+    http_pool_maxsize: Optional[int] = ConfigFields.http_pool_maxsize
+    http_max_retries: Optional[int] = ConfigFields.http_max_retries
+    http_idle_timeout: Optional[float] = ConfigFields.http_idle_timeout
 
     log_level: int = ConfigFields.log_level
     log_path: Optional[str] = ConfigFields.log_path
@@ -57,6 +220,58 @@ class ConfigForbidExtra(BaseModel):
     mongo_port: Optional[int] = ConfigFields.mongo_port
     mongo_auth: Optional[str] = ConfigFields.mongo_auth
     mongo_db: Optional[str] = ConfigFields.mongo_db
+    mongodb_uri: Optional[str] = ConfigFields.mongodb_uri
+    results_db: Optional[str] = ConfigFields.results_db
+    db_collection: Optional[str] = ConfigFields.db_collection
+    mongo_timeseries: Optional[bool] = ConfigFields.mongo_timeseries
+    mongo_ts_meta_field: Optional[str] = ConfigFields.mongo_ts_meta_field
+    mongo_ts_granularity: Optional[str] = ConfigFields.mongo_ts_granularity
+    mongo_ts_migrate: Optional[bool] = ConfigFields.mongo_ts_migrate
+    mongo_delta_storage: Optional[bool] = ConfigFields.mongo_delta_storage
+    mongo_snapshot_every: Optional[int] = ConfigFields.mongo_snapshot_every
+    mongo_batch_size: Optional[int] = ConfigFields.mongo_batch_size
+    mongo_batch_bytes: Optional[int] = ConfigFields.mongo_batch_bytes
+    mongo_batch_age: Optional[float] = ConfigFields.mongo_batch_age
+    mongo_timeout_ms: Optional[int] = ConfigFields.mongo_timeout_ms
+    mongo_trusted_results: Optional[bool] = ConfigFields.mongo_trusted_results
+
+    csv_path: Optional[str] = ConfigFields.csv_path
+    csv_compress: Optional[bool] = ConfigFields.csv_compress
+    csv_flush_interval: Optional[float] = ConfigFields.csv_flush_interval
+    csv_flush_bytes: Optional[int] = ConfigFields.csv_flush_bytes
+    csv_rotate_bytes: Optional[int] = ConfigFields.csv_rotate_bytes
+    csv_rotate_daily: Optional[bool] = ConfigFields.csv_rotate_daily
+
+    sql_path: Optional[str] = ConfigFields.sql_path
+    sql_batch_size: Optional[int] = ConfigFields.sql_batch_size
+    sql_batch_age: Optional[float] = ConfigFields.sql_batch_age
+    sql_store_raw: Optional[bool] = ConfigFields.sql_store_raw
+
+    detect_events: Optional[bool] = ConfigFields.detect_events
+    event_z_threshold: Optional[float] = ConfigFields.event_z_threshold
+    event_alpha: Optional[float] = ConfigFields.event_alpha
+    event_warmup: Optional[int] = ConfigFields.event_warmup
+    outage_after: Optional[int] = ConfigFields.outage_after
+    flap_window: Optional[float] = ConfigFields.flap_window
+    flap_transitions: Optional[int] = ConfigFields.flap_transitions
+
+    track_cells: Optional[bool] = ConfigFields.track_cells
+
+    metrics_port: Optional[int] = ConfigFields.metrics_port
+    metrics_host: Optional[str] = ConfigFields.metrics_host
+
+    profile_slowest: Optional[int] = ConfigFields.profile_slowest
+    profile_path: Optional[str] = ConfigFields.profile_path
+
+    pipeline_queue_size: Optional[int] = ConfigFields.pipeline_queue_size
+    pipeline_backpressure: Optional[str] = ConfigFields.pipeline_backpressure
+
+    spool_enabled: Optional[bool] = ConfigFields.spool_enabled
+    spool_fsync: Optional[str] = ConfigFields.spool_fsync
+    spool_fsync_interval: Optional[float] = ConfigFields.spool_fsync_interval
+    spool_segment_bytes: Optional[int] = ConfigFields.spool_segment_bytes
+    spool_quota_bytes: Optional[int] = ConfigFields.spool_quota_bytes
+    spool_replay_batch: Optional[int] = ConfigFields.spool_replay_batch
 
     class Config:
         extra=Extra.forbid
@@ -0,0 +1,184 @@
+from typing import NamedTuple, Callable, Tuple
+
+__all__ = ['Metric', 'MetricExtractor', 'METRIC_MAP', 'COUNTER_METRICS', 'metric_extractor']
+
+
+def _to_int(value):
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return None
+
+
+def _to_float(value):
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_str(value):
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    return str(value)
+
+
+CONVERTERS = {int: _to_int, float: _to_float, str: _to_str}
+
+
+class Metric(NamedTuple):
+    """
+        One flat field pulled out of a raw result. paths are tried in order, the first one present wins, which is
+        how firmware that moves a field around is handled.
+    """
+    name: str
+    type: type
+    paths: Tuple[tuple, ...]
+
+
+def _radio_5g(key: str) -> tuple:
+    return ("radio_raw_data", "cell_5G_stats_cfg", 0, "stat", key),
+
+
+def _radio_lte(key: str) -> tuple:
+    return ("radio_raw_data", "cell_LTE_stats_cfg", 0, "stat", key),
+
+
+def _wan(key: str) -> tuple:
+    return ("interface_data_raw", "WAN", 0, "Service", 0, key),
+
+
+# The flat record layout, the names follow the columns the original record_stats wrote.
+METRIC_MAP = [
+    Metric("cellular_bytes_received", int, (("radio_raw_data", "cellular_stats", 0, "BytesReceived"),)),
+    Metric("cellular_bytes_sent", int, (("radio_raw_data", "cellular_stats", 0, "BytesSent"),)),
+    Metric("cell_5g_stats_PhysicalCellID", int, _radio_5g("PhysicalCellID")),
+    Metric("cell_5g_stats_SNRCurrent", float, _radio_5g("SNRCurrent")),
+    Metric("cell_5g_stats_RSRPCurrent", float, _radio_5g("RSRPCurrent")),
+    Metric("cell_5g_stats_RSRQCurrent", float, _radio_5g("RSRQCurrent")),
+    Metric("cell_5g_stats_RSRPStrengthIndexCurrent", int, _radio_5g("RSRPStrengthIndexCurrent")),
+    Metric("cell_5g_stats_Downlink_NR_ARFCN", int, _radio_5g("Downlink_NR_ARFCN")),
+    Metric("cell_5g_stats_Band", str, _radio_5g("Band")),
+    Metric("cell_lte_stats_PhysicalCellID", int, _radio_lte("PhysicalCellID")),
+    Metric("cell_lte_stats_SNRCurrent", float, _radio_lte("SNRCurrent")),
+    Metric("cell_lte_stats_RSRPCurrent", float, _radio_lte("RSRPCurrent")),
+    Metric("cell_lte_stats_RSRQCurrent", float, _radio_lte("RSRQCurrent")),
+    Metric("cell_lte_stats_RSRPStrengthIndexCurrent", int, _radio_lte("RSRPStrengthIndexCurrent")),
+    Metric("cell_lte_stats_DownlinkEarfcn", int, _radio_lte("DownlinkEarfcn")),
+    Metric("cell_lte_stats_Band", str, _radio_lte("Band")),
+    Metric("cellular_stats_bytes_sent", int, _wan("EthernetBytesSent")),
+    Metric("cellular_stats_bytes_received", int, _wan("EthernetBytesReceived")),
+    Metric("cellular_stats_packets_sent", int, _wan("EthernetPacketsSent")),
+    Metric("cellular_stats_packets_received", int, _wan("EthernetPacketsReceived")),
+    Metric("cellular_stats_errors_sent", int, _wan("EthernetErrorsSent")),
+    Metric("cellular_stats_errors_received", int, _wan("EthernetErrorsReceived")),
+    Metric("cellular_stats_discard_packets_sent", int, _wan("EthernetDiscardPacketsSent")),
+    Metric("cellular_stats_discard_packets_received", int, _wan("EthernetDiscardPacketsReceived")),
+    Metric("cellular_stats_multicast_packets_received", int, _wan("MulticastPacketsReceived")),
+]
+
+# Cumulative counters, RateEngine adds a "<name>_per_s" rate for each under "rates".
+COUNTER_METRICS = [
+    "cellular_bytes_received",
+    "cellular_bytes_sent",
+    "cellular_stats_bytes_sent",
+    "cellular_stats_bytes_received",
+    "cellular_stats_packets_sent",
+    "cellular_stats_packets_received",
+    "cellular_stats_errors_sent",
+    "cellular_stats_errors_received",
+    "cellular_stats_discard_packets_sent",
+    "cellular_stats_discard_packets_received",
+    "cellular_stats_multicast_packets_received",
+]
+
+METRIC_MAP += [Metric(f"{name}_per_s", float, (("rates", f"{name}_per_s"),)) for name in COUNTER_METRICS]
+
+
+class _PathNode:
+    def __init__(self):
+        self.children = {}
+        self.slots = []
+
+
+class MetricExtractor:
+    """
+    Turns a raw result into a flat typed record. The metric map is compiled once into a single function that walks
+    each shared prefix (e.g. cell_5G_stats_cfg[0]["stat"]) only once per sample. Missing keys, short lists and
+    values of the wrong type come out as None instead of raising.
+    """
+
+    def __init__(self, metrics: list = None):
+        self.metrics = list(metrics if metrics is not None else METRIC_MAP)
+        self.names = [metric.name for metric in self.metrics]
+        self.types = {metric.name: metric.type for metric in self.metrics}
+        self.extract_values = self._compile()
+
+    def _compile(self) -> Callable[[dict], tuple]:
+        root = _PathNode()
+        slot_names = []
+        for index, metric in enumerate(self.metrics):
+            if metric.type not in CONVERTERS:
+                raise ValueError(f"{metric.name} has unsupported type {metric.type}")
+            metric_slots = []
+            for rank, keys in enumerate(metric.paths):
+                node = root
+                for key in keys:
+                    node = node.children.setdefault(key, _PathNode())
+                slot = f"m{index}_{rank}"
+                node.slots.append(slot)
+                metric_slots.append(slot)
+            slot_names.append(metric_slots)
+
+        lines = ["def extract_values(data):"]
+        lines += [f"    {slot} = None" for slots in slot_names for slot in slots]
+        counter = [0]
+
+        def emit(node, var, indent):
+            pad = " " * indent
+            for key, child in node.children.items():
+                counter[0] += 1
+                value = f"v{counter[0]}"
+                lines.append(f"{pad}try:")
+                lines.append(f"{pad}    {value} = {var}[{key!r}]")
+                lines.append(f"{pad}except (KeyError, IndexError, TypeError):")
+                lines.append(f"{pad}    {value} = _MISSING")
+                lines.append(f"{pad}if {value} is not _MISSING:")
+                for slot in child.slots:
+                    lines.append(f"{pad}    {slot} = {value}")
+                if not child.slots and not child.children:
+                    lines.append(f"{pad}    pass")
+                emit(child, value, indent + 4)
+
+        emit(root, "data", 4)
+
+        values = []
+        for index, (metric, slots) in enumerate(zip(self.metrics, slot_names)):
+            chosen = slots[-1]
+            for slot in reversed(slots[:-1]):
+                chosen = f"({slot} if {slot} is not None else {chosen})"
+            values.append(f"_convert{index}({chosen})")
+        lines.append(f"    return ({', '.join(values)}{',' if len(values) == 1 else ''})")
+
+        namespace = {"_MISSING": object()}
+        for index, metric in enumerate(self.metrics):
+            namespace[f"_convert{index}"] = CONVERTERS[metric.type]
+        exec(compile("\n".join(lines), "<metric_map>", "exec"), namespace)
+        return namespace["extract_values"]
+
+    def extract(self, data: dict) -> dict:
+        """
+        :return: dict, {metric name: typed value or None}
+        """
+        return dict(zip(self.names, self.extract_values(data)))
+
+
+# A shared extractor for the default metric map, compiled once on import.
+metric_extractor = MetricExtractor()
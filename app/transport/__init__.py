@@ -1 +1,3 @@
+from app.transport.registry import TRANSPORTS, register_transport, load_transport, create_transport
 
+__all__ = ['TRANSPORTS', 'create_transport', 'load_transport', 'register_transport']
@@ -0,0 +1,3 @@
+from .csv_transport import CsvTransport
+
+__all__ = ['CsvTransport']
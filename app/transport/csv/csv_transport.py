@@ -0,0 +1,203 @@
+import csv
+import gzip
+from io import StringIO
+from os import path, makedirs
+from time import monotonic
+from threading import Lock
+from datetime import datetime, timezone
+from logging import getLogger, Logger
+from app.models.metric_map import metric_extractor
+from app.transport.flush_timer import FlushTimer
+
+__all__ = ['CsvTransport']
+
+
+class CsvTransport:
+    """
+    Writes results as rows of a fixed set of columns, the flat record from the shared metric map. Rows are buffered
+    in memory and written out when the buffer reaches flush_bytes or, checked by a FlushTimer, once the oldest row
+    is flush_interval seconds old. Files rotate every UTC day and once they reach rotate_bytes, and can be gzip
+    compressed.
+    """
+    log: Logger = getLogger(__name__)
+    header = ["timestamp", "gateway_id", "gateway_check"] + metric_extractor.names
+
+    def __init__(self, csv_path: str = "./results/", file_prefix: str = "trashcan_results", compress: bool = False,
+                 flush_interval: float = 30, flush_bytes: int = 64 * 1024, rotate_bytes: int = 100 * 1024 * 1024,
+                 rotate_daily: bool = True):
+        """
+            :param csv_path: str, The directory the csv files are written to.
+            :param file_prefix: str, File names are <prefix>_<YYYYMMDD>_<n>.csv, with .gz appended when compressed.
+            :param compress: bool, gzip the output.
+            :param flush_interval: float, Write buffered rows out once the oldest is this many seconds old.
+            :param flush_bytes: int, Write buffered rows out once they reach this many characters.
+            :param rotate_bytes: int, Start a new file once the current one reaches this size on disk.
+            :param rotate_daily: bool, Start a new file when the UTC date changes.
+        """
+        self.csv_path = path.abspath(csv_path)
+        self.file_prefix = file_prefix
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+
+        self.current_file = None
+        self.rows_written = 0
+        self._raw = None
+        self._stream = None
+        self._day = None
+        self._sequence = 0
+        self._buffer = StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._buffered_since = None
+        self._buffered_rows = 0
+        self._buffered_ids = set()
+        self._lock = Lock()
+
+        makedirs(self.csv_path, exist_ok=True)
+        self._timer = FlushTimer(self.flush_due, flush_interval, name="tcm-csv-flush") if flush_interval else None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            csv_path=config.csv_path,
+            compress=config.csv_compress,
+            flush_interval=config.csv_flush_interval,
+            flush_bytes=config.csv_flush_bytes,
+            rotate_bytes=config.csv_rotate_bytes,
+            rotate_daily=config.csv_rotate_daily
+        )
+
+    def row(self, data: dict) -> list:
+        timestamp = data.get("timestamp") or datetime.now(timezone.utc)
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.isoformat()
+        return [timestamp, data.get("gateway_id"), data.get("gateway_check"), *metric_extractor.extract_values(data)]
+
+    def add_data(self, data: dict) -> bool:
+        """
+        Buffers one result from TrashcanMonitor.start_test as a csv row.
+        """
+        if not isinstance(data, dict):
+            raise TypeError(f"data is type({ type(data) }), and should be type({type(dict())})")
+
+        row = self.row(data)
+        with self._lock:
+            if self.rotate_daily and self._day is not None and self._today() != self._day:
+                self._flush()
+                self._close_file()
+
+            self._writer.writerow(row)
+            self._buffered_rows += 1
+            if data.get("_id") is not None:
+                self._buffered_ids.add(str(data["_id"]))
+            if self._buffered_since is None:
+                self._buffered_since = monotonic()
+
+            if self._buffer.tell() >= self.flush_bytes or monotonic() - self._buffered_since >= self.flush_interval:
+                self._flush()
+        return True
+
+    def missing_documents(self, documents: list) -> list:
+        """
+        Returns the documents whose _id is not buffered, so a SpooledTransport that replays a batch again after a
+        failed flush does not buffer it twice. Rows already in a file are not looked up.
+        """
+        with self._lock:
+            buffered = set(self._buffered_ids)
+        return [document for document in documents
+                if document.get("_id") is None or str(document["_id"]) not in buffered]
+
+    def flush_due(self):
+        """
+        Writes the buffered rows once the oldest is flush_interval seconds old, called by the FlushTimer.
+
+        :return: float, Seconds until the buffered rows are due, or None when nothing is buffered.
+        """
+        with self._lock:
+            if self._buffered_since is None:
+                return None
+            remaining = self.flush_interval - (monotonic() - self._buffered_since)
+            if remaining > 0:
+                return remaining
+            self._flush()
+            return None
+
+    def flush(self) -> None:
+        """
+        Writes the buffered rows to the current file.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._buffer.tell():
+            return
+        if self._stream is None:
+            self._open_file()
+
+        rows = self._buffer.getvalue()
+        self._stream.write(rows.encode("utf-8"))
+        self._stream.flush()
+        self.rows_written += self._buffered_rows
+        self._buffered_rows = 0
+        self._buffered_ids = set()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._buffered_since = None
+
+        if self._raw.tell() >= self.rotate_bytes:
+            self._close_file()
+
+    def _today(self) -> str:
+        return datetime.now(timezone.utc).strftime("%Y%m%d")
+
+    def _file_name(self) -> str:
+        suffix = ".csv.gz" if self.compress else ".csv"
+        return path.join(self.csv_path, f"{self.file_prefix}_{self._day}_{self._sequence}{suffix}")
+
+    def _open_file(self) -> None:
+        day = self._today()
+        if day != self._day:
+            self._day = day
+            self._sequence = 0
+
+        # Skip past files from an earlier run that are already full or were written with other columns.
+        while path.exists(self._file_name()) and (path.getsize(self._file_name()) >= self.rotate_bytes
+                                                  or not self._header_matches(self._file_name())):
+            self._sequence += 1
+
+        self.current_file = self._file_name()
+        self._raw = open(self.current_file, "ab")
+        new_file = self._raw.tell() == 0
+        self._stream = gzip.GzipFile(fileobj=self._raw, mode="ab") if self.compress else self._raw
+        if new_file:
+            self._stream.write(",".join(self.header).encode("utf-8") + b"\r\n")
+        self.log.debug(f"Writing csv results to {self.current_file}")
+
+    def _header_matches(self, file_name: str) -> bool:
+        opener = gzip.open if self.compress else open
+        try:
+            with opener(file_name, "rt", encoding="utf-8", newline="") as f:
+                first_line = f.readline()
+        except (OSError, EOFError):
+            return False
+        return not first_line or first_line.rstrip("\r\n") == ",".join(self.header)
+
+    def _close_file(self) -> None:
+        if self._stream is None:
+            return
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.close()
+        self._stream = None
+        self._raw = None
+        self._sequence += 1
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.stop()
+        with self._lock:
+            self._flush()
+            self._close_file()
@@ -0,0 +1,133 @@
+from copy import deepcopy
+from bson import ObjectId
+
+__all__ = ['DeltaEncoder', 'diff', 'apply_delta', 'RAW_FIELDS']
+
+# The large gateway payloads that are stored as changes.
+RAW_FIELDS = ("radio_raw_data", "interface_data_raw", "lan_status_raw")
+
+
+def diff(base, new, path: tuple = ()) -> tuple:
+    """
+    Compares two nested payloads.
+    :return: tuple, (sets, unsets). sets is a list of [path, value], unsets a list of paths. A path is a list of dict
+        keys and list indexes. Lists are compared item by item when their length is unchanged, otherwise replaced.
+    """
+    sets = []
+    unsets = []
+    if isinstance(base, dict) and isinstance(new, dict):
+        for key, value in new.items():
+            if key not in base:
+                sets.append([list(path + (key,)), value])
+            elif base[key] != value:
+                child_sets, child_unsets = diff(base[key], value, path + (key,))
+                sets += child_sets
+                unsets += child_unsets
+        for key in base:
+            if key not in new:
+                unsets.append(list(path + (key,)))
+    elif isinstance(base, list) and isinstance(new, list) and len(base) == len(new):
+        for index, (before, after) in enumerate(zip(base, new)):
+            if before != after:
+                child_sets, child_unsets = diff(before, after, path + (index,))
+                sets += child_sets
+                unsets += child_unsets
+    else:
+        sets.append([list(path), new])
+    return sets, unsets
+
+
+def apply_delta(base, sets: list, unsets: list):
+    """
+    Rebuilds a payload from its base and the output of diff. The base is not modified.
+    """
+    result = deepcopy(base)
+    for keys in unsets:
+        parent = result
+        for key in keys[:-1]:
+            parent = parent[key]
+        del parent[keys[-1]]
+    for keys, value in sets:
+        if not keys:
+            result = deepcopy(value)
+            continue
+        parent = result
+        for key in keys[:-1]:
+            parent = parent[key]
+        parent[keys[-1]] = deepcopy(value)
+    return result
+
+
+class DeltaEncoder:
+    """
+        DeltaEncoder turns a stream of result documents into periodic snapshots and, in between, only the parts of the
+        raw payloads that differ from the latest snapshot. Every delta refers to its snapshot rather than to the sample
+        before it, so a document is rebuilt from two reads, and a lost write never corrupts later documents.
+    """
+
+    def __init__(self, snapshot_every: int = 60):
+        """
+            :param snapshot_every: int, Store a full snapshot after this many deltas.
+        """
+        self.snapshot_every = snapshot_every
+        # {gateway_id: (snapshot _id, snapshot timestamp, {raw field: payload}, deltas since the snapshot)}
+        self._snapshots = {}
+
+    def encode(self, document: dict, gateway_id: str = None) -> dict:
+        """
+        :param document: dict, A serialized ResultsSchema document. It is changed in place.
+        :return: dict, The document as a snapshot (storage "snapshot", raw fields kept) or a delta (storage "delta",
+            raw fields replaced by "delta", "snapshot_id" and "snapshot_timestamp").
+        """
+        snapshot = self._snapshots.get(gateway_id)
+        if snapshot is None or snapshot[3] >= self.snapshot_every:
+            document.setdefault("_id", ObjectId())
+            document["storage"] = "snapshot"
+            self._snapshots[gateway_id] = (document["_id"], document.get("timestamp"),
+                                           {field: document.get(field) for field in RAW_FIELDS}, 0)
+            return document
+
+        snapshot_id, snapshot_timestamp, payloads, count = snapshot
+        delta = {}
+        for field in RAW_FIELDS:
+            payload = document.pop(field, None)
+            if payload == payloads[field]:
+                continue
+            sets, unsets = diff(payloads[field], payload)
+            if sets or unsets:
+                delta[field] = {"set": sets, "unset": unsets}
+
+        document["storage"] = "delta"
+        document["snapshot_id"] = snapshot_id
+        document["snapshot_timestamp"] = snapshot_timestamp
+        document["delta"] = delta
+        self._snapshots[gateway_id] = (snapshot_id, snapshot_timestamp, payloads, count + 1)
+        return document
+
+    def reset(self, gateway_id: str = None, snapshot_id=None) -> None:
+        """
+        Forgets the snapshot of a gateway, so its next document is stored in full.
+
+        :param snapshot_id: ObjectId, Only forget the snapshot when it is still this one, for writes that fail after
+            a newer snapshot has been taken.
+        """
+        snapshot = self._snapshots.get(gateway_id)
+        if snapshot is not None and (snapshot_id is None or snapshot[0] == snapshot_id):
+            self._snapshots.pop(gateway_id, None)
+
+    @staticmethod
+    def decode(document: dict, snapshot: dict) -> dict:
+        """
+        Rebuilds the full document from a delta document and its snapshot.
+        """
+        if document.get("storage") != "delta":
+            return document
+
+        rebuilt = {key: value for key, value in document.items()
+                   if key not in ("delta", "snapshot_id", "snapshot_timestamp")}
+        rebuilt["storage"] = "rebuilt"
+        for field in RAW_FIELDS:
+            change = document["delta"].get(field)
+            base = snapshot.get(field)
+            rebuilt[field] = apply_delta(base, change["set"], change["unset"]) if change else deepcopy(base)
+        return rebuilt
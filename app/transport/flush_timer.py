@@ -0,0 +1,39 @@
+from threading import Thread, Event
+from logging import getLogger, Logger
+
+__all__ = ['FlushTimer']
+
+
+class FlushTimer:
+    """
+        FlushTimer runs a buffered transport's flush_due from a daemon thread, so rows buffered for their age are
+        written on time even when no further result arrives, e.g. while the gateway is unreachable. flush_due
+        writes what is old enough and returns the seconds until it should be called again.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, flush_due, interval: float, name: str = "tcm-flush"):
+        """
+            :param flush_due: callable, Returns the seconds until the next check, or None to wait interval.
+            :param interval: float, Seconds between checks when flush_due has nothing buffered.
+        """
+        self.flush_due = flush_due
+        self.interval = interval
+        self._stopping = Event()
+        self._thread = Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        delay = self.interval
+        while not self._stopping.wait(delay):
+            try:
+                delay = self.flush_due()
+            except Exception as err:
+                # The next add_data or close reports the error to its caller, the rows stay buffered.
+                self.log.error(f"Timed flush failed: {str(err)}")
+                delay = None
+            delay = self.interval if delay is None else max(delay, 0.01)
+
+    def stop(self, timeout: float = None) -> None:
+        self._stopping.set()
+        self._thread.join(timeout)
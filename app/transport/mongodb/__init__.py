@@ -1,4 +1,6 @@
 from .mongodb_container import MongoTransport
 from .results_schema import ResultsSchema
+from .batch_writer import MongoBatchWriter
+from .exporter import ResultExporter
 
-__all__ = ['MongoTransport']
\ No newline at end of file
+__all__ = ['MongoTransport', 'MongoBatchWriter', 'ResultExporter']
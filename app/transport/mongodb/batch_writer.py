@@ -0,0 +1,239 @@
+from time import monotonic
+from threading import Thread, Condition
+from collections import deque
+from logging import getLogger, Logger
+from bson import encode
+from bson.raw_bson import RawBSONDocument
+from pymongo.errors import BulkWriteError
+
+__all__ = ['MongoBatchWriter']
+
+
+class MongoBatchWriter:
+    """
+    Collects documents and writes them with unordered insert_many from a background thread. A batch is flushed when
+    it reaches max_docs documents, max_bytes of BSON, or when its oldest document is max_age seconds old.
+
+    When the server cannot be reached the batch goes back to the front of the queue and is sent again after
+    retry_interval seconds. Part of it may have been stored before the connection dropped, so before it is sent
+    again it goes through missing_documents, when given. Time-series collections do not enforce a unique _id, a
+    duplicate key error cannot be relied on there. Documents the server rejects, and documents still queued when
+    close gives up, are handed to on_failure instead.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, collection, max_docs: int = 500, max_bytes: int = 4 * 1024 * 1024, max_age: float = 5.0,
+                 max_queue: int = 10000, retry_interval: float = 5.0, on_failure=None, missing_documents=None):
+        """
+            :param collection: pymongo Collection, Where batches are written.
+            :param max_docs: int, Flush once this many documents are waiting.
+            :param max_bytes: int, Flush once the waiting documents add up to this many bytes of BSON.
+            :param max_age: float, Flush once the oldest waiting document is this many seconds old.
+            :param max_queue: int, The most documents held in memory. add blocks while the queue is full.
+            :param retry_interval: float, Seconds to wait before a batch that failed is sent again.
+            :param on_failure: callable, Gets the list of documents, as RawBSONDocument, that will not be written.
+            :param missing_documents: callable, Takes a list of documents and returns those whose _id is not stored
+                yet. Used on a batch sent again after a failure that may have written part of it.
+        """
+        self.collection = collection
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_queue = max_queue
+        self.retry_interval = retry_interval
+        self.on_failure = on_failure
+        self.missing_documents = missing_documents
+
+        # (RawBSONDocument, monotonic time it was added) pairs, oldest first.
+        self._queue = deque()
+        # How many documents at the front of the queue may already be stored, from a batch that failed.
+        self._in_doubt = 0
+        self._queued_bytes = 0
+        self._oldest = None
+        self._retry_at = None
+        self._closing = False
+        self._condition = Condition()
+
+        self.flushed = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+
+        self._thread = Thread(target=self._run, name="tcm-mongo-batch", daemon=True)
+        self._thread.start()
+
+    def add(self, document: dict) -> None:
+        """
+        Queues a document for the next batch. The document is encoded to BSON once here and sent as is.
+        """
+        raw = RawBSONDocument(encode(document))
+        with self._condition:
+            if self._closing:
+                raise RuntimeError("MongoBatchWriter is closed.")
+            while len(self._queue) >= self.max_queue:
+                self._condition.wait()
+
+            now = monotonic()
+            if not self._queue:
+                self._oldest = now
+            self._queue.append((raw, now))
+            self._queued_bytes += len(raw.raw)
+
+            # The first document starts the age timer, a full batch is flushed right away.
+            if len(self._queue) == 1 or len(self._queue) >= self.max_docs or self._queued_bytes >= self.max_bytes:
+                self._condition.notify_all()
+
+    def _batch_ready(self) -> bool:
+        if not self._queue:
+            return False
+        if self._retry_at is not None and not self._closing and monotonic() < self._retry_at:
+            return False
+        return (self._closing or len(self._queue) >= self.max_docs or self._queued_bytes >= self.max_bytes
+                or monotonic() - self._oldest >= self.max_age)
+
+    def _wait_timeout(self):
+        if self._retry_at is not None and not self._closing:
+            return max(self._retry_at - monotonic(), 0)
+        if self._oldest is None:
+            return None
+        return max(self.max_age - (monotonic() - self._oldest), 0)
+
+    def _take_batch(self) -> tuple:
+        """
+        :return: tuple, (batch, how many of its first documents may already be stored)
+        """
+        batch = []
+        batch_bytes = 0
+        while self._queue and len(batch) < self.max_docs and (not batch or batch_bytes < self.max_bytes):
+            entry = self._queue.popleft()
+            batch.append(entry)
+            batch_bytes += len(entry[0].raw)
+
+        self._queued_bytes -= batch_bytes
+        # Documents left behind keep their own age, the age limit does not start over for them.
+        self._oldest = self._queue[0][1] if self._queue else None
+        in_doubt = min(self._in_doubt, len(batch))
+        self._in_doubt -= in_doubt
+        self._condition.notify_all()
+        return batch, in_doubt
+
+    def _requeue(self, batch: list) -> None:
+        """
+        Puts a batch that could not be sent back in front of the queue, in its original order.
+        """
+        with self._condition:
+            self._queue.extendleft(reversed(batch))
+            self._queued_bytes += sum(len(raw.raw) for raw, _ in batch)
+            self._oldest = self._queue[0][1]
+            self._retry_at = monotonic() + self.retry_interval
+            # Documents in doubt that were not in the batch are right behind it.
+            self._in_doubt += len(batch)
+            self.retries += 1
+
+    def _give_up(self, documents: list, reason: str) -> None:
+        self.failed += len(documents)
+        self.log.critical(f"Giving up on {len(documents)} documents: {reason}")
+        if self.on_failure is not None and documents:
+            try:
+                self.on_failure(documents)
+            except Exception as err:
+                self.log.error(f"on_failure raised: {str(err)}")
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._batch_ready():
+                    if self._closing and not self._queue:
+                        return
+                    self._condition.wait(self._wait_timeout())
+                batch, in_doubt = self._take_batch()
+                closing = self._closing
+
+            if not self._flush(batch, in_doubt):
+                if closing:
+                    # Nothing waits for another retry once close has been called, drop what is left.
+                    with self._condition:
+                        leftover = batch + list(self._queue)
+                        self._queue.clear()
+                        self._queued_bytes = 0
+                        self._oldest = None
+                        self._in_doubt = 0
+                        self._condition.notify_all()
+                    self._give_up([raw for raw, _ in leftover], "the server is unreachable and the writer is closing.")
+                else:
+                    self._requeue(batch)
+            else:
+                with self._condition:
+                    self._retry_at = None
+
+    def _flush(self, batch: list, in_doubt: int = 0) -> bool:
+        """
+        :param in_doubt: int, How many of the first documents of batch may already be stored.
+        :return: bool, False when the batch should be sent again, True when it is done with, written or rejected.
+        """
+        documents = [raw for raw, _ in batch]
+        started = monotonic()
+        done = True
+        try:
+            if in_doubt and self.missing_documents is not None:
+                missing = self.missing_documents(documents[:in_doubt])
+                self.flushed += in_doubt - len(missing)
+                documents = missing + documents[in_doubt:]
+                if not documents:
+                    return True
+            result = self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as err:
+            # The server answered, documents it rejected would be rejected again. A duplicate _id is already stored.
+            write_errors = err.details.get("writeErrors", [])
+            rejected = [documents[error["index"]] for error in write_errors if error.get("code") != 11000]
+            self.flushed += len(documents) - len(rejected)
+            if rejected:
+                self._give_up(rejected, f"rejected by the server: {write_errors[0].get('errmsg')}")
+        except Exception as err:
+            self.log.critical(f"Batch insert of {len(documents)} documents failed, retrying in "
+                              f"{self.retry_interval}s: {str(err)}")
+            done = False
+        else:
+            self.flushed += len(result.inserted_ids)
+
+        latency = monotonic() - started
+        self.batches += 1
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        self._total_flush_latency += latency
+        self.log.debug(f"Flushed {len(batch)} documents in {latency:.3f}s.")
+        return done
+
+    def stats(self) -> dict:
+        """
+        Queue and flush statistics.
+        :return: dict: queue depth and bytes, documents flushed and failed, batches retried, batch count and flush
+            latency in seconds.
+        """
+        with self._condition:
+            queue_depth = len(self._queue)
+            queued_bytes = self._queued_bytes
+        return {
+            "queue_depth": queue_depth,
+            "queued_bytes": queued_bytes,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "batches": self.batches,
+            "last_flush_latency": self.last_flush_latency,
+            "max_flush_latency": self.max_flush_latency,
+            "mean_flush_latency": self._total_flush_latency / self.batches if self.batches else 0.0
+        }
+
+    def close(self, timeout: float = None) -> None:
+        """
+        Flushes everything still queued and stops the background thread. A flush that fails while closing is not
+        retried, its documents and the rest of the queue go to on_failure.
+        """
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
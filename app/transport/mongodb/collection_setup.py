@@ -0,0 +1,172 @@
+from datetime import datetime, timezone
+from logging import getLogger
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, CollectionInvalid
+
+__all__ = ['ensure_results_collection', 'ensure_rollup_collections', 'ensure_events_collection',
+           'ensure_cell_changes_collection', 'apply_raw_retention', 'granularity_for', 'RESULTS_INDEXES']
+
+log = getLogger(__name__)
+
+# The secondary indexes dashboards query through, "meta" is replaced with the configured meta field.
+RESULTS_INDEXES = [
+    [("meta", ASCENDING), ("timestamp", DESCENDING)],
+    [("timestamp", DESCENDING)],
+    [("gateway_check", ASCENDING), ("timestamp", DESCENDING)],
+]
+
+
+def granularity_for(sleep_time: int) -> str:
+    """
+    Picks the time-series bucket granularity closest to how often samples arrive.
+    """
+    if sleep_time < 60:
+        return "seconds"
+    if sleep_time < 3600:
+        return "minutes"
+    return "hours"
+
+
+def _server_supports_timeseries(db) -> bool:
+    version = db.client.server_info().get("versionArray", [0])
+    return version[0] >= 5
+
+
+def _is_timeseries(db, name: str):
+    """
+    :return: None when the collection does not exist, otherwise whether it is a time-series collection.
+    """
+    for info in db.list_collections(filter={"name": name}):
+        return info.get("type") == "timeseries"
+    return None
+
+
+def _migrate(db, name: str, timeseries: dict, batch_size: int) -> None:
+    legacy_name = f"{name}_legacy_{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}"
+    log.warning(f"Migrating {name} to a time-series collection, the original is kept as {legacy_name}.")
+    db[name].rename(legacy_name)
+    db.create_collection(name, timeseries=timeseries)
+
+    meta_field = timeseries["metaField"]
+    copied = 0
+    skipped = 0
+    batch = []
+    for document in db[legacy_name].find({}, batch_size=batch_size):
+        # Older documents only have container_id, new single gateway documents use it as the meta field too, so
+        # they stay in one series.
+        if document.get(meta_field) is None and document.get("container_id") is not None:
+            document[meta_field] = document["container_id"]
+        batch.append(document)
+        if len(batch) >= batch_size:
+            written = _copy_batch(db[name], batch)
+            copied += written
+            skipped += len(batch) - written
+            batch = []
+    if batch:
+        written = _copy_batch(db[name], batch)
+        copied += written
+        skipped += len(batch) - written
+
+    log.warning(f"Migrated {copied} documents to {name}, {skipped} without a usable timestamp were left behind.")
+
+
+def _copy_batch(collection, batch: list) -> int:
+    try:
+        return len(collection.insert_many(batch, ordered=False).inserted_ids)
+    except BulkWriteError as err:
+        return err.details.get("nInserted", 0)
+
+
+def ensure_results_collection(db, name: str, meta_field: str = "gateway_id", granularity: str = "seconds",
+                              migrate: bool = True, batch_size: int = 10000) -> bool:
+    """
+    Makes sure the results collection exists as a time-series collection with the indexes results are queried by.
+    A plain collection left over from older versions is migrated when migrate is set. Servers older than 5.0 keep a
+    plain collection, but still get the indexes.
+
+    :param db: pymongo Database, The results database.
+    :param name: str, The results collection.
+    :param meta_field: str, The field that identifies the gateway a sample came from.
+    :param granularity: str, seconds, minutes or hours, see granularity_for.
+    :param migrate: bool, Convert an existing plain collection.
+    :param batch_size: int, Documents per batch while migrating.
+    :return: True when the collection is a time-series collection.
+    """
+    timeseries = {"timeField": "timestamp", "metaField": meta_field, "granularity": granularity}
+    is_timeseries = _is_timeseries(db, name)
+
+    if not _server_supports_timeseries(db):
+        log.warning("MongoDB is older than 5.0, results are stored in a plain collection.")
+    elif is_timeseries is None:
+        try:
+            db.create_collection(name, timeseries=timeseries)
+        except CollectionInvalid:
+            # Another process created it first.
+            pass
+        is_timeseries = _is_timeseries(db, name)
+    elif not is_timeseries and migrate:
+        _migrate(db, name, timeseries, batch_size)
+        is_timeseries = True
+
+    for keys in RESULTS_INDEXES:
+        db[name].create_index([(meta_field if field == "meta" else field, order) for field, order in keys])
+
+    return bool(is_timeseries)
+
+
+def apply_raw_retention(db, name: str, seconds: int = None) -> None:
+    """
+    Lets raw results expire after seconds, None keeps them forever. Time-series collections expire whole buckets
+    through expireAfterSeconds, plain collections get a TTL index on timestamp.
+    """
+    if _is_timeseries(db, name):
+        db.command("collMod", name, expireAfterSeconds=seconds if seconds else "off")
+    elif seconds:
+        db[name].create_index([("timestamp", ASCENDING)], name="timestamp_ttl", expireAfterSeconds=seconds)
+    elif "timestamp_ttl" in db[name].index_information():
+        db[name].drop_index("timestamp_ttl")
+
+
+def ensure_rollup_collections(db, name: str, retention: dict) -> dict:
+    """
+    Creates one rollup collection per level, <name>_rollup_<level>, indexed by gateway and bucket start. A level with
+    a retention in seconds gets a TTL index on bucket_start.
+
+    :param retention: dict, {level: seconds or None}
+    :return: dict, {level: collection name}
+    """
+    collections = {}
+    for level, seconds in retention.items():
+        collection = f"{name}_rollup_{level}"
+        db[collection].create_index([("gateway_id", ASCENDING), ("bucket_start", DESCENDING)])
+        if "bucket_start_ttl" in db[collection].index_information():
+            db[collection].drop_index("bucket_start_ttl")
+        if seconds:
+            db[collection].create_index([("bucket_start", ASCENDING)], name="bucket_start_ttl",
+                                        expireAfterSeconds=seconds)
+        collections[level] = collection
+    return collections
+
+
+def ensure_events_collection(db, name: str) -> str:
+    """
+    Creates the events collection, <name>_events, indexed by gateway and by kind, each with the start time.
+
+    :return: str, The collection name.
+    """
+    collection = f"{name}_events"
+    db[collection].create_index([("gateway_id", ASCENDING), ("start", DESCENDING)])
+    db[collection].create_index([("kind", ASCENDING), ("start", DESCENDING)])
+    return collection
+
+
+def ensure_cell_changes_collection(db, name: str) -> str:
+    """
+    Creates the cell change collection, <name>_cell_changes, indexed by gateway, technology, field and change time.
+
+    :return: str, The collection name.
+    """
+    collection = f"{name}_cell_changes"
+    db[collection].create_index([("gateway_id", ASCENDING), ("technology", ASCENDING), ("field", ASCENDING),
+                                 ("changed_at", ASCENDING)])
+    return collection
@@ -0,0 +1,325 @@
+import csv
+import json
+from os import path
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger, Logger
+from pymongo import ASCENDING, DESCENDING
+from app.models.metric_map import MetricExtractor, metric_extractor
+from app.transport.delta_codec import DeltaEncoder, RAW_FIELDS
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+__all__ = ['ResultExporter', 'CsvExportWriter', 'NdjsonExportWriter', 'ParquetExportWriter', 'EXPORT_FORMATS']
+
+# Fields of a delta document that are needed to rebuild it from its snapshot.
+_DELTA_FIELDS = ("storage", "snapshot_id", "snapshot_timestamp")
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class CsvExportWriter:
+    """
+    Writes flat records as csv rows, with the same columns as the CsvTransport.
+    """
+
+    def __init__(self, stream, names: list):
+        self.stream = stream
+        self._writer = csv.writer(stream)
+        self._writer.writerow(names)
+
+    def write(self, record: list) -> None:
+        if isinstance(record[0], datetime):
+            record = [record[0].isoformat(), *record[1:]]
+        self._writer.writerow(record)
+
+    def close(self) -> None:
+        self.stream.flush()
+
+
+class NdjsonExportWriter:
+    """
+    Writes one JSON object per line, either flat records or whole documents.
+    """
+
+    def __init__(self, stream, names: list = None):
+        self.stream = stream
+        self.names = names
+
+    def write(self, record) -> None:
+        if self.names is not None:
+            record = dict(zip(self.names, record))
+        self.stream.write(json.dumps(record, default=_json_default))
+        self.stream.write("\n")
+
+    def close(self) -> None:
+        self.stream.flush()
+
+
+class ParquetExportWriter:
+    """
+    Writes flat records to a Parquet file, one row group per row_group_size records, so memory stays bounded by a
+    single row group. Needs pyarrow.
+    """
+
+    def __init__(self, file_path: str, names: list, types: dict, row_group_size: int = 65536):
+        """
+            :param types: dict, {metric name: int, float or str} Columns not listed are strings.
+        """
+        if pyarrow is None:
+            raise ImportError("The parquet format needs pyarrow, pip install pyarrow.")
+        fields = []
+        for name in names:
+            if name == "timestamp":
+                fields.append(pyarrow.field(name, pyarrow.timestamp("us", tz="UTC")))
+            elif name == "gateway_check":
+                fields.append(pyarrow.field(name, pyarrow.bool_()))
+            else:
+                arrow_type = {int: pyarrow.int64(), float: pyarrow.float64()}.get(types.get(name), pyarrow.string())
+                fields.append(pyarrow.field(name, arrow_type))
+        self.schema = pyarrow.schema(fields)
+        self.row_group_size = row_group_size
+        self._writer = pyarrow.parquet.ParquetWriter(file_path, self.schema)
+        self._columns = [[] for _ in names]
+        self._rows = 0
+
+    def write(self, record: list) -> None:
+        for column, value in zip(self._columns, record):
+            column.append(value)
+        self._rows += 1
+        if self._rows >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._rows:
+            return
+        self._writer.write_table(pyarrow.Table.from_arrays(self._columns, schema=self.schema))
+        self._columns = [[] for _ in self._columns]
+        self._rows = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._writer.close()
+
+
+# Format name to (writer class, file extension).
+EXPORT_FORMATS = {
+    "csv": (CsvExportWriter, ".csv"),
+    "ndjson": (NdjsonExportWriter, ".ndjson"),
+    "parquet": (ParquetExportWriter, ".parquet"),
+}
+
+
+class ResultExporter:
+    """
+        ResultExporter streams stored results out of a results collection through a server side cursor, batch_size
+        documents per round trip, in timestamp order. Only the fields the chosen metrics are read from are
+        requested. Delta documents are rebuilt from their snapshot, with the latest snapshot of each gateway kept in
+        memory, so memory does not grow with the number of documents.
+
+        Large ranges can be read in parallel time slices, each with its own cursor and output file.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, collection, metrics: list = None, raw: bool = False, fields: list = None,
+                 batch_size: int = 1000, meta_field: str = "gateway_id"):
+        """
+            :param collection: pymongo Collection, The results collection.
+            :param metrics: list, Metric names to export, all of the metric map by default.
+            :param raw: bool, Export whole documents instead of flat records, for the ndjson format.
+            :param fields: list, Top level fields of the raw documents, all by default.
+            :param batch_size: int, Documents the cursor fetches per round trip.
+            :param meta_field: str, The field gateways are told apart by.
+        """
+        self.collection = collection
+        self.raw = raw
+        self.fields = fields
+        self.batch_size = batch_size
+        self.meta_field = meta_field
+        if metrics:
+            unknown = set(metrics) - set(metric_extractor.names)
+            if unknown:
+                raise ValueError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+            self.extractor = MetricExtractor([m for m in metric_extractor.metrics if m.name in metrics])
+        else:
+            self.extractor = metric_extractor
+        self.names = ["timestamp", "gateway_id", "gateway_check"] + self.extractor.names
+
+    def projection(self) -> dict:
+        """
+        :return: dict, The fields read from the server, or None for whole documents.
+        """
+        if self.raw:
+            if not self.fields:
+                return None
+            sources = set(self.fields) | {"timestamp", self.meta_field}
+        else:
+            sources = {"timestamp", self.meta_field, "gateway_check"}
+            sources.update(keys[0] for metric in self.extractor.metrics for keys in metric.paths)
+        projection = {field: 1 for field in sources}
+        projection.update({field: 1 for field in _DELTA_FIELDS})
+        projection.update({f"delta.{field}": 1 for field in RAW_FIELDS if field in sources})
+        return projection
+
+    def query(self, start: datetime = None, end: datetime = None, gateway_id: str = None) -> dict:
+        """
+        :return: dict, The filter of documents from start, inclusive, to end, exclusive.
+        """
+        query = {}
+        if start is not None or end is not None:
+            query["timestamp"] = {}
+            if start is not None:
+                query["timestamp"]["$gte"] = start
+            if end is not None:
+                query["timestamp"]["$lt"] = end
+        if gateway_id is not None:
+            query[self.meta_field] = gateway_id
+        return query
+
+    def time_bounds(self, gateway_id: str = None) -> tuple:
+        """
+        :return: tuple, (first timestamp, last timestamp) of the stored results, or (None, None) when there are none.
+        """
+        query = self.query(gateway_id=gateway_id)
+        first = self.collection.find_one(query, {"timestamp": 1}, sort=[("timestamp", ASCENDING)])
+        last = self.collection.find_one(query, {"timestamp": 1}, sort=[("timestamp", DESCENDING)])
+        if first is None or last is None:
+            return None, None
+        return self._utc(first["timestamp"]), self._utc(last["timestamp"])
+
+    @staticmethod
+    def _utc(timestamp):
+        # pymongo returns naive UTC datetimes.
+        if isinstance(timestamp, datetime) and timestamp.tzinfo is None:
+            return timestamp.replace(tzinfo=timezone.utc)
+        return timestamp
+
+    @staticmethod
+    def slices(start: datetime, end: datetime, count: int) -> list:
+        """
+        Splits [start, end) into count ranges of equal length.
+        """
+        step = (end - start) / count
+        bounds = [start + step * index for index in range(count)] + [end]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def documents(self, start: datetime = None, end: datetime = None, gateway_id: str = None):
+        """
+        Yields the documents of the range, delta documents rebuilt.
+        """
+        projection = self.projection()
+        snapshots = {}
+        cursor = self.collection.find(self.query(start, end, gateway_id), projection,
+                                      sort=[("timestamp", ASCENDING)], batch_size=self.batch_size)
+        for document in cursor:
+            storage = document.get("storage")
+            if storage == "snapshot":
+                snapshots[document.get(self.meta_field)] = document
+            elif storage == "delta":
+                document = DeltaEncoder.decode(document, self._snapshot(document, snapshots, projection))
+                if projection is not None:
+                    # decode fills in every raw field, drop the ones that were not asked for.
+                    for field in RAW_FIELDS:
+                        if field not in projection:
+                            document.pop(field, None)
+            yield document
+
+    def _snapshot(self, document: dict, snapshots: dict, projection: dict) -> dict:
+        gateway_id = document.get(self.meta_field)
+        snapshot = snapshots.get(gateway_id)
+        if snapshot is None or snapshot.get("_id") != document["snapshot_id"]:
+            # The snapshot is before the range, or this cursor started after it.
+            snapshot = self.collection.find_one({self.meta_field: gateway_id,
+                                                 "timestamp": document["snapshot_timestamp"],
+                                                 "_id": document["snapshot_id"]}, projection)
+            if snapshot is None:
+                raise LookupError(f"Snapshot {document['snapshot_id']} of {document['_id']} is missing.")
+            snapshots[gateway_id] = snapshot
+        return snapshot
+
+    def record(self, document: dict) -> list:
+        """
+        :return: list, The flat record of a document, in the order of names.
+        """
+        return [self._utc(document.get("timestamp")), document.get(self.meta_field), document.get("gateway_check"),
+                *self.extractor.extract_values(document)]
+
+    def export(self, writer, start: datetime = None, end: datetime = None, gateway_id: str = None) -> int:
+        """
+        Streams the range into writer and closes it.
+
+        :return: int, The number of documents written.
+        """
+        written = 0
+        try:
+            for document in self.documents(start, end, gateway_id):
+                if self.raw:
+                    document["timestamp"] = self._utc(document.get("timestamp"))
+                    writer.write(document)
+                else:
+                    writer.write(self.record(document))
+                written += 1
+        finally:
+            writer.close()
+        return written
+
+    def writer(self, export_format: str, stream=None, file_path: str = None):
+        """
+        :param stream: A text stream for the csv and ndjson formats.
+        :param file_path: str, The file the parquet format writes to.
+        """
+        writer_class = EXPORT_FORMATS[export_format][0]
+        if writer_class is ParquetExportWriter:
+            if self.raw:
+                raise ValueError("Whole documents can only be exported as ndjson.")
+            return ParquetExportWriter(file_path, self.names, self.extractor.types, row_group_size=self.batch_size)
+        if writer_class is CsvExportWriter:
+            if self.raw:
+                raise ValueError("Whole documents can only be exported as ndjson.")
+            return CsvExportWriter(stream, self.names)
+        return NdjsonExportWriter(stream, None if self.raw else self.names)
+
+    def export_files(self, export_format: str, out_path: str, start: datetime = None, end: datetime = None,
+                     gateway_id: str = None, workers: int = 1) -> dict:
+        """
+        Exports the range to files. With more than one worker the range is split into that many time slices, read
+        in parallel, each into <out_path stem>.part-<n><extension>.
+
+        :return: dict, {file path: documents written}
+        """
+        if workers <= 1:
+            return {out_path: self._export_file(export_format, out_path, start, end, gateway_id)}
+
+        if start is None or end is None:
+            first, last = self.time_bounds(gateway_id)
+            if first is None:
+                return {}
+            start = start or first
+            # end is exclusive, the last document has to be inside the final slice.
+            end = end or last + timedelta(milliseconds=1)
+
+        stem, extension = path.splitext(out_path)
+        extension = extension or EXPORT_FORMATS[export_format][1]
+        parts = {f"{stem}.part-{index:03d}{extension}": bounds
+                 for index, bounds in enumerate(self.slices(start, end, workers))}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export") as executor:
+            futures = {part: executor.submit(self._export_file, export_format, part, *bounds, gateway_id)
+                       for part, bounds in parts.items()}
+            return {part: future.result() for part, future in futures.items()}
+
+    def _export_file(self, export_format: str, file_path: str, start, end, gateway_id) -> int:
+        if export_format == "parquet":
+            written = self.export(self.writer(export_format, file_path=file_path), start, end, gateway_id)
+        else:
+            with open(file_path, "w", newline="", encoding="utf-8") as stream:
+                written = self.export(self.writer(export_format, stream=stream), start, end, gateway_id)
+        self.log.info(f"Exported {written} documents to {file_path}.")
+        return written
@@ -1,7 +1,7 @@
 from datetime import datetime
 from bson import ObjectId
 from pydantic import BaseModel, Field, StrictBool
-from pydantic.typing import Optional
+from pydantic.typing import Optional, List
 
 
 class ResultsSchema(BaseModel):
@@ -9,10 +9,15 @@ class ResultsSchema(BaseModel):
     """
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     container_id: str
+    gateway_id: Optional[str] = None
     gateway_check: StrictBool
     radio_raw_data: Optional[dict] = None
     interface_data_raw: Optional[dict] = None
     lan_status_raw: Optional[dict] = None
+    endpoint_errors: Optional[dict] = None
+    cached_endpoints: Optional[List[str]] = None
+    rates: Optional[dict] = None
+    timings: Optional[dict] = None
 
     class Config:
         arbitrary_types_allowed = True
@@ -20,4 +25,27 @@ class ResultsSchema(BaseModel):
         extra = "allow"
         json_encoders = {
             ObjectId: str
-        }
\ No newline at end of file
+        }
+
+    @classmethod
+    def trusted_document(cls, data: dict) -> dict:
+        """
+        The document ResultsSchema(**data).dict(by_alias=True) would return, for results that come straight from the
+        collector. Only the required fields are checked, missing fields get their defaults, and the raw payloads are
+        shared with data instead of being validated and copied.
+
+        :raises ValueError: When a required field is missing or has the wrong type.
+        """
+        if not isinstance(data.get("container_id"), str):
+            raise ValueError(f"container_id is {type(data.get('container_id'))}, and should be {str}")
+        if not isinstance(data.get("gateway_check"), bool):
+            raise ValueError(f"gateway_check is {type(data.get('gateway_check'))}, and should be {bool}")
+
+        document = {}
+        for name, field in cls.__fields__.items():
+            value = data.get(name)
+            document[field.alias] = field.get_default() if value is None else value
+        for name, value in data.items():
+            if name not in document:
+                document[name] = value
+        return document
\ No newline at end of file
@@ -0,0 +1,52 @@
+from importlib import import_module
+from logging import getLogger
+from app.models.config_model import TransportEnum
+
+__all__ = ['TRANSPORTS', 'register_transport', 'load_transport', 'create_transport']
+
+log = getLogger(__name__)
+
+# TransportEnum to the module and class of its backend. A backend module is only imported once it is selected, so
+# a CSV deployment never loads pymongo.
+TRANSPORTS = {
+    TransportEnum.csv: ("app.transport.csv", "CsvTransport"),
+    TransportEnum.sql: ("app.transport.sql", "SqliteTransport"),
+    TransportEnum.mongodb: ("app.transport.mongodb", "MongoTransport"),
+}
+
+
+def register_transport(transport, module: str, class_name: str) -> None:
+    """
+    Adds or replaces the backend of a transport. The class needs from_config(config), add_data(data) and close().
+
+    :param transport: TransportEnum or its value.
+    :param module: str, Dotted path of the module the class is in.
+    :param class_name: str, The transport class.
+    """
+    TRANSPORTS[TransportEnum(transport)] = (module, class_name)
+
+
+def load_transport(transport):
+    """
+    Imports the backend of a transport.
+
+    :param transport: TransportEnum or its value.
+    :return: The transport class, or None when the transport has no backend.
+    """
+    backend = TRANSPORTS.get(TransportEnum(transport))
+    if backend is None:
+        return None
+    module, class_name = backend
+    return getattr(import_module(module), class_name)
+
+
+def create_transport(transport, config):
+    """
+    :param transport: TransportEnum or its value.
+    :return: A transport set up from config, or None when the transport has no backend.
+    """
+    transport_class = load_transport(transport)
+    if transport_class is None:
+        log.warning(f"Transport {TransportEnum(transport).value} has no backend, results are not stored.")
+        return None
+    return transport_class.from_config(config)
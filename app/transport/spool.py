@@ -0,0 +1,341 @@
+import struct
+from os import path, makedirs, listdir, remove, replace, fsync
+from zlib import crc32
+from time import monotonic, sleep
+from threading import Thread, Lock, Event
+from logging import getLogger, Logger
+from bson import encode, decode, ObjectId
+from bson.codec_options import CodecOptions
+
+__all__ = ['Spool', 'SpoolFull', 'SpooledTransport']
+
+# Record header: payload length, crc32 of sequence + payload, sequence number.
+HEADER = struct.Struct("<IIQ")
+CODEC_OPTIONS = CodecOptions(tz_aware=True)
+
+
+class SpoolFull(Exception):
+    """
+    Raised when a record would take the spool past its disk quota. The record is not stored.
+    """
+
+
+class Spool:
+    """
+        Spool is an append-only, segmented write-ahead log of result documents on local disk. Every record carries a
+        sequence number and a checksum. The sequence of the last record handed over to the real transport is kept
+        in an ack file, so after a restart replay starts right after it, and segments that are fully acknowledged are
+        deleted. A record torn by a crash is cut off when the spool is opened.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, spool_path: str, segment_bytes: int = 16 * 1024 * 1024, quota_bytes: int = 1024 ** 3,
+                 fsync_policy: str = "interval", fsync_interval: float = 1.0):
+        """
+            :param spool_path: str, The directory segments are written to.
+            :param segment_bytes: int, Start a new segment once the current one reaches this size.
+            :param quota_bytes: int, The most disk space all segments together may use.
+            :param fsync_policy: str, "always" fsyncs every record before append returns, "interval" at most once
+                per fsync_interval seconds, "never" leaves it to the operating system.
+            :param fsync_interval: float, Seconds between fsyncs for the interval policy.
+        """
+        if fsync_policy not in ("always", "interval", "never"):
+            raise ValueError(f"Unknown fsync_policy: {fsync_policy}")
+
+        self.spool_path = path.abspath(spool_path)
+        self.segment_bytes = segment_bytes
+        self.quota_bytes = quota_bytes
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self._lock = Lock()
+        self._file = None
+        self._last_fsync = monotonic()
+        # {sequence: (segment, end offset)} of the records the last read returned, and (sequence, segment, end
+        # offset) of the acknowledged record when it is one of them, so the next read seeks past it.
+        self._read_ends = {}
+        self._position = None
+
+        makedirs(self.spool_path, exist_ok=True)
+        self.acked = self._read_ack()
+        self._segments = self._recover()
+        self.next_sequence = max(self._last_sequence + 1, self.acked + 1)
+
+    @classmethod
+    def from_config(cls, config, name: str = None):
+        """
+            :param name: str, Gives the spool its own directory, for one spool per transport.
+        """
+        spool_path = path.join(config.log_path, "spool")
+        return cls(
+            spool_path=path.join(spool_path, name) if name else spool_path,
+            segment_bytes=config.spool_segment_bytes,
+            quota_bytes=config.spool_quota_bytes,
+            fsync_policy=config.spool_fsync,
+            fsync_interval=config.spool_fsync_interval
+        )
+
+    def _ack_path(self) -> str:
+        return path.join(self.spool_path, "ack")
+
+    def _read_ack(self) -> int:
+        try:
+            with open(self._ack_path(), "r") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _segment_path(self, first_sequence: int) -> str:
+        return path.join(self.spool_path, f"segment-{first_sequence:020d}.log")
+
+    def _recover(self) -> list:
+        """
+        Lists the segments on disk and cuts a torn record off the end of the newest one.
+        :return: list, [first sequence, size in bytes] per segment, oldest first.
+        """
+        segments = sorted(int(name[8:28]) for name in listdir(self.spool_path)
+                          if name.startswith("segment-") and name.endswith(".log"))
+        self._last_sequence = 0
+        recovered = []
+        for first_sequence in segments:
+            good_bytes = 0
+            for sequence, _, end in self._scan(self._segment_path(first_sequence)):
+                self._last_sequence = sequence
+                good_bytes = end
+            if good_bytes < path.getsize(self._segment_path(first_sequence)):
+                self.log.warning(f"Cutting a torn record off spool segment {first_sequence}.")
+                with open(self._segment_path(first_sequence), "r+b") as f:
+                    f.truncate(good_bytes)
+            recovered.append([first_sequence, good_bytes])
+        return recovered
+
+    @staticmethod
+    def _scan(segment: str, offset: int = 0):
+        """
+        Yields (sequence, payload, end offset) for every intact record of a segment from offset on, stopping at the
+        first bad one.
+        """
+        with open(segment, "rb") as f:
+            f.seek(offset)
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    return
+                length, checksum, sequence = HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or crc32(payload, crc32(header[8:])) != checksum:
+                    return
+                offset += HEADER.size + length
+                yield sequence, payload, offset
+
+    def disk_bytes(self) -> int:
+        return sum(size for _, size in self._segments)
+
+    def pending(self) -> int:
+        """
+        :return: int, Records spooled but not acknowledged yet.
+        """
+        return self.next_sequence - 1 - self.acked
+
+    def append(self, document: dict) -> int:
+        """
+        Adds a document to the spool. Once this returns, the document survives a restart, subject to the fsync
+        policy.
+        :return: int, The sequence number of the record.
+        :exception: SpoolFull: When the record would exceed the disk quota.
+        """
+        payload = encode(document)
+        with self._lock:
+            record_bytes = HEADER.size + len(payload)
+            if self.disk_bytes() + record_bytes > self.quota_bytes:
+                raise SpoolFull(f"Spool quota of {self.quota_bytes} bytes reached, {self.pending()} records pending.")
+
+            if not self._segments or self._segments[-1][1] + record_bytes > self.segment_bytes:
+                self._open_segment(self.next_sequence)
+            elif self._file is None:
+                self._file = open(self._segment_path(self._segments[-1][0]), "ab")
+
+            sequence = self.next_sequence
+            sequence_bytes = struct.pack("<Q", sequence)
+            self._file.write(HEADER.pack(len(payload), crc32(payload, crc32(sequence_bytes)), sequence) + payload)
+            self._file.flush()
+            self._segments[-1][1] += record_bytes
+            self.next_sequence += 1
+
+            if self.fsync_policy == "always" or \
+                    (self.fsync_policy == "interval" and monotonic() - self._last_fsync >= self.fsync_interval):
+                fsync(self._file.fileno())
+                self._last_fsync = monotonic()
+        return sequence
+
+    def _open_segment(self, first_sequence: int) -> None:
+        if self._file is not None:
+            fsync(self._file.fileno())
+            self._file.close()
+        self._file = open(self._segment_path(first_sequence), "ab")
+        self._segments.append([first_sequence, 0])
+
+    def read(self, limit: int) -> list:
+        """
+        :return: list, Up to limit (sequence, document) pairs after the acknowledged sequence, oldest first.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            segments = [first for first, _ in self._segments]
+
+        # Start right after the acknowledged record when the last read returned it, instead of scanning its
+        # segment from the start again.
+        position = self._position if self._position is not None and self._position[0] == self.acked else None
+        self._read_ends = {}
+        records = []
+        for index, first_sequence in enumerate(segments):
+            # Skip segments whose records are all acknowledged.
+            if index + 1 < len(segments) and segments[index + 1] <= self.acked + 1:
+                continue
+            if position is not None and first_sequence < position[1]:
+                continue
+            offset = position[2] if position is not None and first_sequence == position[1] else 0
+            for sequence, payload, end in self._scan(self._segment_path(first_sequence), offset):
+                if sequence <= self.acked:
+                    continue
+                records.append((sequence, decode(payload, codec_options=CODEC_OPTIONS)))
+                self._read_ends[sequence] = (first_sequence, end)
+                if len(records) >= limit:
+                    return records
+        return records
+
+    def ack(self, sequence: int) -> None:
+        """
+        Marks every record up to sequence as delivered and deletes segments that hold nothing newer.
+        """
+        temp_path = self._ack_path() + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(str(sequence))
+            f.flush()
+            fsync(f.fileno())
+        replace(temp_path, self._ack_path())
+
+        with self._lock:
+            self.acked = sequence
+            end = self._read_ends.get(sequence)
+            self._position = (sequence, *end) if end is not None else None
+            while len(self._segments) > 1 and self._segments[1][0] <= sequence + 1:
+                remove(self._segment_path(self._segments.pop(0)[0]))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+
+class SpooledTransport:
+    """
+        SpooledTransport puts a Spool in front of a real transport. add_data only appends to the local spool, a
+        background thread replays the spool to the transport in large batches and acknowledges each batch once it
+        has been written, after flushing transports that buffer. While the transport is down records wait on disk
+        and the thread retries, so neither a slow nor an unreachable database holds up the polling loop.
+    """
+    log: Logger = getLogger(__name__)
+
+    def __init__(self, transport, spool: Spool, replay_batch: int = 1000, retry_interval: float = 5.0):
+        """
+            :param transport: object, The real transport. add_many(documents) is used when it has one, otherwise
+                add_data is called per document, and flush() before the ack when it has one. missing_documents(
+                documents) is used, when present, to drop documents a crash or a failed replay left written but not
+                acknowledged.
+            :param spool: Spool, Where results wait for the transport.
+            :param replay_batch: int, The most records handed to the transport at once.
+            :param retry_interval: float, Seconds to wait after the transport failed.
+        """
+        self.transport = transport
+        self.spool = spool
+        self.replay_batch = replay_batch
+        self.retry_interval = retry_interval
+        self.replayed = 0
+        self.failures = 0
+
+        self._wake = Event()
+        self._stopping = Event()
+        # The first batch after a start, or after a failed replay, may already be in the database, partly or
+        # whole, the ack is only written after the insert.
+        self._in_doubt = spool.pending() > 0
+        self._thread = Thread(target=self._run, name="tcm-spool-replay", daemon=True)
+        self._thread.start()
+
+    def add_data(self, data: dict) -> bool:
+        """
+        Spools a result. A stable _id is added first, so the transport can recognise a record it already holds.
+        """
+        if not isinstance(data, dict):
+            raise TypeError(f"data is type({ type(data) }), and should be type({type(dict())})")
+        data.setdefault("_id", ObjectId())
+        self.spool.append(data)
+        self._wake.set()
+        return True
+
+    def replay(self) -> int:
+        """
+        Hands one batch of spooled records to the transport.
+        :return: int, The number of records acknowledged.
+        """
+        records = self.spool.read(self.replay_batch)
+        if not records:
+            return 0
+
+        documents = [document for _, document in records]
+        if self._in_doubt and hasattr(self.transport, "missing_documents"):
+            documents = self.transport.missing_documents(documents)
+        if documents:
+            if hasattr(self.transport, "add_many"):
+                self.transport.add_many(documents)
+            else:
+                for document in documents:
+                    self.transport.add_data(document)
+        # A buffering transport has only queued the batch so far, it is not acknowledged before it is written.
+        if hasattr(self.transport, "flush"):
+            self.transport.flush()
+
+        self._in_doubt = False
+        self.spool.ack(records[-1][0])
+        self.replayed += len(records)
+        return len(records)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                replayed = self.replay()
+            except Exception as err:
+                self.failures += 1
+                self._in_doubt = True
+                self.log.critical(f"Spool replay failed, {self.spool.pending()} records waiting: {str(err)}")
+                self._stopping.wait(self.retry_interval)
+                continue
+            if not replayed:
+                self._wake.wait(self.retry_interval)
+                self._wake.clear()
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.spool.pending(),
+            "disk_bytes": self.spool.disk_bytes(),
+            "replayed": self.replayed,
+            "failures": self.failures
+        }
+
+    def close(self, timeout: float = 10) -> None:
+        """
+        Gives the replay thread up to timeout seconds to drain the spool, then stops it. Anything left stays spooled
+        for the next start.
+        """
+        deadline = monotonic() + timeout
+        while self.spool.pending() and monotonic() < deadline and self._thread.is_alive():
+            self._wake.set()
+            sleep(0.05)
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self.spool.close()
+        if hasattr(self.transport, "close"):
+            self.transport.close()
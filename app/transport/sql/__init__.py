@@ -0,0 +1,3 @@
+from .sqlite_transport import SqliteTransport
+
+__all__ = ['SqliteTransport']
@@ -0,0 +1,372 @@
+import json
+import sqlite3
+from os import path, makedirs
+from time import monotonic
+from threading import Lock
+from datetime import datetime, timezone
+from logging import getLogger, Logger
+from app.models.metric_map import metric_extractor
+from app.functions.cell_tracker import dwell_by_value
+from app.transport.flush_timer import FlushTimer
+
+__all__ = ['SqliteTransport']
+
+# Typed columns of the results table, one per metric of the shared metric map.
+SQL_TYPES = {int: "INTEGER", float: "REAL", str: "TEXT"}
+
+RAW_FIELDS = ["radio_raw_data", "interface_data_raw", "lan_status_raw", "endpoint_errors"]
+
+
+class SqliteTransport:
+    """
+    Stores results in an embedded SQLite database in WAL mode. The flat record from the shared metric map goes
+    into typed columns of the results table, indexed by time, and the raw gateway payloads go into the raw_results
+    side table as JSON. Rows are buffered and written with executemany inside one transaction per batch, once the
+    batch is full or, checked by a FlushTimer, once its oldest row is batch_age seconds old. A batch stays buffered
+    until its transaction has committed.
+    """
+    log: Logger = getLogger(__name__)
+    results_columns = ["id", "timestamp", "gateway_id", "gateway_check"] + metric_extractor.names + ["document_id"]
+
+    def __init__(self, sql_path: str = "./results/trashcan_results.sqlite3", batch_size: int = 100,
+                 batch_age: float = 5.0, store_raw: bool = True, retention: dict = None, prune_interval: float = 3600):
+        """
+            :param sql_path: str, The SQLite database file.
+            :param batch_size: int, Write buffered results once this many are waiting.
+            :param batch_age: float, Write buffered results once the oldest is this many seconds old.
+            :param store_raw: bool, Keep the raw gateway payloads in raw_results.
+            :param retention: dict, {"raw" or a rollup level: seconds to keep, None keeps forever}.
+            :param prune_interval: float, Seconds between deletes of expired rows.
+        """
+        self.sql_path = path.abspath(sql_path)
+        self.batch_size = batch_size
+        self.batch_age = batch_age
+        self.store_raw = store_raw
+        self.retention = {key: seconds for key, seconds in (retention or {}).items() if seconds}
+        self.prune_interval = prune_interval
+        self.rows_written = 0
+        self._last_prune = None
+
+        self._results = []
+        self._raw = []
+        self._buffered_ids = set()
+        self._buffered_since = None
+        self._lock = Lock()
+
+        makedirs(path.dirname(self.sql_path), exist_ok=True)
+        self.connection = sqlite3.connect(self.sql_path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.create_tables()
+        self._next_id = self.connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM results").fetchone()[0]
+        self._timer = FlushTimer(self.flush_due, batch_age, name="tcm-sqlite-flush") if batch_age else None
+
+        placeholders = ", ".join("?" * len(self.results_columns))
+        self._insert_results = f"INSERT INTO results ({', '.join(self.results_columns)}) VALUES ({placeholders})"
+        self._insert_raw = f"INSERT INTO raw_results (result_id, {', '.join(RAW_FIELDS)}) VALUES (?, ?, ?, ?, ?)"
+        self._upsert_rollup = """
+            INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (level, gateway_id, bucket_start, metric) DO UPDATE SET
+                "min" = min(rollups."min", excluded."min"),
+                "max" = max(rollups."max", excluded."max"),
+                mean = (rollups.mean * rollups.count + excluded.mean * excluded.count)
+                       / (rollups.count + excluded.count),
+                count = rollups.count + excluded.count,
+                last = excluded.last,
+                p50 = excluded.p50,
+                p95 = excluded.p95,
+                p99 = excluded.p99
+        """
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            sql_path=config.sql_path,
+            batch_size=config.sql_batch_size,
+            batch_age=config.sql_batch_age,
+            store_raw=config.sql_store_raw,
+            retention={level: config.retention_seconds(level) for level in ("raw", "minute", "hour", "day")}
+        )
+
+    def create_tables(self) -> None:
+        metric_columns = "".join(f",\n    {metric.name} {SQL_TYPES[metric.type]}"
+                                 for metric in metric_extractor.metrics)
+        self.connection.executescript(f"""
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY,
+                timestamp REAL NOT NULL,
+                gateway_id TEXT,
+                gateway_check INTEGER NOT NULL{metric_columns},
+                document_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS results_timestamp ON results (timestamp);
+            CREATE INDEX IF NOT EXISTS results_gateway_timestamp ON results (gateway_id, timestamp);
+            CREATE TABLE IF NOT EXISTS raw_results (
+                result_id INTEGER PRIMARY KEY REFERENCES results (id),
+                radio_raw_data TEXT,
+                interface_data_raw TEXT,
+                lan_status_raw TEXT,
+                endpoint_errors TEXT
+            );
+            CREATE TABLE IF NOT EXISTS rollups (
+                level TEXT NOT NULL,
+                gateway_id TEXT NOT NULL,
+                bucket_start REAL NOT NULL,
+                metric TEXT NOT NULL,
+                "min" REAL,
+                "max" REAL,
+                mean REAL,
+                count INTEGER,
+                last REAL,
+                p50 REAL,
+                p95 REAL,
+                p99 REAL,
+                PRIMARY KEY (level, gateway_id, bucket_start, metric)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS events (
+                event_id TEXT PRIMARY KEY,
+                gateway_id TEXT,
+                kind TEXT NOT NULL,
+                metric TEXT,
+                start REAL NOT NULL,
+                "end" REAL,
+                duration_seconds REAL,
+                details TEXT
+            );
+            CREATE INDEX IF NOT EXISTS events_gateway_start ON events (gateway_id, start);
+            CREATE INDEX IF NOT EXISTS events_kind_start ON events (kind, start);
+            CREATE TABLE IF NOT EXISTS cell_changes (
+                gateway_id TEXT,
+                technology TEXT NOT NULL,
+                field TEXT NOT NULL,
+                old_value,
+                new_value,
+                changed_at REAL NOT NULL,
+                dwell_seconds REAL
+            );
+            CREATE INDEX IF NOT EXISTS cell_changes_lookup ON cell_changes (gateway_id, technology, field, changed_at);
+        """)
+
+        # Metrics added to the metric map after the table was created become new columns.
+        existing = {row[1] for row in self.connection.execute("PRAGMA table_info(results)")}
+        for metric in metric_extractor.metrics:
+            if metric.name not in existing:
+                self.connection.execute(f"ALTER TABLE results ADD COLUMN {metric.name} {SQL_TYPES[metric.type]}")
+        # The _id a SpooledTransport gives each result, to recognise results that are already stored.
+        if "document_id" not in existing:
+            self.connection.execute("ALTER TABLE results ADD COLUMN document_id TEXT")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_document_id ON results (document_id)")
+
+    def add_data(self, data: dict) -> bool:
+        """
+        Buffers one result from TrashcanMonitor.start_test, the batch is written once it is full or old enough.
+        """
+        if not isinstance(data, dict):
+            raise TypeError(f"data is type({ type(data) }), and should be type({type(dict())})")
+
+        timestamp = data.get("timestamp") or datetime.now(timezone.utc)
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+
+        document_id = str(data["_id"]) if data.get("_id") is not None else None
+        with self._lock:
+            result_id = self._next_id
+            self._next_id += 1
+            self._results.append((result_id, timestamp.timestamp(), data.get("gateway_id"),
+                                  bool(data.get("gateway_check")), *metric_extractor.extract_values(data),
+                                  document_id))
+            if document_id is not None:
+                self._buffered_ids.add(document_id)
+            if self.store_raw:
+                self._raw.append([result_id] + [json.dumps(data[field]) if data.get(field) is not None else None
+                                                for field in RAW_FIELDS])
+            if self._buffered_since is None:
+                self._buffered_since = monotonic()
+
+            if len(self._results) >= self.batch_size or monotonic() - self._buffered_since >= self.batch_age:
+                self._flush()
+        return True
+
+    def missing_documents(self, documents: list) -> list:
+        """
+        Returns the documents whose _id is neither stored nor buffered yet, so a SpooledTransport can send a batch
+        again after a crash or a failed flush without writing it twice.
+        """
+        ids = [str(document["_id"]) for document in documents if document.get("_id") is not None]
+        with self._lock:
+            held = self._buffered_ids & set(ids)
+            # Well below SQLite's limit on the number of parameters.
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                held.update(row[0] for row in self.connection.execute(
+                    f"SELECT document_id FROM results WHERE document_id IN ({', '.join('?' * len(chunk))})", chunk))
+        return [document for document in documents
+                if document.get("_id") is None or str(document["_id"]) not in held]
+
+    def add_rollups(self, level: str, documents: list) -> None:
+        """
+        Writes closed rollup buckets from the RollupEngine, one row per metric. A bucket written twice, e.g. around
+        a restart, is merged: counts add up, min, max and mean combine, last and the percentiles take the newer row.
+        """
+        rows = []
+        for document in documents:
+            bucket_start = document["bucket_start"].timestamp()
+            gateway_id = document.get("gateway_id") or ""
+            for metric, aggregate in document["metrics"].items():
+                rows.append((level, gateway_id, bucket_start, metric, aggregate["min"], aggregate["max"],
+                             aggregate["mean"], aggregate["count"], aggregate["last"], aggregate.get("p50"),
+                             aggregate.get("p95"), aggregate.get("p99")))
+
+        with self._lock:
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.executemany(self._upsert_rollup, rows)
+
+    def add_events(self, documents: list) -> None:
+        """
+        Writes events from the EventDetector. An event that ends replaces the row written when it started.
+        """
+        rows = []
+        for document in documents:
+            details = {key: value for key, value in document.items()
+                       if key not in ("event_id", "gateway_id", "kind", "metric", "start", "end", "duration_seconds")}
+            rows.append((document["event_id"], document.get("gateway_id"), document["kind"], document.get("metric"),
+                         document["start"].timestamp(), document["end"].timestamp() if document.get("end") else None,
+                         document.get("duration_seconds"), json.dumps(details) if details else None))
+
+        with self._lock:
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def events(self, gateway_id: str = None, kind: str = None, since: float = None) -> list:
+        """
+        :param since: float, Epoch seconds, events that were still open at or started after since.
+        :return: list, Event rows as dicts, oldest first.
+        """
+        conditions = []
+        parameters = []
+        for column, value in (("gateway_id", gateway_id), ("kind", kind)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        if since is not None:
+            conditions.append('(start >= ? OR "end" IS NULL OR "end" >= ?)')
+            parameters += [since, since]
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            cursor = self.connection.execute(f"SELECT * FROM events{where} ORDER BY start", parameters)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        for row in rows:
+            row["details"] = json.loads(row["details"]) if row["details"] else {}
+        return rows
+
+    def add_cell_changes(self, documents: list) -> None:
+        """
+        Writes change records from the CellChangeTracker. Cell ids and channels stay integers, bands text.
+        """
+        rows = [(document.get("gateway_id"), document["technology"], document["field"], document.get("old_value"),
+                 document["new_value"], document["changed_at"].timestamp(), document.get("dwell_seconds"))
+                for document in documents]
+        with self._lock:
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.executemany("INSERT INTO cell_changes VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def cell_dwell(self, gateway_id: str, since: float, until: float = None, technology: str = "5g",
+                   field: str = "cell") -> dict:
+        """
+        How long the gateway spent on each cell, band or channel between since and until, from the cell_changes
+        index alone.
+
+        :param since: float, Epoch seconds.
+        :param until: float, Epoch seconds, now by default.
+        :return: dict, {value: seconds}
+        """
+        until = until if until is not None else datetime.now(timezone.utc).timestamp()
+        with self._lock:
+            rows = self.connection.execute("""
+                SELECT changed_at, new_value FROM cell_changes
+                WHERE gateway_id IS ? AND technology = ? AND field = ? AND changed_at < ? AND changed_at >= COALESCE(
+                    (SELECT MAX(changed_at) FROM cell_changes
+                     WHERE gateway_id IS ? AND technology = ? AND field = ? AND changed_at <= ?), ?)
+                ORDER BY changed_at
+            """, (gateway_id, technology, field, until, gateway_id, technology, field, since, since)).fetchall()
+        return dwell_by_value([{"changed_at": row[0], "new_value": row[1]} for row in rows], since, until)
+
+    def prune(self, now: float = None) -> None:
+        """
+        Deletes raw results and rollups older than their retention.
+        """
+        with self._lock:
+            self._prune(now if now is not None else datetime.now(timezone.utc).timestamp())
+
+    def _prune(self, now: float) -> None:
+        with self.connection:
+            self.connection.execute("BEGIN")
+            if "raw" in self.retention:
+                cutoff = now - self.retention["raw"]
+                self.connection.execute("DELETE FROM raw_results WHERE result_id IN "
+                                        "(SELECT id FROM results WHERE timestamp < ?)", (cutoff,))
+                self.connection.execute("DELETE FROM results WHERE timestamp < ?", (cutoff,))
+            for level, seconds in self.retention.items():
+                if level != "raw":
+                    self.connection.execute("DELETE FROM rollups WHERE level = ? AND bucket_start < ?",
+                                            (level, now - seconds))
+        self._last_prune = monotonic()
+
+    def flush_due(self):
+        """
+        Writes the buffered results once the oldest is batch_age seconds old, called by the FlushTimer.
+
+        :return: float, Seconds until the buffered results are due, or None when nothing is buffered.
+        """
+        with self._lock:
+            if self._buffered_since is None:
+                return None
+            remaining = self.batch_age - (monotonic() - self._buffered_since)
+            if remaining > 0:
+                return remaining
+            self._flush()
+            return None
+
+    def flush(self) -> None:
+        """
+        Writes every buffered result in one transaction.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._results:
+            return
+
+        try:
+            self.connection.execute("BEGIN")
+            self.connection.executemany(self._insert_results, self._results)
+            if self._raw:
+                self.connection.executemany(self._insert_raw, self._raw)
+            self.connection.execute("COMMIT")
+        except Exception as err:
+            if self.connection.in_transaction:
+                self.connection.execute("ROLLBACK")
+            # The batch stays buffered and goes out with the next flush.
+            self.log.critical(f"Writing {len(self._results)} results to {self.sql_path} failed: {str(err)}")
+            raise Exception(err)
+
+        self.rows_written += len(self._results)
+        self.log.debug(f"Wrote {len(self._results)} results to {self.sql_path}.")
+        self._results = []
+        self._raw = []
+        self._buffered_ids = set()
+        self._buffered_since = None
+
+        if self.retention and (self._last_prune is None or monotonic() - self._last_prune >= self.prune_interval):
+            self._prune(datetime.now(timezone.utc).timestamp())
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.stop()
+        self.flush()
+        self.connection.close()
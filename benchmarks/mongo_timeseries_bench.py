@@ -0,0 +1,131 @@
+"""
+    Compares a plain results collection with a time-series one on a synthetic dataset.
+
+    Loads the same samples into both layouts in a scratch database, then reports storage size, index size and
+    range query latency as JSON, with the time-series figures relative to the plain ones under "comparison". Needs a
+    reachable mongod 5.0 or newer, the scratch database is dropped afterwards.
+
+    No figures have been recorded for this layout yet, the storage and latency gains it is meant to show are
+    unverified until it has been run against a real server.
+
+    python -m benchmarks.mongo_timeseries_bench --uri mongodb://localhost:27017 --samples 2000000
+"""
+import argparse
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from statistics import median
+from time import perf_counter
+from pymongo import MongoClient
+from app.transport.mongodb.collection_setup import ensure_results_collection, RESULTS_INDEXES
+
+
+def synthetic_samples(count: int, gateways: int, sleep_time: int):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    received = [0] * gateways
+    for index in range(count):
+        gateway = index % gateways
+        received[gateway] += random.randint(10_000, 5_000_000)
+        yield {
+            "timestamp": start + timedelta(seconds=(index // gateways) * sleep_time),
+            "container_id": "bench",
+            "gateway_id": f"gw{gateway:04d}",
+            "gateway_check": random.random() > 0.001,
+            "radio_raw_data": {
+                "cellular_stats": [{"BytesReceived": received[gateway], "BytesSent": received[gateway] // 8}],
+                "cell_5G_stats_cfg": [{"stat": {
+                    "SNRCurrent": random.randint(-5, 30),
+                    "RSRPCurrent": random.randint(-120, -70),
+                    "RSRQCurrent": random.randint(-20, -3),
+                    "PhysicalCellID": 100 + gateway % 7,
+                    "Band": "n71"
+                }}]
+            }
+        }
+
+
+def load(collection, count: int, gateways: int, sleep_time: int, batch_size: int = 10000) -> float:
+    started = perf_counter()
+    batch = []
+    for sample in synthetic_samples(count, gateways, sleep_time):
+        batch.append(sample)
+        if len(batch) == batch_size:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+    return perf_counter() - started
+
+
+def range_queries(collection, gateways: int, sleep_time: int, count: int, repeats: int) -> dict:
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    span = timedelta(seconds=(count // gateways) * sleep_time)
+    timings = {"gateway_day": [], "fleet_hour_avg_snr": []}
+
+    for _ in range(repeats):
+        gateway = f"gw{random.randrange(gateways):04d}"
+        day_start = start + span * random.random() * 0.9
+
+        began = perf_counter()
+        list(collection.find({"gateway_id": gateway,
+                              "timestamp": {"$gte": day_start, "$lt": day_start + timedelta(days=1)}},
+                             {"timestamp": 1, "radio_raw_data.cell_5G_stats_cfg.stat.SNRCurrent": 1}))
+        timings["gateway_day"].append(perf_counter() - began)
+
+        began = perf_counter()
+        list(collection.aggregate([
+            {"$match": {"timestamp": {"$gte": day_start, "$lt": day_start + timedelta(hours=1)}}},
+            {"$unwind": "$radio_raw_data.cell_5G_stats_cfg"},
+            {"$group": {"_id": "$gateway_id", "snr": {"$avg": "$radio_raw_data.cell_5G_stats_cfg.stat.SNRCurrent"}}}
+        ]))
+        timings["fleet_hour_avg_snr"].append(perf_counter() - began)
+
+    return {name: {"median_ms": median(values) * 1000, "max_ms": max(values) * 1000}
+            for name, values in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="tc_bench")
+    parser.add_argument("--samples", type=int, default=2_000_000)
+    parser.add_argument("--gateways", type=int, default=50)
+    parser.add_argument("--sleep-time", type=int, default=15)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    client.drop_database(args.db)
+    db = client[args.db]
+    report = {"samples": args.samples, "gateways": args.gateways}
+
+    try:
+        plain = db["plain_results"]
+        for keys in RESULTS_INDEXES:
+            plain.create_index([("gateway_id" if field == "meta" else field, order) for field, order in keys])
+        ensure_results_collection(db, "timeseries_results", granularity="seconds")
+
+        for name in ("plain_results", "timeseries_results"):
+            load_seconds = load(db[name], args.samples, args.gateways, args.sleep_time)
+            stats = db.command("collStats", name)
+            report[name] = {
+                "load_seconds": load_seconds,
+                "storage_mb": stats.get("storageSize", 0) / 2 ** 20,
+                "index_mb": stats.get("totalIndexSize", 0) / 2 ** 20,
+                "queries": range_queries(db[name], args.gateways, args.sleep_time, args.samples, args.repeats)
+            }
+    finally:
+        client.drop_database(args.db)
+
+    plain, timeseries = report["plain_results"], report["timeseries_results"]
+    report["comparison"] = {
+        "storage_ratio": timeseries["storage_mb"] / plain["storage_mb"] if plain["storage_mb"] else None,
+        "index_ratio": timeseries["index_mb"] / plain["index_mb"] if plain["index_mb"] else None,
+        "query_speedup": {name: plain["queries"][name]["median_ms"] / timings["median_ms"]
+                          for name, timings in timeseries["queries"].items() if timings["median_ms"]}
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
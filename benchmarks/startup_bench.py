@@ -0,0 +1,89 @@
+"""
+    Measures import time and resident memory at startup for each transport choice.
+
+    Every run is a fresh interpreter that imports app.main and the backend of one transport through the registry,
+    the way trashcan_monitor() starts. Import time is the median over --runs, RSS is the peak resident set size of
+    the interpreter in kB. "none" imports app.main only.
+
+    python -m benchmarks.startup_bench --runs 10
+    python -m benchmarks.startup_bench --baseline benchmarks/startup_baseline.json
+"""
+import sys
+import json
+import argparse
+import platform
+import subprocess
+from statistics import median
+from app.models.config_model import TransportEnum
+from benchmarks.throughput_bench import result, compare
+
+PROBE = """
+import sys, json, resource
+from time import perf_counter
+started = perf_counter()
+import app.main
+from app.transport.registry import load_transport
+transport = sys.argv[1]
+if transport != "none":
+    load_transport(transport)
+elapsed = perf_counter() - started
+# ru_maxrss survives exec on Linux and would report the peak of the parent, VmHWM belongs to this process only.
+try:
+    with open("/proc/self/status") as f:
+        rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+except OSError:
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"import_ms": elapsed * 1000, "rss_kb": rss_kb, "modules": len(sys.modules)}))
+"""
+
+
+def probe(transport: str) -> dict:
+    output = subprocess.run([sys.executable, "-c", PROBE, transport], capture_output=True, text=True, check=True)
+    return json.loads(output.stdout)
+
+
+def bench_transport(transport: str, runs: int) -> dict:
+    probes = [probe(transport) for _ in range(runs)]
+    return {
+        f"import_{transport}": result(median(p["import_ms"] for p in probes), "ms", higher_is_better=False,
+                                      modules=probes[-1]["modules"]),
+        f"rss_{transport}": result(max(p["rss_kb"] for p in probes), "kB", higher_is_better=False),
+    }
+
+
+def run(runs: int) -> dict:
+    benchmarks = {}
+    for transport in ["none"] + [transport.value for transport in TransportEnum]:
+        benchmarks.update(bench_transport(transport, runs))
+    return benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per transport.")
+    parser.add_argument("--baseline", default=None, help="Baseline JSON to compare with.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown, 0.25 is 25%%.")
+    parser.add_argument("--write-baseline", default=None, help="Store this run as the baseline.")
+    args = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": run(args.runs)
+    }
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            report["regressions"] = compare(report["benchmarks"], json.load(f)["benchmarks"], args.tolerance)
+
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print(json.dumps(report, indent=2))
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
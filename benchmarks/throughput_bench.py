@@ -0,0 +1,228 @@
+"""
+    Measures collection and transport throughput, and compares the numbers with a stored baseline.
+
+    Covers start_test against the local gateway simulator, decoding of the endpoint payloads, ResultsSchema
+    validation and its trusted fast path, MongoTransport.add_data
+    against a mongod when --mongo-uri is given or an in-process stand-in otherwise, and the CSV and SQLite writers.
+    Results are printed as JSON. With --baseline, any benchmark that is more than --tolerance worse than the
+    baseline is listed under "regressions" and the exit code is 1.
+
+    python -m benchmarks.throughput_bench --baseline
+    python -m benchmarks.throughput_bench --write-baseline benchmarks/baseline.json
+"""
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+from os import path
+from logging import getLogger
+from datetime import datetime, timezone
+from statistics import median
+from time import perf_counter
+from bson import encode
+from app.functions.trashcan_monitor import TrashcanMonitor
+from app.functions.rate_engine import RateEngine
+from app.functions import fast_json
+from app.transport.csv import CsvTransport
+from app.transport.sql import SqliteTransport
+from app.transport.mongodb import MongoTransport
+from app.transport.mongodb.results_schema import ResultsSchema
+from tests.gateway_sim import GatewaySimulator, load_fixtures
+
+BASELINE_PATH = path.join(path.dirname(path.abspath(__file__)), "baseline.json")
+
+
+def sample_results() -> dict:
+    """
+    One result as TrashcanMonitor.start_test returns it, built from the simulator fixtures, with rates added.
+    """
+    fixtures = load_fixtures()
+    results = {
+        "timestamp": datetime.now(timezone.utc),
+        "container_id": "bench",
+        "gateway_id": "bench",
+        "gateway_check": True,
+        "radio_raw_data": fixtures["/fastmile_radio_status_web_app.cgi"],
+        "interface_data_raw": fixtures["/statistics_status_web_app.cgi"],
+        "lan_status_raw": fixtures["/lan_status_web_app.cgi"]
+    }
+    return RateEngine().process(results)
+
+
+def result(value: float, unit: str, higher_is_better: bool = True, **extra) -> dict:
+    return dict({"value": round(value, 3), "unit": unit, "higher_is_better": higher_is_better}, **extra)
+
+
+def bench_start_test(samples: int, concurrent: bool) -> dict:
+    with GatewaySimulator() as simulator:
+        monitor = TrashcanMonitor()
+        monitor.target_gateway_url = simulator.url
+        monitor.concurrent_collection = concurrent
+        monitor.start_test()
+
+        latencies = []
+        started = perf_counter()
+        for _ in range(samples):
+            began = perf_counter()
+            monitor.start_test()
+            latencies.append(perf_counter() - began)
+        elapsed = perf_counter() - started
+    latencies.sort()
+    return result(samples / elapsed, "samples/s", p50_ms=round(median(latencies) * 1000, 3),
+                  p95_ms=round(latencies[int(len(latencies) * 0.95)] * 1000, 3))
+
+
+def bench_json_decode(documents: int) -> dict:
+    fixtures = load_fixtures()
+    payloads = [json.dumps(payload).encode() for payload in fixtures.values() if isinstance(payload, dict)]
+    started = perf_counter()
+    for _ in range(documents):
+        for payload in payloads:
+            fast_json.loads(payload)
+    return result((perf_counter() - started) / documents * 1e6, "us/sample", higher_is_better=False,
+                  backend=fast_json.BACKEND)
+
+
+def bench_results_schema(documents: int, trusted: bool = False) -> dict:
+    data = sample_results()
+    started = perf_counter()
+    for _ in range(documents):
+        if trusted:
+            ResultsSchema.trusted_document(data)
+        else:
+            ResultsSchema(**data).dict(by_alias=True)
+    return result((perf_counter() - started) / documents * 1e6, "us/doc", higher_is_better=False)
+
+
+class StandInCollection:
+    """
+    Takes the place of a pymongo Collection. Documents are BSON encoded, as the driver would, and then dropped.
+    """
+
+    def __init__(self):
+        self.inserted = 0
+
+    def insert_one(self, document: dict):
+        encode(document)
+        self.inserted += 1
+        return type("InsertOneResult", (), {"inserted_id": document.get("_id")})()
+
+
+def bench_mongo_add_data(documents: int, mongo_uri: str = None) -> dict:
+    if mongo_uri:
+        transport = MongoTransport(mongodb_uri=mongo_uri, results_db="tc_bench", db_collection="add_data_bench",
+                                   trusted_results=True)
+        transport.db_acc.drop_collection("add_data_bench")
+    else:
+        transport = MongoTransport.__new__(MongoTransport)
+        transport.log = getLogger(MongoTransport.__module__)
+        transport.db_collection = "results"
+        transport.db_acc = {"results": StandInCollection()}
+        transport.trusted_results = True
+
+    data = sample_results()
+    started = perf_counter()
+    for _ in range(documents):
+        transport.add_data(dict(data))
+    elapsed = perf_counter() - started
+
+    if mongo_uri:
+        transport.db_acc.drop_collection("add_data_bench")
+        transport.close()
+    return result(documents / elapsed, "docs/s", target="mongod" if mongo_uri else "stand-in")
+
+
+def bench_csv(documents: int) -> dict:
+    csv_path = tempfile.mkdtemp()
+    try:
+        transport = CsvTransport(csv_path=csv_path)
+        data = sample_results()
+        started = perf_counter()
+        for _ in range(documents):
+            transport.add_data(data)
+        transport.close()
+        return result(documents / (perf_counter() - started), "docs/s")
+    finally:
+        shutil.rmtree(csv_path)
+
+
+def bench_sql(documents: int) -> dict:
+    sql_dir = tempfile.mkdtemp()
+    try:
+        transport = SqliteTransport(sql_path=path.join(sql_dir, "bench.sqlite3"))
+        data = sample_results()
+        started = perf_counter()
+        for _ in range(documents):
+            transport.add_data(data)
+        transport.close()
+        return result(documents / (perf_counter() - started), "docs/s")
+    finally:
+        shutil.rmtree(sql_dir)
+
+
+def run(samples: int, documents: int, mongo_uri: str = None) -> dict:
+    return {
+        "start_test_sequential": bench_start_test(samples, concurrent=False),
+        "start_test_concurrent": bench_start_test(samples, concurrent=True),
+        "json_decode": bench_json_decode(documents),
+        "results_schema_validation": bench_results_schema(documents),
+        "results_schema_trusted": bench_results_schema(documents, trusted=True),
+        "mongo_add_data": bench_mongo_add_data(documents, mongo_uri),
+        "csv_add_data": bench_csv(documents),
+        "sql_add_data": bench_sql(documents),
+    }
+
+
+def compare(benchmarks: dict, baseline: dict, tolerance: float) -> list:
+    """
+    :return: list, One entry per benchmark that is more than tolerance worse than its baseline.
+    """
+    regressions = []
+    for name, current in benchmarks.items():
+        previous = baseline.get(name)
+        if not previous or not previous.get("value"):
+            continue
+        if current["higher_is_better"]:
+            change = current["value"] / previous["value"] - 1
+        else:
+            change = previous["value"] / current["value"] - 1
+        if change < -tolerance:
+            regressions.append({"benchmark": name, "baseline": previous["value"], "value": current["value"],
+                                "unit": current["unit"], "change": round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=300, help="start_test calls per collection mode.")
+    parser.add_argument("--documents", type=int, default=5000, help="Documents per transport and schema run.")
+    parser.add_argument("--mongo-uri", default=None, help="Benchmark add_data against this mongod.")
+    parser.add_argument("--baseline", nargs="?", const=BASELINE_PATH, default=None,
+                        help="Baseline JSON to compare with, benchmarks/baseline.json when no path is given.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown, 0.25 is 25%%.")
+    parser.add_argument("--write-baseline", default=None, help="Store this run as the baseline.")
+    args = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": run(args.samples, args.documents, args.mongo_uri)
+    }
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            report["regressions"] = compare(report["benchmarks"], json.load(f)["benchmarks"], args.tolerance)
+
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print(json.dumps(report, indent=2))
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,4 +8,13 @@ db.createUser(
         roles: [{ role: 'readWrite', db: 'tcresults' }],
     },
 );
-db.createCollection('trashcan_results');
\ No newline at end of file
+db.createCollection('trashcan_results', {
+    timeseries: {
+        timeField: 'timestamp',
+        metaField: 'gateway_id',
+        granularity: 'seconds',
+    },
+});
+db.trashcan_results.createIndex({ gateway_id: 1, timestamp: -1 });
+db.trashcan_results.createIndex({ timestamp: -1 });
+db.trashcan_results.createIndex({ gateway_check: 1, timestamp: -1 });
@@ -0,0 +1,105 @@
+import unittest
+from datetime import datetime, timezone
+from app.functions.cell_tracker import CellChangeTracker, dwell_by_value
+
+START = 1767225600
+
+
+def sample(minute: int, cell=311, band="n41", channel=520110) -> dict:
+    stat = {key: value for key, value in (("PhysicalCellID", cell), ("Band", band), ("Downlink_NR_ARFCN", channel))
+            if value is not None}
+    return {
+        "timestamp": datetime.fromtimestamp(START + minute * 60, tz=timezone.utc),
+        "gateway_id": "gw1",
+        "gateway_check": True,
+        "radio_raw_data": {"cell_5G_stats_cfg": [{"stat": stat}]}
+    }
+
+
+class TestCellChangeTracker(unittest.TestCase):
+
+    def test_first_values_then_only_changes(self):
+        tracker = CellChangeTracker()
+        first = tracker.observe(sample(0))
+        self.assertEqual({("5g", "cell"), ("5g", "band"), ("5g", "channel")},
+                         {(change["technology"], change["field"]) for change in first})
+        self.assertTrue(all(change["old_value"] is None for change in first))
+        self.assertEqual([], tracker.observe(sample(1)))
+
+        handover = tracker.observe(sample(10, cell=98))
+        self.assertEqual(1, len(handover))
+        self.assertEqual((311, 98, 600.0), (handover[0]["old_value"], handover[0]["new_value"],
+                                             handover[0]["dwell_seconds"]))
+
+    def test_missing_values_hold_the_old_one(self):
+        tracker = CellChangeTracker()
+        tracker.observe(sample(0))
+        self.assertEqual([], tracker.observe(sample(5, cell=None, band=None, channel=None)))
+        band_change = tracker.observe(sample(20, band="n71", channel=125400))
+        self.assertEqual({"band": 1200.0, "channel": 1200.0},
+                         {change["field"]: change["dwell_seconds"] for change in band_change})
+
+    def test_sink_gets_the_changes(self):
+        class Sink:
+            documents = []
+
+            def add_cell_changes(self, documents):
+                self.documents += documents
+
+        sink = Sink()
+        tracker = CellChangeTracker(sink=sink)
+        tracker.observe(sample(0))
+        tracker.observe(sample(1, cell=98))
+        self.assertEqual(4, len(sink.documents))
+
+    def test_changes_are_written_once_the_sink_recovers(self):
+        class FlakySink:
+            down = True
+            documents = []
+
+            def add_cell_changes(self, documents):
+                if self.down:
+                    raise ConnectionError("down")
+                self.documents += documents
+
+        sink = FlakySink()
+        tracker = CellChangeTracker(sink=sink, retry_interval=0)
+        tracker.observe(sample(0))
+        self.assertFalse(tracker.flush(), "The first values should still be waiting for the sink.")
+
+        sink.down = False
+        tracker.observe(sample(1, cell=98))
+        self.assertEqual([None, None, None, 311], [change["old_value"] for change in sink.documents])
+        self.assertTrue(tracker.flush())
+
+    def test_failed_sink_is_not_tried_with_every_sample(self):
+        class BrokenSink:
+            calls = 0
+
+            def add_cell_changes(self, documents):
+                BrokenSink.calls += 1
+                raise ConnectionError("down")
+
+        tracker = CellChangeTracker(sink=BrokenSink(), max_unwritten=4)
+        with self.assertLogs("app.functions.cell_tracker", level="ERROR") as logs:
+            for minute, cell in enumerate((311, 98, 311, 98)):
+                tracker.observe(sample(minute, cell=cell))
+        self.assertEqual(1, BrokenSink.calls, "The sink should wait for retry_interval after a failure.")
+        self.assertTrue(any("Dropped" in line for line in logs.output), "Dropped records should be logged.")
+
+        self.assertFalse(tracker.flush())
+        self.assertEqual(2, BrokenSink.calls, "flush should try the sink whatever the interval.")
+
+
+class TestDwellByValue(unittest.TestCase):
+
+    def test_clips_to_the_window(self):
+        changes = [{"changed_at": 0, "new_value": 311}, {"changed_at": 100, "new_value": 98},
+                   {"changed_at": 250, "new_value": 311}]
+        self.assertEqual({311: 100.0, 98: 150.0}, dwell_by_value(changes, since=50, until=300))
+        self.assertEqual({98: 50.0}, dwell_by_value(changes[:2], since=150, until=200))
+        self.assertEqual({}, dwell_by_value([], since=0, until=10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+from datetime import datetime, timezone
+from app.functions.event_detector import EventDetector
+
+
+def sample(step: int, snr: float = 20.0, gateway_check: bool = True, gateway_id: str = "gw1") -> dict:
+    return {
+        "timestamp": datetime.fromtimestamp(1767225600 + step * 60, tz=timezone.utc),
+        "gateway_id": gateway_id,
+        "gateway_check": gateway_check,
+        "radio_raw_data": {"cell_5G_stats_cfg": [{"stat": {"SNRCurrent": snr + (step % 2) * 0.5}}]} if gateway_check
+        else None
+    }
+
+
+class Sink:
+    def __init__(self):
+        self.events = []
+
+    def add_events(self, documents):
+        self.events += documents
+
+
+class TestEventDetector(unittest.TestCase):
+
+    def test_degradation_starts_and_ends(self):
+        sink = Sink()
+        detector = EventDetector(sink=sink, warmup=10)
+        for step in range(30):
+            detector.observe(sample(step))
+        self.assertEqual([], sink.events)
+
+        detector.observe(sample(30, snr=8.0))
+        detector.observe(sample(31, snr=6.0))
+        started = sink.events[0]
+        self.assertEqual(("degradation", "cell_5g_stats_SNRCurrent", None), (started["kind"], started["metric"],
+                                                                              started["end"]))
+        self.assertEqual(6.5, detector.open_events()[0]["value"])
+
+        detector.observe(sample(32))
+        ended = sink.events[-1]
+        self.assertEqual(started["event_id"], ended["event_id"])
+        self.assertEqual(120, ended["duration_seconds"])
+        self.assertEqual([], detector.open_events())
+
+    def test_outage_needs_failures_in_a_row(self):
+        detector = EventDetector(outage_after=2, flap_transitions=100)
+        detector.observe(sample(0))
+        self.assertEqual([], detector.observe(sample(1, gateway_check=False)))
+        self.assertEqual([], detector.observe(sample(2)))
+
+        detector.observe(sample(3, gateway_check=False))
+        started = detector.observe(sample(4, gateway_check=False))
+        self.assertEqual("outage", started[0]["kind"])
+        self.assertEqual(sample(3)["timestamp"], started[0]["start"])
+        ended = detector.observe(sample(5))
+        self.assertEqual(120, ended[0]["duration_seconds"])
+        self.assertEqual(2, ended[0]["failed_samples"])
+
+    def test_flapping(self):
+        detector = EventDetector(outage_after=100, flap_window=600, flap_transitions=4)
+        events = []
+        for step in range(6):
+            events += detector.observe(sample(step, gateway_check=step % 2 == 0))
+        self.assertEqual(["flapping"], [event["kind"] for event in events])
+
+        # Stable for long enough, the decayed count of state changes falls below half the threshold.
+        for step in range(6, 40):
+            events += detector.observe(sample(step))
+        self.assertIsNotNone(events[-1]["end"])
+        self.assertEqual("flapping", events[-1]["kind"])
+
+    def test_gateways_are_independent(self):
+        detector = EventDetector(outage_after=1)
+        detector.observe(sample(0, gateway_id="gw1"))
+        events = detector.observe(sample(1, gateway_check=False, gateway_id="gw2"))
+        self.assertEqual("gw2", events[0]["gateway_id"])
+        self.assertEqual(1, len(detector.open_events()))
+
+    def test_failing_sink_does_not_raise(self):
+        class BrokenSink:
+            def add_events(self, documents):
+                raise ConnectionError("down")
+
+        detector = EventDetector(sink=BrokenSink(), outage_after=1)
+        self.assertEqual(1, len(detector.observe(sample(0, gateway_check=False))))
+
+    def test_events_are_written_once_the_sink_recovers(self):
+        class FlakySink(Sink):
+            down = True
+
+            def add_events(self, documents):
+                if self.down:
+                    raise ConnectionError("down")
+                super().add_events(documents)
+
+        sink = FlakySink()
+        detector = EventDetector(sink=sink, outage_after=1, retry_interval=0)
+        detector.observe(sample(0, gateway_check=False))
+        self.assertFalse(detector.flush(), "The outage should still be waiting for the sink.")
+
+        sink.down = False
+        detector.observe(sample(1))
+        self.assertEqual(2, len(sink.events), "The start of the outage should be written with its end.")
+        self.assertIsNone(sink.events[0]["end"])
+        self.assertIsNotNone(sink.events[1]["end"])
+        self.assertTrue(detector.flush())
+
+    def test_failed_sink_is_not_tried_with_every_sample(self):
+        class BrokenSink:
+            calls = 0
+
+            def add_events(self, documents):
+                BrokenSink.calls += 1
+                raise ConnectionError("down")
+
+        detector = EventDetector(sink=BrokenSink(), outage_after=1, flap_transitions=2, max_unwritten=2)
+        with self.assertLogs("app.functions.event_detector", level="ERROR") as logs:
+            for step in range(6):
+                detector.observe(sample(step, gateway_check=step % 2 == 1))
+        self.assertEqual(1, BrokenSink.calls, "The sink should wait for retry_interval after a failure.")
+        self.assertTrue(any("Dropped" in line for line in logs.output), "Dropped events should be logged.")
+
+        self.assertFalse(detector.flush())
+        self.assertEqual(2, BrokenSink.calls, "flush should try the sink whatever the interval.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import json
+import unittest
+from app.functions import fast_json
+
+
+class TestFastJson(unittest.TestCase):
+
+    def test_bytes_and_str_parse_the_same(self):
+        document = {"cell_5G_stats_cfg": [{"stat": {"SNRCurrent": 21, "RSRPCurrent": -92.5, "Band": "n41"}}],
+                    "text": "café"}
+        raw = json.dumps(document, ensure_ascii=False).encode("utf-8")
+        self.assertEqual(document, fast_json.loads(raw))
+        self.assertEqual(document, fast_json.loads(raw.decode("utf-8")))
+
+    def test_falls_back_to_json_for_what_orjson_refuses(self):
+        parsed = fast_json.loads(b'{"value": NaN, "counter": 184467440737095516150}')
+        self.assertNotEqual(parsed["value"], parsed["value"])
+        self.assertEqual(184467440737095516150, parsed["counter"])
+
+    def test_invalid_documents_still_raise(self):
+        with self.assertRaises(ValueError):
+            fast_json.loads(b'{"truncated": ')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import shutil
+import random
+import tempfile
+import unittest
+import pstats
+import cProfile
+from os import listdir
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+from app.functions.latency import LatencyHistogram, LatencyRecorder, SlowCycleProfiler
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_percentiles_within_one_percent(self):
+        histogram = LatencyHistogram()
+        values = [random.lognormvariate(3, 1) for _ in range(20000)]
+        for value in values:
+            histogram.record(value)
+        values.sort()
+        for p in (50, 90, 99):
+            exact = values[round(p / 100 * len(values)) - 1]
+            self.assertAlmostEqual(exact, histogram.percentile(p), delta=exact * 0.01 + 0.001)
+        self.assertEqual(max(values), histogram.maximum)
+
+    def test_merge_and_empty(self):
+        first = LatencyHistogram()
+        second = LatencyHistogram()
+        self.assertIsNone(first.percentile(50))
+        first.record(1.0)
+        second.record(3.0)
+        first.merge(second)
+        self.assertEqual(2, first.count)
+        self.assertAlmostEqual(3.0, first.percentile(100), delta=0.03)
+
+
+class TestLatencyRecorder(unittest.TestCase):
+
+    def test_nested_timings_are_flattened(self):
+        recorder = LatencyRecorder()
+        recorder.record_timings({"radio_raw_data": {"ttfb_ms": 4.0, "total_ms": 5.0}, "collect_ms": 9.0})
+        with recorder.time("add_data.csv"):
+            pass
+        self.assertEqual(["add_data.csv", "collect_ms", "radio_raw_data.total_ms", "radio_raw_data.ttfb_ms"],
+                         list(recorder.snapshot()))
+
+
+class TestSlowCycleProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.profile_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.profile_path)
+
+    def test_only_the_slowest_cycles_are_kept(self):
+        profiler = SlowCycleProfiler(self.profile_path, keep=2)
+        for seconds in (0.03, 0.001, 0.05, 0.002, 0.04):
+            with profiler.cycle():
+                sleep(seconds)
+        self.assertEqual(2, len(listdir(self.profile_path)))
+        self.assertGreater(profiler.kept[0][0], 35)
+
+    def test_cycles_in_the_same_second_keep_their_own_file(self):
+        profiler = SlowCycleProfiler(self.profile_path, keep=3)
+        for _ in range(3):
+            with profiler.cycle():
+                pass
+        self.assertEqual(3, len(listdir(self.profile_path)))
+
+    def test_tasks_on_worker_threads_are_profiled(self):
+        def worker_task():
+            sleep(0.01)
+
+        profiler = SlowCycleProfiler(self.profile_path, keep=1)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            with profiler.cycle():
+                executor.submit(profiler.task(worker_task)).result()
+        stats = pstats.Stats(profiler.kept[0][1])
+        self.assertIn("worker_task", [function for _, _, function in stats.stats])
+
+    def test_tasks_run_when_a_task_profiler_cannot_start(self):
+        class ActiveProfile(cProfile.Profile):
+            def enable(self, *args, **kwargs):
+                raise ValueError("Another profiling tool is already active")
+
+        profiler = SlowCycleProfiler(self.profile_path, keep=1)
+        with patch("app.functions.latency.PROFILER_SEES_ALL_THREADS", False):
+            with profiler.cycle():
+                task = profiler.task(lambda: "fetched")
+                with patch("app.functions.latency.cProfile.Profile", ActiveProfile):
+                    self.assertEqual("fetched", task())
+        self.assertEqual(1, len(profiler.kept))
+
+    def test_tasks_are_left_alone_when_the_cycle_sees_all_threads(self):
+        def worker_task():
+            return "fetched"
+
+        profiler = SlowCycleProfiler(self.profile_path, keep=1)
+        with patch("app.functions.latency.PROFILER_SEES_ALL_THREADS", True):
+            with profiler.cycle():
+                self.assertIs(worker_task, profiler.task(worker_task))
+
+
+if __name__ == '__main__':
+    unittest.main()
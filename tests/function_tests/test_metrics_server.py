@@ -0,0 +1,92 @@
+import json
+import unittest
+from urllib.request import urlopen
+from urllib.error import HTTPError
+from datetime import datetime, timezone
+from app.functions.metrics_server import MetricsServer, MetricsSnapshot
+from app.functions.sample_buffer import SampleBuffer
+
+
+def results(gateway_id: str = "gw1", snr: float = 14.0, gateway_check: bool = True) -> dict:
+    return {
+        "timestamp": datetime(2026, 1, 1, tzinfo=timezone.utc),
+        "gateway_id": gateway_id,
+        "gateway_check": gateway_check,
+        "radio_raw_data": {"cell_5G_stats_cfg": [{"stat": {"SNRCurrent": snr, "Band": "n41"}}]},
+        "endpoint_errors": {"lan_status_raw": "Timeout"}
+    }
+
+
+class TestMetricsSnapshot(unittest.TestCase):
+
+    def test_bodies_are_built_once_per_sample(self):
+        snapshot = MetricsSnapshot()
+        snapshot.observe(results())
+        first = snapshot.bodies()
+        self.assertIs(first[0], snapshot.bodies()[0])
+        self.assertIs(first[1], snapshot.bodies()[1])
+        snapshot.observe(results(snr=20.0))
+        self.assertIsNot(first[0], snapshot.bodies()[0])
+        self.assertIn(b'trashcan_cell_5g_stats_SNRCurrent{gateway_id="gw1"} 20.0', snapshot.bodies()[0])
+
+    def test_prometheus_text(self):
+        snapshot = MetricsSnapshot(stats=lambda: {"writer-csv": {"depth": 3, "dropped": 1}})
+        snapshot.observe(results("gw1"))
+        snapshot.observe(results("gw2", gateway_check=False))
+        text = snapshot.bodies()[0].decode()
+        self.assertEqual(1, text.count("# TYPE trashcan_cell_5g_stats_SNRCurrent gauge"))
+        self.assertIn('trashcan_cell_5g_stats_Band_info{gateway_id="gw2",value="n41"} 1', text)
+        self.assertIn('trashcan_gateway_up{gateway_id="gw2"} 0', text)
+        self.assertIn('trashcan_endpoint_errors{gateway_id="gw1"} 1', text)
+        self.assertIn("trashcan_collector_failures_total 1", text)
+        self.assertIn('trashcan_pipeline_queue_depth{stage="writer-csv"} 3', text)
+        self.assertNotIn("None", text)
+
+    def test_json_document(self):
+        snapshot = MetricsSnapshot()
+        snapshot.observe(results())
+        snapshot.observe_failure()
+        document = json.loads(snapshot.bodies()[1])
+        self.assertEqual(14.0, document["gateways"]["gw1"]["metrics"]["cell_5g_stats_SNRCurrent"])
+        self.assertEqual(1, document["health"]["samples"])
+        self.assertEqual(1, document["health"]["failures"])
+
+
+class TestMetricsServer(unittest.TestCase):
+
+    def test_serves_both_formats(self):
+        server = MetricsServer(MetricsSnapshot(), host="127.0.0.1", port=0).start()
+        try:
+            server.snapshot.observe(results())
+            with urlopen(f"{server.url}metrics", timeout=5) as response:
+                self.assertTrue(response.headers["Content-Type"].startswith("text/plain"))
+                self.assertIn(b"trashcan_collector_samples_total 1", response.read())
+            with urlopen(f"{server.url}metrics.json", timeout=5) as response:
+                self.assertIn("gw1", json.load(response)["gateways"])
+            with self.assertRaises(HTTPError):
+                urlopen(f"{server.url}other", timeout=5)
+        finally:
+            server.close()
+
+    def test_rolling_stats_of_the_buffers(self):
+        buffer = SampleBuffer(10)
+        for snr in (10.0, 20.0, 30.0):
+            buffer.append(results(snr=snr))
+        server = MetricsServer(MetricsSnapshot(buffers={"gw1": buffer}), host="127.0.0.1", port=0).start()
+        try:
+            query = "rolling?gateway_id=gw1&seconds=1e9&metric=cell_5g_stats_SNRCurrent"
+            with urlopen(f"{server.url}{query}", timeout=5) as response:
+                stats = json.load(response)["stats"]
+            self.assertEqual(list(stats), ["cell_5g_stats_SNRCurrent"])
+            self.assertEqual((stats["cell_5g_stats_SNRCurrent"]["count"], stats["cell_5g_stats_SNRCurrent"]["mean"]),
+                             (3, 20.0))
+            with self.assertRaises(HTTPError):
+                urlopen(f"{server.url}rolling?gateway_id=gw2", timeout=5)
+            with self.assertRaises(HTTPError):
+                urlopen(f"{server.url}rolling?metric=not_a_metric", timeout=5)
+        finally:
+            server.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import shutil
+import tempfile
+import unittest
+from threading import Event
+from time import sleep, monotonic
+from app.functions.pipeline import Pipeline, Stage, StageQueue
+from app.transport.spool import Spool, SpoolFull
+
+
+def wait_for(condition, timeout: float = 5) -> bool:
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        if condition():
+            return True
+        sleep(0.01)
+    return False
+
+
+class TestStageQueue(unittest.TestCase):
+
+    def test_drop_oldest_keeps_newest(self):
+        queue = StageQueue(maxsize=3, policy="drop_oldest")
+        for index in range(5):
+            queue.put(index)
+        self.assertEqual(2, queue.dropped)
+        self.assertEqual([2, 3, 4], [queue.get(0) for _ in range(3)])
+        self.assertIsNone(queue.get(0))
+
+    def test_spill_reads_back_from_disk(self):
+        spool_path = tempfile.mkdtemp()
+        try:
+            queue = StageQueue(maxsize=2, policy="spill", spool=Spool(spool_path, fsync_policy="never"))
+            for index in range(5):
+                queue.put({"index": index})
+            self.assertEqual(3, queue.spilled)
+            self.assertEqual(5, queue.depth())
+            self.assertEqual(list(range(5)), [queue.get(0)["index"] for _ in range(5)])
+            self.assertEqual(0, queue.depth())
+        finally:
+            shutil.rmtree(spool_path)
+
+    def test_spill_keeps_order_while_the_spool_drains(self):
+        spool_path = tempfile.mkdtemp()
+        try:
+            spool = Spool(spool_path, fsync_policy="never")
+            queue = StageQueue(maxsize=2, policy="spill", spool=spool)
+            for index in range(4):
+                queue.put({"index": index})
+            taken = [queue.get(0)["index"]]
+            # The memory queue has room again, but older items are still spilled.
+            queue.put({"index": 4})
+            taken.extend(queue.get(0)["index"] for _ in range(4))
+            self.assertEqual(list(range(5)), taken)
+            self.assertIsNone(queue.get(0))
+        finally:
+            shutil.rmtree(spool_path)
+
+    def test_spilled_items_are_acknowledged_when_taken(self):
+        spool_path = tempfile.mkdtemp()
+        try:
+            spool = Spool(spool_path, fsync_policy="never")
+            queue = StageQueue(maxsize=2, policy="spill", spool=spool)
+            for index in range(5):
+                queue.put({"index": index})
+            self.assertEqual([0, 1, 2], [queue.get(0)["index"] for _ in range(3)])
+            self.assertEqual(3, spool.pending(), "A batch read back should stay in the spool until all of it is taken.")
+            self.assertEqual(3, queue.get(0)["index"])
+            self.assertEqual(1, spool.pending())
+
+            spool.close()
+            reopened = StageQueue(maxsize=2, policy="spill", spool=Spool(spool_path, fsync_policy="never"))
+            self.assertEqual([4], [reopened.get(0)["index"]])
+        finally:
+            shutil.rmtree(spool_path)
+
+    def test_closed_queue_drains_then_stops(self):
+        queue = StageQueue(maxsize=2)
+        queue.put(1)
+        queue.close()
+        self.assertEqual(1, queue.get())
+        self.assertIsNone(queue.get())
+        with self.assertRaises(RuntimeError):
+            queue.put(2)
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_slow_writer_does_not_hold_up_submit(self):
+        release = Event()
+        fast = []
+        slow = []
+
+        def slow_writer(results):
+            release.wait()
+            slow.append(results)
+
+        pipeline = Pipeline(lambda results: results, {"fast": fast.append, "slow": slow_writer},
+                            queue_size=5, policy="drop_oldest")
+        submitting = 0.0
+        for index in range(20):
+            started = monotonic()
+            pipeline.submit({"index": index})
+            submitting += monotonic() - started
+            # Waiting for the fast writer keeps its queue short however the threads are scheduled.
+            self.assertTrue(wait_for(lambda: len(fast) == index + 1))
+        self.assertLess(submitting, 1)
+
+        stats = pipeline.stats()
+        self.assertEqual(20, stats["collector"]["submitted"])
+        self.assertGreater(stats["writer-slow"]["dropped"], 0)
+
+        release.set()
+        pipeline.close()
+        self.assertEqual(19, slow[-1]["index"])
+        self.assertEqual(list(range(20)), [results["index"] for results in fast])
+
+    def test_full_spool_only_loses_the_item(self):
+        class FullSpool:
+            def pending(self):
+                return 0
+
+            def append(self, document):
+                raise SpoolFull("full")
+
+        output = StageQueue(maxsize=1, policy="spill", spool=FullSpool())
+        stage = Stage("process", lambda results: results, StageQueue(maxsize=10), outputs=[output])
+        stage.start()
+        for index in range(5):
+            stage.queue.put({"index": index})
+        self.assertTrue(wait_for(lambda: stage.processed == 5), "The stage should keep going when the spool is full.")
+        self.assertEqual(4, output.dropped)
+        self.assertEqual(0, output.get(0)["index"])
+        stage.queue.close()
+        stage.join(1)
+
+    def test_unreadable_spool_does_not_stop_the_writer(self):
+        class UnreadableSpool:
+            def pending(self):
+                return 1
+
+            def read(self, limit):
+                raise OSError("bad sector")
+
+        written = []
+        queue = StageQueue(maxsize=2, policy="spill", spool=UnreadableSpool())
+        stage = Stage("writer-out", written.append, queue)
+        stage.retry_interval = 0.01
+        stage.start()
+        self.assertTrue(wait_for(lambda: stage.errors >= 2), "The writer should keep trying the spool.")
+        queue.close()
+        stage.join(1)
+        self.assertFalse(stage._thread.is_alive())
+
+    def test_writers_get_their_own_copy(self):
+        first = []
+        second = []
+
+        def changing_writer(results):
+            results["_id"] = 1
+            first.append(results)
+
+        pipeline = Pipeline(lambda results: results, {"first": changing_writer, "second": second.append})
+        pipeline.submit({"index": 0})
+        pipeline.close()
+        self.assertEqual(1, first[0]["_id"])
+        self.assertNotIn("_id", second[0])
+
+    def test_failing_stage_only_loses_the_item(self):
+        written = []
+
+        def process(results):
+            if results["index"] == 1:
+                raise ValueError("bad result")
+            return results
+
+        pipeline = Pipeline(process, {"out": written.append})
+        for index in range(3):
+            pipeline.submit({"index": index})
+        pipeline.close()
+        self.assertEqual([0, 2], [results["index"] for results in written])
+        self.assertEqual(1, pipeline.stats()["process"]["errors"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from app.functions.rate_engine import RateEngine
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def sample(seconds, received, gateway_id="gw1", errors=0):
+    return {
+        "timestamp": START + timedelta(seconds=seconds),
+        "gateway_id": gateway_id,
+        "gateway_check": True,
+        "radio_raw_data": {"cellular_stats": [{"BytesReceived": received}]},
+        "interface_data_raw": {"WAN": [{"Service": [{"EthernetErrorsSent": errors}]}]}
+    }
+
+
+class TestRateEngine(unittest.TestCase):
+
+    def test_first_sample_has_no_rates(self):
+        rates = RateEngine().process(sample(0, 1000))["rates"]
+        self.assertIsNone(rates["cellular_bytes_received_per_s"])
+
+    def test_rates_per_second(self):
+        engine = RateEngine()
+        engine.process(sample(0, 1000, errors=2))
+        rates = engine.process(sample(10, 6000, errors=7))["rates"]
+
+        self.assertEqual(rates["cellular_bytes_received_per_s"], 500.0)
+        self.assertEqual(rates["cellular_stats_errors_sent_per_s"], 0.5)
+        self.assertIsNone(rates["cellular_bytes_sent_per_s"], "Missing counters should have no rate.")
+
+    def test_gateways_are_tracked_separately(self):
+        engine = RateEngine()
+        engine.process(sample(0, 1000, gateway_id="gw1"))
+        engine.process(sample(0, 50, gateway_id="gw2"))
+        rates = engine.process(sample(5, 1050, gateway_id="gw1"))["rates"]
+        self.assertEqual(rates["cellular_bytes_received_per_s"], 10.0)
+
+    def test_32_bit_wrap(self):
+        engine = RateEngine()
+        engine.process(sample(0, 2 ** 32 - 100))
+        rates = engine.process(sample(1, 100))["rates"]
+        self.assertEqual(rates["cellular_bytes_received_per_s"], 200.0, "A wrapped counter should be corrected.")
+
+    def test_reset_after_reboot(self):
+        engine = RateEngine()
+        engine.process(sample(0, 5000000))
+        rates = engine.process(sample(10, 300))["rates"]
+        self.assertIsNone(rates["cellular_bytes_received_per_s"], "A reset counter should give no rate.")
+        self.assertEqual(rates["counter_resets"], ["cellular_bytes_received"])
+
+        rates = engine.process(sample(20, 1300))["rates"]
+        self.assertEqual(rates["cellular_bytes_received_per_s"], 100.0, "The reset value should be the new baseline.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+from app.functions.rollups import QuantileSketch, RollupEngine
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def sample(seconds, snr, gateway_id="gw1"):
+    return {
+        "timestamp": START + timedelta(seconds=seconds),
+        "gateway_id": gateway_id,
+        "radio_raw_data": {"cell_5G_stats_cfg": [{"stat": {"SNRCurrent": snr, "RSRPCurrent": -100 - snr}}]}
+    }
+
+
+class TestQuantileSketch(unittest.TestCase):
+
+    def test_quantiles_within_relative_accuracy(self):
+        values = [random.uniform(-140, 40) for _ in range(20000)]
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+
+        values.sort()
+        for q in (0.05, 0.5, 0.95, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q), exact, delta=abs(exact) * 0.011 + 1e-9)
+
+    def test_merge(self):
+        left, right = QuantileSketch(), QuantileSketch()
+        for value in range(1, 51):
+            left.add(value)
+        for value in range(51, 101):
+            right.add(value)
+        left.merge(right)
+        self.assertEqual(left.count, 100)
+        self.assertAlmostEqual(left.quantile(0.5), 50, delta=1)
+
+    def test_empty(self):
+        self.assertIsNone(QuantileSketch().quantile(0.5))
+
+
+class TestRollupEngine(unittest.TestCase):
+
+    def test_buckets_close_when_time_moves_on(self):
+        engine = RollupEngine(levels={"minute": 60})
+        for second, snr in ((0, 10), (20, 20), (40, 30), (60, 5)):
+            engine.add(sample(second, snr))
+
+        self.assertEqual(len(engine.closed), 1, "Only the finished minute should be closed.")
+        rollup = engine.closed[0]
+        snr = rollup["metrics"]["cell_5g_stats_SNRCurrent"]
+        self.assertEqual(rollup["bucket_start"], START)
+        self.assertEqual((snr["min"], snr["max"], snr["mean"], snr["count"], snr["last"]), (10, 30, 20, 3, 30))
+        self.assertAlmostEqual(snr["p50"], 20, delta=0.2)
+        self.assertNotIn("cell_lte_stats_SNRCurrent", rollup["metrics"], "Missing metrics should be left out.")
+
+    def test_levels_and_gateways_are_separate(self):
+        engine = RollupEngine()
+        engine.add(sample(0, 10, "gw1"))
+        engine.add(sample(0, 20, "gw2"))
+        engine.add(sample(3600, 30, "gw1"))
+
+        closed = {(rollup["level"], rollup["gateway_id"]) for rollup in engine.closed}
+        self.assertEqual(closed, {("minute", "gw1"), ("hour", "gw1")})
+
+        engine.flush()
+        self.assertIn(("day", "gw2"), {(rollup["level"], rollup["gateway_id"]) for rollup in engine.closed})
+
+    def test_sink_receives_rollups(self):
+        received = []
+
+        class Sink:
+            def add_rollups(self, level, documents):
+                received.append((level, documents))
+
+        engine = RollupEngine(sink=Sink(), levels={"minute": 60})
+        engine.add(sample(0, 10))
+        engine.add(sample(61, 10))
+        self.assertEqual([level for level, _ in received], ["minute"])
+        self.assertEqual(engine.closed, [], "Rollups handed to a sink should not be kept.")
+
+    def test_failed_rollups_are_sent_again(self):
+        class FlakySink:
+            down = True
+            received = []
+
+            def add_rollups(self, level, documents):
+                if self.down:
+                    raise ConnectionError("down")
+                self.received += documents
+
+        sink = FlakySink()
+        engine = RollupEngine(sink=sink, levels={"minute": 60}, max_unwritten=2)
+        for minute in range(4):
+            engine.add(sample(minute * 60, 10))
+        self.assertFalse(engine.flush(), "The closed minutes should still be waiting for the sink.")
+
+        sink.down = False
+        self.assertTrue(engine.flush())
+        self.assertEqual([START + timedelta(minutes=2), START + timedelta(minutes=3)],
+                         [rollup["bucket_start"] for rollup in sink.received],
+                         "Only the newest max_unwritten rollups should be kept.")
+
+    def test_single_gateway_rollups_use_the_container_id(self):
+        engine = RollupEngine(levels={"minute": 60})
+        data = sample(0, 10)
+        del data["gateway_id"]
+        engine.add(dict(data, container_id="box1"))
+        engine.flush()
+        self.assertEqual("box1", engine.closed[0]["gateway_id"])
+
+
+if __name__ == '__main__':
+    unittest.main()
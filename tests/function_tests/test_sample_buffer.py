@@ -0,0 +1,63 @@
+import unittest
+from app.functions import sample_buffer
+from app.functions.sample_buffer import SampleBuffer
+
+
+def radio(snr):
+    return {"radio_raw_data": {"cell_5G_stats_cfg": [{"stat": {"SNRCurrent": snr}}]}}
+
+
+class TestSampleBuffer(unittest.TestCase):
+    metric = "cell_5g_stats_SNRCurrent"
+
+    def filled(self, capacity, count):
+        buffer = SampleBuffer(capacity)
+        for second in range(count):
+            buffer.append(radio(second), timestamp=1000 + second)
+        return buffer
+
+    def test_window_covers_recent_samples(self):
+        buffer = self.filled(100, 10)
+        self.assertEqual(buffer.window(self.metric, 3, now=1009), [6.0, 7.0, 8.0, 9.0])
+
+    def test_ring_overwrites_oldest(self):
+        buffer = self.filled(5, 12)
+        self.assertEqual(buffer.size, 5)
+        self.assertEqual(buffer.window(self.metric, 100, now=1011), [7.0, 8.0, 9.0, 10.0, 11.0],
+                         "Only the newest capacity samples should be kept, across the wrap point.")
+
+    def test_stats(self):
+        buffer = self.filled(100, 11)
+        stats = buffer.stats(self.metric, 100, now=1010)
+        self.assertEqual((stats["count"], stats["min"], stats["max"], stats["mean"]), (11, 0.0, 10.0, 5.0))
+        self.assertEqual(stats["p50"], 5.0)
+        self.assertAlmostEqual(stats["p95"], 9.5)
+
+    def test_stats_without_numpy(self):
+        numpy = sample_buffer.numpy
+        sample_buffer.numpy = None
+        try:
+            stats = self.filled(100, 11).stats(self.metric, 100, now=1010)
+        finally:
+            sample_buffer.numpy = numpy
+        self.assertAlmostEqual(stats["p95"], 9.5)
+
+    def test_missing_values_are_skipped(self):
+        buffer = SampleBuffer(10)
+        buffer.append(radio(5), timestamp=1)
+        buffer.append({}, timestamp=2)
+        self.assertEqual(buffer.stats(self.metric, 10, now=2)["count"], 1)
+        self.assertIsNone(buffer.latest()[self.metric], "A missing value should read back as None.")
+
+    def test_empty_window(self):
+        stats = SampleBuffer(10).stats(self.metric, 60)
+        self.assertEqual(stats["count"], 0)
+        self.assertIsNone(stats["mean"])
+
+    def test_unknown_metric(self):
+        with self.assertRaises(KeyError):
+            SampleBuffer(10).window("not_a_metric", 60)
+
+
+if __name__ == '__main__':
+    unittest.main()
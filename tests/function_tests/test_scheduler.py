@@ -0,0 +1,89 @@
+import unittest
+from app.functions.scheduler import GridScheduler, DegradationDetector
+
+
+class FakeClock:
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def radio(snr: float, gateway_check: bool = True) -> dict:
+    return {"gateway_check": gateway_check,
+            "radio_raw_data": {"cell_5G_stats_cfg": [{"stat": {"SNRCurrent": snr}}]}}
+
+
+class TestGridScheduler(unittest.TestCase):
+
+    def test_collection_time_does_not_drift(self):
+        clock = FakeClock()
+        scheduler = GridScheduler(60, clock=clock)
+        ticks = []
+        for _ in range(5):
+            ticks.append(scheduler.next_run)
+            # Every sample takes 7 seconds.
+            clock.now = scheduler.next_run + 7
+            scheduler.advance()
+        self.assertEqual([1000, 1060, 1120, 1180, 1240], ticks)
+        self.assertEqual(0, scheduler.skipped)
+
+    def test_missed_ticks_are_skipped(self):
+        clock = FakeClock()
+        scheduler = GridScheduler(10, clock=clock)
+        clock.now = 1035
+        self.assertEqual(1040, scheduler.advance())
+        self.assertEqual(3, scheduler.skipped)
+        self.assertEqual(5, scheduler.delay())
+
+    def test_jitter_stays_within_bounds_and_does_not_accumulate(self):
+        clock = FakeClock()
+        scheduler = GridScheduler(60, jitter=2, clock=clock, seed=1)
+        for tick in range(1, 50):
+            clock.now = scheduler.next_run
+            run = scheduler.advance()
+            self.assertGreaterEqual(run, 1000 + tick * 60)
+            self.assertLessEqual(run, 1000 + tick * 60 + 2)
+
+    def test_bursts_while_degraded_then_returns_to_base_grid(self):
+        clock = FakeClock()
+        scheduler = GridScheduler(60, detector=DegradationDetector(drop_db=3), burst_interval=5, burst_hold=20,
+                                  clock=clock)
+        scheduler.observe(radio(20))
+        self.assertEqual(1060, scheduler.advance())
+
+        clock.now = 1060
+        scheduler.observe(radio(12))
+        self.assertTrue(scheduler.bursting)
+        self.assertEqual(1065, scheduler.advance())
+
+        clock.now = 1065
+        scheduler.observe(radio(0, gateway_check=False))
+        self.assertEqual(1070, scheduler.advance())
+
+        # Healthy again, but burst_hold keeps the fast rate for 20 seconds.
+        clock.now = 1070
+        scheduler.observe(radio(20))
+        self.assertTrue(scheduler.bursting)
+        clock.now = 1086
+        scheduler.observe(radio(20))
+        self.assertFalse(scheduler.bursting)
+        self.assertEqual(1120, scheduler.advance())
+
+
+class TestDegradationDetector(unittest.TestCase):
+
+    def test_new_level_stops_counting_as_degraded(self):
+        detector = DegradationDetector(drop_db=3, alpha=0.5)
+        self.assertFalse(detector.degraded(radio(20)))
+        self.assertTrue(detector.degraded(radio(15)))
+        for _ in range(5):
+            detector.degraded(radio(15))
+        self.assertFalse(detector.degraded(radio(15)))
+        self.assertTrue(detector.degraded(radio(15, gateway_check=False)))
+
+
+if __name__ == '__main__':
+    unittest.main()
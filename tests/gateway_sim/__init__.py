@@ -0,0 +1,5 @@
+from .simulator import GatewaySimulator, SimulatorFleet, load_fixtures, ENDPOINTS, FIXTURE_PATH
+from .recorder import record_gateway, redact
+
+__all__ = ['GatewaySimulator', 'SimulatorFleet', 'load_fixtures', 'record_gateway', 'redact', 'ENDPOINTS',
+           'FIXTURE_PATH']
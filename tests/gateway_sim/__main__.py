@@ -0,0 +1,56 @@
+"""
+    Runs gateway simulators, or records fixtures from a real gateway.
+
+        python -m tests.gateway_sim serve --count 50 --port 18000 --latency 0.05 --error-rate 0.01
+        python -m tests.gateway_sim record --url http://192.168.12.1 --out tests/gateway_sim/fixtures/mine
+"""
+import json
+import argparse
+from time import sleep
+from .simulator import SimulatorFleet, load_fixtures, FIXTURE_PATH
+from .recorder import record_gateway
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m tests.gateway_sim")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Serve fixtures as one or more simulated gateways.")
+    serve.add_argument("--fixtures", default=FIXTURE_PATH)
+    serve.add_argument("--count", type=int, default=1, help="Simulated gateways, on consecutive ports.")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=0, help="First port, 0 picks free ports.")
+    serve.add_argument("--latency", type=float, default=0.0)
+    serve.add_argument("--latency-jitter", type=float, default=0.0)
+    serve.add_argument("--error-rate", type=float, default=0.0)
+    serve.add_argument("--timeout-rate", type=float, default=0.0)
+    serve.add_argument("--counter-rate", type=float, default=125000.0)
+    serve.add_argument("--wrap-32bit", action="store_true")
+
+    record = commands.add_parser("record", help="Capture the endpoints of a real gateway into fixtures.")
+    record.add_argument("--url", default="http://192.168.12.1")
+    record.add_argument("--out", required=True)
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        for request_path, fixture in record_gateway(args.url, args.out).items():
+            print(f"{request_path} -> {fixture}")
+        return
+
+    fixtures = load_fixtures(args.fixtures)
+    settings = {"fixtures": fixtures, "host": args.host, "latency": args.latency,
+                "latency_jitter": args.latency_jitter, "error_rate": args.error_rate,
+                "timeout_rate": args.timeout_rate, "counter_rate": args.counter_rate, "wrap_32bit": args.wrap_32bit}
+    with SimulatorFleet(args.count, first_port=args.port, **settings) as fleet:
+        # Ready to paste into the gateways list of a config file.
+        print(json.dumps(fleet.targets(), indent=2))
+        try:
+            while True:
+                sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
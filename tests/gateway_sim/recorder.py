@@ -0,0 +1,46 @@
+import json
+from os import path, makedirs
+import requests
+from .simulator import ENDPOINTS
+
+__all__ = ['record_gateway', 'redact', 'REDACTED_KEYS']
+
+# Keys that identify a subscriber or a device, their values are not written to fixtures.
+REDACTED_KEYS = ("IMEI", "IMSI", "ICCID", "MSISDN", "MACAddress", "MAC", "SerialNumber")
+
+
+def redact(payload, keys: tuple = REDACTED_KEYS):
+    """
+    :return: A copy of payload with the value of every key in keys, at any depth, replaced by "REDACTED".
+    """
+    if isinstance(payload, dict):
+        return {key: "REDACTED" if key in keys else redact(value, keys) for key, value in payload.items()}
+    if isinstance(payload, list):
+        return [redact(value, keys) for value in payload]
+    return payload
+
+
+def record_gateway(gateway_url: str, fixture_path: str, timeout: float = 8, keys: tuple = REDACTED_KEYS) -> dict:
+    """
+    Captures one response of every gateway endpoint into fixture_path, in the layout GatewaySimulator serves.
+
+    :param gateway_url: str, The admin url of a real gateway, e.g. http://192.168.12.1
+    :param fixture_path: str, The directory the fixtures are written to.
+    :param keys: tuple, Keys whose values are redacted before writing.
+    :return: dict, {request path: fixture file written}
+    """
+    makedirs(fixture_path, exist_ok=True)
+    written = {}
+    with requests.Session() as session:
+        for request_path, name in ENDPOINTS.items():
+            response = session.get(gateway_url.rstrip("/") + request_path, timeout=timeout,
+                                   headers={"Cache-Control": "no-cache", "User-Agent": "TrashcanMonitor"})
+            response.raise_for_status()
+            fixture = path.join(fixture_path, name)
+            with open(fixture, "w", encoding="utf-8") as f:
+                if name.endswith(".json"):
+                    json.dump(redact(response.json(), keys), f, indent=2)
+                else:
+                    f.write(response.text)
+            written[request_path] = fixture
+    return written
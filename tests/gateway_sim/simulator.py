@@ -0,0 +1,228 @@
+import json
+from os import path
+from copy import deepcopy
+from random import Random
+from threading import Thread, Lock
+from time import monotonic, sleep
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from app.models.metric_map import METRIC_MAP, COUNTER_METRICS
+
+__all__ = ['GatewaySimulator', 'SimulatorFleet', 'load_fixtures', 'ENDPOINTS', 'FIXTURE_PATH']
+
+FIXTURE_PATH = path.join(path.dirname(path.abspath(__file__)), "fixtures", "default")
+
+# Request path and the fixture file it is served from.
+ENDPOINTS = {
+    "/": "index.html",
+    "/fastmile_radio_status_web_app.cgi": "radio.json",
+    "/statistics_status_web_app.cgi": "statistics.json",
+    "/lan_status_web_app.cgi": "lan.json",
+}
+
+_COUNTER_PATHS = [(metric.name, metric.paths[0]) for metric in METRIC_MAP if metric.name in COUNTER_METRICS]
+
+
+def load_fixtures(fixture_path: str = FIXTURE_PATH) -> dict:
+    """
+    :return: dict, {request path: payload}. JSON endpoints are parsed, the index page is kept as text.
+    """
+    fixtures = {}
+    for request_path, name in ENDPOINTS.items():
+        with open(path.join(fixture_path, name), "r", encoding="utf-8") as f:
+            fixtures[request_path] = json.load(f) if name.endswith(".json") else f.read()
+    return fixtures
+
+
+def _counter_speed(name: str) -> float:
+    """
+    How fast a counter grows relative to the byte rate: bytes as is, packets at about one per 1200 bytes, and
+    errors and discards not at all.
+    """
+    if "errors" in name or "discard" in name:
+        return 0.0
+    if "packets" in name:
+        return 1 / 1200
+    return 1.0
+
+
+class GatewaySimulator:
+    """
+        A local stand-in for the gateway web app. It serves recorded payloads of the three CGI endpoints and the
+        index page the gateway check requests, from a ThreadingHTTPServer on its own thread.
+
+        Responses can be slowed down, fail with a 500, or hang past the client timeout, each at a configurable
+        rate. The cumulative counters of the recorded payloads keep growing with time, at counter_rate bytes per
+        second, and wrap at 32 bits when wrap_32bit is set.
+    """
+
+    def __init__(self, fixtures: dict = None, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 latency_jitter: float = 0.0, error_rate: float = 0.0, timeout_rate: float = 0.0,
+                 timeout_seconds: float = 30.0, counter_rate: float = 125000.0, wrap_32bit: bool = False,
+                 seed: int = None):
+        """
+            :param fixtures: dict, {request path: payload}, defaults to load_fixtures().
+            :param port: int, 0 picks a free port.
+            :param latency: float, Seconds added to every response.
+            :param latency_jitter: float, The most seconds added on top of latency at random.
+            :param error_rate: float, Share of requests answered with a 500.
+            :param timeout_rate: float, Share of requests held for timeout_seconds before they are answered.
+            :param counter_rate: float, Bytes per second the byte counters grow by.
+            :param wrap_32bit: bool, Counters wrap at 2**32 like older firmware.
+        """
+        self.fixtures = fixtures if fixtures is not None else load_fixtures()
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self.counter_rate = counter_rate
+        self.wrap_32bit = wrap_32bit
+        self.requests = {}
+
+        self._random = Random(seed)
+        self._lock = Lock()
+        self._started = monotonic()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "GatewaySimulator":
+        self._started = monotonic()
+        self._thread = Thread(target=self._server.serve_forever, name="gateway-sim", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def payload(self, request_path: str):
+        """
+        :return: The payload served for request_path right now, with counters moved forward, or None.
+        """
+        payload = self.fixtures.get(request_path)
+        if not isinstance(payload, dict):
+            return payload
+
+        payload = deepcopy(payload)
+        elapsed = monotonic() - self._started
+        for name, keys in _COUNTER_PATHS:
+            parent = payload
+            try:
+                for key in keys[1:-1]:
+                    parent = parent[key]
+                value = parent[keys[-1]]
+            except (KeyError, IndexError, TypeError):
+                continue
+            value = int(value + self.counter_rate * _counter_speed(name) * elapsed)
+            parent[keys[-1]] = value % 2 ** 32 if self.wrap_32bit else value
+        return payload
+
+    def _plan(self) -> tuple:
+        """
+        :return: tuple, (delay in seconds, status code) for the next response.
+        """
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.latency_jitter) if self.latency_jitter else 0)
+            roll = self._random.random()
+        if roll < self.timeout_rate:
+            return self.timeout_seconds, 200
+        if roll < self.timeout_rate + self.error_rate:
+            return delay, 500
+        return delay, 200
+
+    def _handler(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes, Nagle would hold the body back for a delayed ACK.
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                request_path = self.path.split("?")[0]
+                with simulator._lock:
+                    simulator.requests[request_path] = simulator.requests.get(request_path, 0) + 1
+
+                delay, status = simulator._plan()
+                if delay:
+                    sleep(delay)
+
+                payload = simulator.payload(request_path)
+                if payload is None:
+                    status = 404
+                if status != 200:
+                    body = b""
+                    content_type = "text/plain"
+                elif isinstance(payload, dict):
+                    body = json.dumps(payload).encode()
+                    content_type = "application/json"
+                else:
+                    body = payload.encode()
+                    content_type = "text/html"
+
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class SimulatorFleet:
+    """
+        Many GatewaySimulators, one per port, for fleet mode load tests. Keyword arguments are passed on to every
+        simulator, each gets its own seed.
+    """
+
+    def __init__(self, count: int, first_port: int = 0, **kwargs):
+        """
+            :param count: int, Number of simulated gateways.
+            :param first_port: int, Port of the first simulator, the others follow it. 0 picks free ports.
+        """
+        seed = kwargs.pop("seed", None)
+        self.simulators = [GatewaySimulator(port=first_port + index if first_port else 0,
+                                            seed=None if seed is None else seed + index, **kwargs)
+                           for index in range(count)]
+
+    @property
+    def urls(self) -> list:
+        return [simulator.url for simulator in self.simulators]
+
+    def targets(self) -> list:
+        """
+        :return: list, gateways entries for the config, one per simulator.
+        """
+        return [{"gateway_id": f"sim{index}", "target_gateway_url": url} for index, url in enumerate(self.urls)]
+
+    def start(self) -> "SimulatorFleet":
+        for simulator in self.simulators:
+            simulator.start()
+        return self
+
+    def stop(self) -> None:
+        for simulator in self.simulators:
+            simulator.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,46 @@
+import unittest
+from app.models.metric_map import Metric, MetricExtractor, metric_extractor
+
+RADIO = {
+    "cellular_stats": [{"BytesReceived": 1000, "BytesSent": "200"}],
+    "cell_5G_stats_cfg": [{"stat": {"SNRCurrent": "12", "RSRPCurrent": -95, "PhysicalCellID": 311, "Band": "n41"}}],
+    "cell_LTE_stats_cfg": []
+}
+
+
+class TestMetricExtractor(unittest.TestCase):
+
+    def test_flattens_and_types_values(self):
+        record = metric_extractor.extract({"radio_raw_data": RADIO})
+
+        self.assertEqual(record["cellular_bytes_received"], 1000)
+        self.assertEqual(record["cellular_bytes_sent"], 200, "Numeric strings should be converted.")
+        self.assertEqual(record["cell_5g_stats_SNRCurrent"], 12.0)
+        self.assertEqual(record["cell_5g_stats_Band"], "n41")
+        self.assertIsNone(record["cell_lte_stats_SNRCurrent"], "An empty list should give None.")
+        self.assertIsNone(record["cellular_stats_bytes_sent"], "A missing payload should give None.")
+        self.assertEqual(list(record), metric_extractor.names, "The record should keep the metric map order.")
+
+    def test_bad_payloads_do_not_raise(self):
+        for payload in ({}, {"radio_raw_data": None}, {"radio_raw_data": {"cell_5G_stats_cfg": "n/a"}},
+                        {"radio_raw_data": {"cell_5G_stats_cfg": [{"stat": {"SNRCurrent": "bad"}}]}}):
+            record = metric_extractor.extract(payload)
+            self.assertTrue(all(value is None for value in record.values()), f"{payload} should give all None.")
+
+    def test_alternate_paths_follow_order(self):
+        extractor = MetricExtractor([
+            Metric("snr", float, (("new", "snr"), ("old", "SNRCurrent"))),
+            Metric("band", str, (("band",),)),
+        ])
+
+        self.assertEqual(extractor.extract({"old": {"SNRCurrent": 3}}), {"snr": 3.0, "band": None})
+        self.assertEqual(extractor.extract({"new": {"snr": 7}, "old": {"SNRCurrent": 3}})["snr"], 7.0,
+                         "The first path present should win.")
+
+    def test_unsupported_type_is_rejected(self):
+        with self.assertRaises(ValueError):
+            MetricExtractor([Metric("stats", dict, (("stats",),))])
+
+
+if __name__ == '__main__':
+    unittest.main()
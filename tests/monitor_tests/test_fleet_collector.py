@@ -0,0 +1,96 @@
+import asyncio
+import time
+import unittest
+from threading import Lock, Event
+from app.functions.fleet_collector import FleetCollector
+from app.functions.trashcan_monitor import TrashcanMonitor
+from app.models import GatewayTarget
+
+
+class CountingMonitor(TrashcanMonitor):
+    """
+        TrashcanMonitor that tracks how many of its requests run at the same time across all instances.
+    """
+    lock = Lock()
+    in_flight = 0
+    peak = 0
+
+    def _request(self, value):
+        with self.lock:
+            CountingMonitor.in_flight += 1
+            CountingMonitor.peak = max(CountingMonitor.peak, CountingMonitor.in_flight)
+        time.sleep(0.01)
+        with self.lock:
+            CountingMonitor.in_flight -= 1
+        return value
+
+    def check_gateway_url(self) -> bool:
+        return self._request(True)
+
+    def get_radio_data(self) -> dict:
+        return self._request({"gateway": self.gateway_id})
+
+    def get_inet_data(self) -> dict:
+        return self._request({})
+
+    def get_lanstat_data(self) -> dict:
+        return self._request({})
+
+
+class TestFleetCollector(unittest.TestCase):
+
+    def build_fleet(self, count, max_in_flight):
+        targets = []
+        for index in range(count):
+            target = GatewayTarget(gateway_id=f"gw{index}", target_gateway_url=f"http://10.0.{index}.1")
+            monitor = CountingMonitor()
+            monitor.gateway_id = target.gateway_id
+            targets.append((target, monitor))
+        return FleetCollector(targets, max_in_flight=max_in_flight, sleep_time=1)
+
+    def test_every_gateway_is_polled_and_tagged(self):
+        fleet = self.build_fleet(40, 4)
+        seen = {}
+
+        def on_result(results):
+            seen[results["gateway_id"]] = results
+            if len(seen) == 40:
+                fleet.stop()
+
+        asyncio.run(asyncio.wait_for(fleet.run_async(on_result), timeout=10))
+
+        self.assertEqual(len(seen), 40, "Every gateway should report a result.")
+        self.assertEqual(seen["gw7"]["radio_raw_data"], {"gateway": "gw7"}, "Results should come from their gateway.")
+        self.assertTrue(all(results["gateway_check"] for results in seen.values()))
+        self.assertLessEqual(CountingMonitor.peak, 4, "max_in_flight should cap concurrent requests.")
+
+    def test_a_blocked_result_handler_does_not_stall_the_loop(self):
+        fleet = self.build_fleet(2, 2)
+        release = Event()
+        seen = []
+
+        def on_result(results):
+            release.wait(5)
+            seen.append(results["gateway_id"])
+            if len(seen) == 2:
+                fleet.stop()
+
+        async def run():
+            polling = asyncio.ensure_future(fleet.run_async(on_result))
+            started = time.monotonic()
+            await asyncio.sleep(0.3)
+            waited = time.monotonic() - started
+            release.set()
+            await asyncio.wait_for(polling, timeout=5)
+            return waited
+
+        self.assertLess(asyncio.run(run()), 1, "The event loop should keep running while a result is handed on.")
+        self.assertEqual(sorted(seen), ["gw0", "gw1"])
+
+    def test_max_in_flight_is_validated(self):
+        with self.assertRaises(ValueError):
+            FleetCollector([], max_in_flight=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
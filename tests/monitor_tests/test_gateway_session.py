@@ -0,0 +1,98 @@
+import unittest
+from time import sleep
+from http.client import RemoteDisconnected
+from requests.exceptions import ReadTimeout
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from app.functions.gateway_session import GatewaySession
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SlowHandler(KeepAliveHandler):
+    calls = 0
+
+    def do_GET(self):
+        SlowHandler.calls += 1
+        sleep(0.5)
+        super().do_GET()
+
+
+class TestGatewaySession(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self):
+        session = GatewaySession()
+        for _ in range(5):
+            session.get(self.url, timeout=2)
+
+        stats = session.stats()
+        session.close()
+        self.assertEqual(stats["requests"], 5, "Every request should be counted.")
+        self.assertEqual(stats["connections"], 1, "A keep-alive session should open a single connection.")
+        self.assertEqual(stats["reused"], 4, "Later requests should reuse the open connection.")
+
+    def test_idle_pool_is_reset(self):
+        session = GatewaySession(idle_timeout=0)
+        session.get(self.url, timeout=2)
+        session.get(self.url, timeout=2)
+
+        stats = session.stats()
+        session.close()
+        self.assertEqual(stats["stale_resets"], 1, "An idle pool should be dropped before the next request.")
+        self.assertEqual(stats["connections"], 2, "A dropped pool should reconnect.")
+
+    def test_keep_alive_disabled(self):
+        session = GatewaySession(keep_alive=False)
+        for _ in range(3):
+            session.get(self.url, timeout=2)
+
+        stats = session.stats()
+        session.close()
+        self.assertEqual(stats["reused"], 0, "Connections should not be reused with keep_alive disabled.")
+
+    def test_read_timeouts_are_not_retried(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        session = GatewaySession(max_retries=2)
+        try:
+            with self.assertRaises(ReadTimeout):
+                session.get(f"http://127.0.0.1:{server.server_address[1]}/", timeout=0.2)
+        finally:
+            session.close()
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(SlowHandler.calls, 1, "A slow gateway should not be asked twice.")
+
+    def test_dropped_connections_are_retried(self):
+        retry = GatewaySession(max_retries=1).adapter.max_retries
+        retry = retry.increment("GET", "/", error=ProtocolError("Connection aborted.", RemoteDisconnected()))
+        self.assertEqual(retry.other, 0, "A connection dropped by the gateway should be retried once.")
+        with self.assertRaises(ReadTimeoutError):
+            retry.increment("GET", "/", error=ReadTimeoutError(None, "/", "Read timed out."))
+
+
+if __name__ == '__main__':
+    unittest.main()
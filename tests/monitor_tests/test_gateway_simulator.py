@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+import requests
+from app.functions.trashcan_monitor import TrashcanMonitor
+from app.functions.fleet_collector import FleetCollector
+from app.functions.rate_engine import RateEngine
+from app.models import GatewayTarget, metric_extractor
+from tests.gateway_sim import GatewaySimulator, SimulatorFleet, redact
+
+
+def monitor_for(url: str, **settings) -> TrashcanMonitor:
+    monitor = TrashcanMonitor()
+    monitor.target_gateway_url = url
+    for key, value in settings.items():
+        setattr(monitor, key, value)
+    return monitor
+
+
+class TestGatewaySimulator(unittest.TestCase):
+
+    def test_monitor_collects_every_endpoint(self):
+        with GatewaySimulator() as simulator:
+            monitor = monitor_for(simulator.url)
+            results = monitor.start_test()
+
+        self.assertTrue(results["gateway_check"])
+        self.assertEqual("n41", results["radio_raw_data"]["cell_5G_stats_cfg"][0]["stat"]["Band"])
+        self.assertIn("WAN", results["interface_data_raw"])
+        self.assertIn("lan_ether", results["lan_status_raw"])
+        self.assertEqual(1, simulator.requests["/lan_status_web_app.cgi"])
+
+        timings = results["timings"]
+        self.assertGreater(timings["gateway_check"]["connect_ms"], 0, "The first request opens a connection.")
+        self.assertEqual(0, timings["lan_status_raw"]["connect_ms"], "Later requests reuse it.")
+        self.assertIn("json_ms", timings["interface_data_raw"])
+        self.assertLessEqual(timings["radio_raw_data"]["ttfb_ms"], timings["radio_raw_data"]["total_ms"])
+        self.assertGreater(timings["collect_ms"], 0)
+
+    def test_counters_progress(self):
+        with GatewaySimulator(counter_rate=1e9) as simulator:
+            monitor = monitor_for(simulator.url)
+            engine = RateEngine()
+            engine.process(monitor.start_test())
+            results = engine.process(monitor.start_test())
+
+        self.assertGreater(results["rates"]["cellular_stats_bytes_received_per_s"], 0)
+        self.assertEqual(0, results["rates"]["cellular_stats_errors_sent_per_s"])
+
+    def test_counters_wrap_at_32_bits(self):
+        simulator = GatewaySimulator(wrap_32bit=True)
+        payload = simulator.payload("/statistics_status_web_app.cgi")
+        simulator.stop()
+        values = metric_extractor.extract({"interface_data_raw": payload})
+        self.assertLess(values["cellular_stats_bytes_received"], 2 ** 32)
+
+    def test_errors_and_timeouts(self):
+        with GatewaySimulator(error_rate=1.0) as simulator:
+            response = requests.get(simulator.url + "statistics_status_web_app.cgi")
+            self.assertEqual(500, response.status_code)
+
+        with GatewaySimulator(timeout_rate=1.0, timeout_seconds=1) as simulator:
+            monitor = monitor_for(simulator.url, concurrent_collection=True, collection_deadline=0.3)
+            results = monitor.start_test()
+        self.assertFalse(results["gateway_check"])
+        self.assertIn("deadline", results["endpoint_errors"]["radio_raw_data"])
+
+    def test_fleet_of_simulators(self):
+        with SimulatorFleet(5, latency=0.01, seed=1) as fleet:
+            targets = []
+            for entry in fleet.targets():
+                target = GatewayTarget(**entry)
+                targets.append((target, monitor_for(target.target_gateway_url)))
+            collector = FleetCollector(targets, max_in_flight=8, sleep_time=1)
+            seen = {}
+
+            def on_result(results):
+                seen[results["gateway_id"]] = results
+                if len(seen) == len(targets):
+                    collector.stop()
+
+            asyncio.run(asyncio.wait_for(collector.run_async(on_result), timeout=10))
+
+        self.assertEqual({f"sim{index}" for index in range(5)}, set(seen))
+        self.assertTrue(all(results["gateway_check"] for results in seen.values()))
+
+    def test_recorder_redacts_identifiers(self):
+        payload = {"sim_cfg": [{"IMEI": "3512", "Status": True}], "device_cfg": [{"MACAddress": "aa:bb"}]}
+        self.assertEqual({"sim_cfg": [{"IMEI": "REDACTED", "Status": True}],
+                          "device_cfg": [{"MACAddress": "REDACTED"}]}, redact(payload))
+
+
+if __name__ == '__main__':
+    unittest.main()
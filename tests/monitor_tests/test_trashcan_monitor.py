@@ -0,0 +1,120 @@
+import time
+import unittest
+from requests.exceptions import ConnectionError
+from app.functions.trashcan_monitor import TrashcanMonitor
+
+
+class StubMonitor(TrashcanMonitor):
+    """
+        TrashcanMonitor with the gateway requests replaced by canned answers.
+    """
+    concurrent_collection = True
+    collection_deadline = 1
+
+    def check_gateway_url(self) -> bool:
+        return True
+
+    def get_radio_data(self) -> dict:
+        return {"cellular_stats": []}
+
+    def get_inet_data(self) -> dict:
+        raise ConnectionError("interface endpoint refused")
+
+    def get_lanstat_data(self) -> dict:
+        time.sleep(3)
+        return {}
+
+
+class TestConcurrentCollection(unittest.TestCase):
+
+    def test_endpoint_failures_are_kept_per_endpoint(self):
+        monitor = StubMonitor()
+        results = monitor.start_test()
+
+        self.assertTrue(results["gateway_check"], "gateway_check should survive other endpoint failures.")
+        self.assertEqual(results["radio_raw_data"], {"cellular_stats": []}, "radio_raw_data was not recorded.")
+        self.assertNotIn("interface_data_raw", results, "A failed endpoint should not leave data behind.")
+        self.assertIn("ConnectionError", results["endpoint_errors"]["interface_data_raw"])
+        self.assertIn("deadline", results["endpoint_errors"]["lan_status_raw"])
+
+    def test_deadline_bounds_the_sample(self):
+        monitor = StubMonitor()
+        started = time.monotonic()
+        monitor.start_test()
+
+        self.assertLess(time.monotonic() - started, 2, "Collection should stop waiting at collection_deadline.")
+
+
+class CountingMonitor(TrashcanMonitor):
+    """
+        TrashcanMonitor that counts requests per endpoint and can be switched to failing.
+    """
+    endpoint_refresh = {"gateway_check": 300, "lan_status_raw": 300}
+
+    def __init__(self):
+        self.requests = {}
+        self.failing = False
+
+    def _request(self, key, value):
+        self.requests[key] = self.requests.get(key, 0) + 1
+        if self.failing:
+            raise ConnectionError(f"{key} refused")
+        return value
+
+    def check_gateway_url(self) -> bool:
+        return self._request("gateway_check", True)
+
+    def get_radio_data(self) -> dict:
+        return self._request("radio_raw_data", {"cellular_stats": []})
+
+    def get_inet_data(self) -> dict:
+        return self._request("interface_data_raw", {"WAN": []})
+
+    def get_lanstat_data(self) -> dict:
+        return self._request("lan_status_raw", {"lan": []})
+
+
+class TestEndpointRefresh(unittest.TestCase):
+
+    def test_slow_endpoints_are_served_from_cache(self):
+        monitor = CountingMonitor()
+        first = monitor.start_test()
+        second = monitor.start_test()
+
+        self.assertNotIn("cached_endpoints", first)
+        self.assertEqual(["gateway_check", "lan_status_raw"], second["cached_endpoints"])
+        self.assertEqual({"lan": []}, second["lan_status_raw"])
+        self.assertTrue(second["gateway_check"])
+        self.assertEqual({"gateway_check": 1, "radio_raw_data": 2, "interface_data_raw": 2, "lan_status_raw": 1},
+                         monitor.requests)
+
+    def test_failure_clears_the_cache(self):
+        monitor = CountingMonitor()
+        monitor.concurrent_collection = True
+        monitor.start_test()
+
+        monitor.failing = True
+        failed = monitor.start_test()
+        self.assertFalse(failed["gateway_check"], "A cached gateway check should not hide a failing gateway.")
+
+        monitor.failing = False
+        recovered = monitor.start_test()
+        self.assertNotIn("cached_endpoints", recovered)
+        self.assertEqual(2, monitor.requests["lan_status_raw"])
+
+    def test_lan_status_uses_its_own_url(self):
+        monitor = TrashcanMonitor()
+        requested = []
+
+        class Session:
+            def get(self, url, **kwargs):
+                requested.append(url)
+                return type("Response", (), {"content": b"{}"})()
+
+        monitor._session = Session()
+        monitor.get_lanstat_data()
+        self.assertTrue(requested[0].endswith("/lan_status_web_app.cgi"))
+
+
+if __name__ == '__main__':
+    unittest.main()
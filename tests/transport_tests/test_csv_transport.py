@@ -0,0 +1,83 @@
+import csv
+import gzip
+import shutil
+import tempfile
+import time
+import unittest
+from os import listdir, path
+from datetime import datetime, timezone
+from app.transport.csv import CsvTransport
+
+SAMPLE = {
+    "timestamp": datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    "gateway_check": True,
+    "radio_raw_data": {
+        "cellular_stats": [{"BytesReceived": 1000, "BytesSent": 200}],
+        "cell_5G_stats_cfg": [{"stat": {"SNRCurrent": 12, "Band": "n41"}}]
+    },
+    "interface_data_raw": {"WAN": [{"Service": [{"EthernetBytesSent": 300}]}]}
+}
+
+
+class TestCsvTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.csv_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.csv_dir)
+
+    def read_rows(self, file_name):
+        opener = gzip.open if file_name.endswith(".gz") else open
+        with opener(path.join(self.csv_dir, file_name), "rt", newline="") as f:
+            return list(csv.reader(f))
+
+    def test_rows_are_buffered_until_flush(self):
+        transport = CsvTransport(csv_path=self.csv_dir, flush_interval=60)
+        transport.add_data(SAMPLE)
+        self.assertEqual(listdir(self.csv_dir), [], "A single small row should stay buffered.")
+
+        transport.close()
+        rows = self.read_rows(listdir(self.csv_dir)[0])
+        self.assertEqual(rows[0], CsvTransport.header, "The file should start with the fixed header.")
+        record = dict(zip(rows[0], rows[1]))
+        self.assertEqual(record["cell_5g_stats_SNRCurrent"], "12.0")
+        self.assertEqual(record["cellular_stats_bytes_sent"], "300")
+        self.assertEqual(record["cell_lte_stats_Band"], "", "Missing values should be written empty.")
+
+    def test_old_rows_are_written_without_a_new_result(self):
+        transport = CsvTransport(csv_path=self.csv_dir, flush_interval=0.1)
+        transport.add_data(SAMPLE)
+        deadline = time.monotonic() + 2
+        while transport.rows_written == 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+        self.assertEqual(transport.rows_written, 1, "The timer should write rows once they are flush_interval old.")
+        self.assertEqual(len(self.read_rows(listdir(self.csv_dir)[0])), 2)
+        transport.close()
+
+    def test_rotates_by_size(self):
+        transport = CsvTransport(csv_path=self.csv_dir, flush_bytes=0, rotate_bytes=1)
+        for _ in range(3):
+            transport.add_data(SAMPLE)
+        transport.close()
+
+        files = sorted(listdir(self.csv_dir))
+        self.assertEqual(len(files), 3, "Each flush past rotate_bytes should start a new file.")
+        for file_name in files:
+            self.assertEqual(len(self.read_rows(file_name)), 2, "Every rotated file needs its own header.")
+
+    def test_gzip_output(self):
+        transport = CsvTransport(csv_path=self.csv_dir, compress=True, flush_bytes=0)
+        for _ in range(5):
+            transport.add_data(SAMPLE)
+        transport.close()
+
+        files = listdir(self.csv_dir)
+        self.assertTrue(files[0].endswith(".csv.gz"))
+        self.assertEqual(len(self.read_rows(files[0])), 6)
+        self.assertEqual(transport.rows_written, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import copy
+import unittest
+from bson import encode
+from bson.raw_bson import RawBSONDocument
+from app.transport.mongodb import MongoTransport
+from app.transport.delta_codec import DeltaEncoder, diff, apply_delta
+
+
+def payloads(step):
+    return {
+        "radio_raw_data": {
+            "cellular_stats": [{"BytesReceived": 1000 * step, "BytesSent": 100 * step}],
+            "cell_5G_stats_cfg": [{"stat": {"SNRCurrent": 10 + step % 3, "Band": "n41", "PhysicalCellID": 311,
+                                            **{f"Config{index}": index for index in range(60)}}}],
+        },
+        "interface_data_raw": {"WAN": [{"Service": [{"EthernetBytesSent": 50 * step,
+                                                     **{f"Setting{index}": "x" * 20 for index in range(40)}}]}]},
+        "lan_status_raw": {"Devices": [{"Name": f"device{index}", "MAC": f"00:11:22:33:44:{index:02d}"}
+                                       for index in range(20)]}
+    }
+
+
+class TestDiff(unittest.TestCase):
+
+    def test_round_trip(self):
+        base = {"a": 1, "b": {"c": [1, 2, {"d": 3}], "e": "x"}, "gone": True}
+        new = {"a": 1, "b": {"c": [1, 5, {"d": 4}], "e": "y", "f": None}, "list": [1]}
+        sets, unsets = diff(base, new)
+
+        self.assertEqual(apply_delta(base, sets, unsets), new)
+        self.assertEqual(base["b"]["c"][1], 2, "The base should not be modified.")
+
+    def test_resized_list_is_replaced(self):
+        sets, unsets = diff({"l": [1, 2]}, {"l": [1, 2, 3]})
+        self.assertEqual(sets, [[["l"], [1, 2, 3]]])
+
+    def test_payload_replaced_by_none(self):
+        sets, unsets = diff({"a": 1}, None)
+        self.assertIsNone(apply_delta({"a": 1}, sets, unsets))
+
+
+class TestDeltaEncoder(unittest.TestCase):
+
+    def document(self, step):
+        return {"timestamp": step, "gateway_id": "gw1", "gateway_check": True, **payloads(step)}
+
+    def test_snapshots_and_rebuild(self):
+        encoder = DeltaEncoder(snapshot_every=3)
+        stored = [encoder.encode(self.document(step), "gw1") for step in range(8)]
+
+        self.assertEqual([document["storage"] for document in stored],
+                         ["snapshot", "delta", "delta", "delta", "snapshot", "delta", "delta", "delta"])
+        snapshots = {document["_id"]: document for document in stored if document["storage"] == "snapshot"}
+        for step, document in enumerate(stored):
+            rebuilt = DeltaEncoder.decode(document, snapshots.get(document.get("snapshot_id")))
+            for field in ("radio_raw_data", "interface_data_raw", "lan_status_raw"):
+                self.assertEqual(rebuilt[field], payloads(step)[field], f"Step {step} {field} did not rebuild.")
+
+    def test_reset_forces_snapshot(self):
+        encoder = DeltaEncoder()
+        encoder.encode(self.document(0), "gw1")
+        encoder.reset("gw1")
+        self.assertEqual(encoder.encode(self.document(1), "gw1")["storage"], "snapshot")
+
+    def test_reset_of_an_older_snapshot_is_ignored(self):
+        encoder = DeltaEncoder(snapshot_every=1)
+        stored = [encoder.encode(self.document(step), "gw1") for step in range(3)]
+        self.assertEqual([document["storage"] for document in stored], ["snapshot", "delta", "snapshot"])
+        encoder.reset("gw1", snapshot_id=stored[0]["_id"])
+        self.assertEqual(encoder.encode(self.document(3), "gw1")["storage"], "delta",
+                         "A failed write of an older snapshot should leave the current one alone.")
+
+    def test_batch_failure_of_a_snapshot_resets_its_gateway(self):
+        transport = MongoTransport.__new__(MongoTransport)
+        transport.delta_encoder = DeltaEncoder()
+        snapshot = transport.delta_encoder.encode(self.document(0), "gw1")
+        delta = transport.delta_encoder.encode(self.document(1), "gw1")
+        transport._batch_failed([RawBSONDocument(encode(delta))])
+        self.assertEqual(transport.delta_encoder.encode(self.document(2), "gw1")["storage"], "delta")
+
+        transport._batch_failed([RawBSONDocument(encode(snapshot))])
+        self.assertEqual(transport.delta_encoder.encode(self.document(3), "gw1")["storage"], "snapshot",
+                         "Deltas should not be written against a snapshot that was never stored.")
+
+    def test_deltas_are_much_smaller(self):
+        encoder = DeltaEncoder(snapshot_every=60)
+        full = 0
+        stored = 0
+        for step in range(120):
+            document = self.document(step)
+            full += len(encode(copy.deepcopy(document)))
+            stored += len(encode(encoder.encode(document, "gw1")))
+        self.assertLess(stored * 5, full, "Change-only storage should be several times smaller.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+import time
+import unittest
+from threading import Lock
+from bson import decode, encode
+from bson.raw_bson import RawBSONDocument
+from pymongo.errors import AutoReconnect, BulkWriteError
+from app.transport.mongodb.batch_writer import MongoBatchWriter
+
+
+class InsertResult:
+    def __init__(self, documents):
+        self.inserted_ids = [document["_id"] for document in documents]
+
+
+class FakeCollection:
+    """
+        Records insert_many calls in place of a pymongo collection.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+        self.lock = Lock()
+
+    def insert_many(self, documents, ordered=True):
+        time.sleep(self.delay)
+        with self.lock:
+            self.batches.append([decode(document.raw) for document in documents])
+        return InsertResult(self.batches[-1])
+
+
+class FlakyCollection(FakeCollection):
+    """
+        Fails the first failures insert_many calls as an unreachable server would.
+    """
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def insert_many(self, documents, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise AutoReconnect("connection refused")
+        return super().insert_many(documents, ordered)
+
+
+class DroppingCollection(FakeCollection):
+    """
+        Stores the first half of the first insert_many call, then loses the connection, as a server that does not
+        enforce a unique _id would.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.dropped = False
+
+    def insert_many(self, documents, ordered=True):
+        if not self.dropped:
+            self.dropped = True
+            super().insert_many(documents[:len(documents) // 2], ordered)
+            raise AutoReconnect("connection closed")
+        return super().insert_many(documents, ordered)
+
+    def missing_documents(self, documents):
+        stored = {document["_id"] for batch in self.batches for document in batch}
+        return [document for document in documents if document["_id"] not in stored]
+
+
+class RejectingCollection(FakeCollection):
+    def insert_many(self, documents, ordered=True):
+        raise BulkWriteError({"nInserted": len(documents) - 2, "writeErrors": [
+            {"index": 0, "code": 11000, "errmsg": "duplicate key"},
+            {"index": 1, "code": 121, "errmsg": "Document failed validation"}
+        ]})
+
+
+class TestMongoBatchWriter(unittest.TestCase):
+
+    def test_batch_sent_again_skips_what_was_stored(self):
+        collection = DroppingCollection()
+        writer = MongoBatchWriter(collection, max_docs=10, max_age=60, retry_interval=0.05,
+                                  missing_documents=collection.missing_documents)
+        for index in range(10):
+            writer.add({"_id": index})
+        deadline = time.monotonic() + 2
+        while writer.stats()["flushed"] < 10 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        writer.close()
+
+        stored = [document["_id"] for batch in collection.batches for document in batch]
+        self.assertEqual(list(range(10)), stored, "Documents stored before the failure should not be sent again.")
+        self.assertEqual(10, writer.stats()["flushed"])
+
+    def test_flushes_on_batch_size(self):
+        collection = FakeCollection()
+        writer = MongoBatchWriter(collection, max_docs=10, max_age=60)
+        for index in range(25):
+            writer.add({"_id": index})
+        time.sleep(0.2)
+
+        self.assertEqual([len(batch) for batch in collection.batches], [10, 10], "Full batches should flush early.")
+        self.assertEqual(writer.stats()["queue_depth"], 5, "The partial batch should still be queued.")
+
+        writer.close()
+        self.assertEqual(sum(len(batch) for batch in collection.batches), 25, "close should drain the queue.")
+        self.assertEqual(writer.stats()["flushed"], 25)
+
+    def test_flushes_on_age(self):
+        collection = FakeCollection()
+        writer = MongoBatchWriter(collection, max_docs=100, max_age=0.1)
+        writer.add({"_id": 1})
+        time.sleep(0.4)
+
+        self.assertEqual(len(collection.batches), 1, "An old document should flush without a full batch.")
+        writer.close()
+
+    def test_flushes_on_bytes(self):
+        collection = FakeCollection()
+        writer = MongoBatchWriter(collection, max_docs=100, max_bytes=1000, max_age=60)
+        for index in range(4):
+            writer.add({"_id": index, "payload": "x" * 400})
+        time.sleep(0.2)
+
+        self.assertGreaterEqual(len(collection.batches), 1, "Large documents should flush on byte size.")
+        writer.close()
+
+    def test_add_after_close_is_rejected(self):
+        writer = MongoBatchWriter(FakeCollection())
+        writer.close()
+        with self.assertRaises(RuntimeError):
+            writer.add({"_id": 1})
+
+    def test_flush_latency_is_reported(self):
+        writer = MongoBatchWriter(FakeCollection(delay=0.05), max_docs=1)
+        writer.add({"_id": 1})
+        writer.close()
+
+        stats = writer.stats()
+        self.assertEqual(stats["batches"], 1)
+        self.assertGreaterEqual(stats["max_flush_latency"], 0.05)
+
+    def test_failed_batches_are_retried_in_order(self):
+        collection = FlakyCollection(failures=2)
+        writer = MongoBatchWriter(collection, max_docs=5, max_age=60, retry_interval=0.05)
+        for index in range(5):
+            writer.add({"_id": index})
+        time.sleep(0.4)
+
+        self.assertEqual([[document["_id"] for document in batch] for batch in collection.batches], [list(range(5))],
+                         "A batch the server did not take should be written once it is back.")
+        stats = writer.stats()
+        writer.close()
+        self.assertEqual((stats["retries"], stats["failed"], stats["flushed"]), (2, 0, 5))
+
+    def test_rejected_documents_go_to_on_failure(self):
+        failed = []
+        writer = MongoBatchWriter(RejectingCollection(), max_docs=3, max_age=60, on_failure=failed.extend)
+        for index in range(3):
+            writer.add({"_id": index})
+        writer.close()
+
+        self.assertEqual([decode(document.raw)["_id"] for document in failed], [1],
+                         "Only the rejected document should be given up, a duplicate is already stored.")
+        self.assertEqual((writer.stats()["flushed"], writer.stats()["failed"]), (2, 1))
+
+    def test_close_hands_unwritten_documents_to_on_failure(self):
+        failed = []
+        writer = MongoBatchWriter(FlakyCollection(failures=100), max_docs=2, max_age=60, retry_interval=60,
+                                  on_failure=failed.extend)
+        for index in range(5):
+            writer.add({"_id": index})
+        started = time.monotonic()
+        writer.close(timeout=5)
+
+        self.assertLess(time.monotonic() - started, 5, "close should not wait for the retry interval.")
+        self.assertEqual(sorted(decode(document.raw)["_id"] for document in failed), list(range(5)))
+
+    def test_age_of_leftover_documents_is_kept(self):
+        writer = MongoBatchWriter(FakeCollection(), max_docs=2)
+        writer.close()
+        for index in range(3):
+            writer._queue.append((RawBSONDocument(encode({"_id": index})), 100.0 + index))
+        with writer._condition:
+            writer._take_batch()
+        self.assertEqual(writer._oldest, 102.0, "The age limit of a leftover document should not start over.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+from time import monotonic
+from pymongo.errors import ServerSelectionTimeoutError
+from app.functions.config_init import ConfigApp
+from app.transport.mongodb import MongoTransport
+from app.transport.mongodb.collection_setup import ensure_results_collection, granularity_for
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.indexes = []
+
+    def create_index(self, keys):
+        self.indexes.append(keys)
+
+    def rename(self, new_name):
+        self.db.collections[new_name] = self.db.collections.pop(self.name)
+        self.db.documents[new_name] = self.db.documents.pop(self.name, [])
+
+    def find(self, query, batch_size=None):
+        return iter(self.db.documents.get(self.name, []))
+
+    def insert_many(self, documents, ordered=True):
+        self.db.documents.setdefault(self.name, []).extend(documents)
+        return type("InsertResult", (), {"inserted_ids": [None] * len(documents)})
+
+
+class FakeClient:
+    def __init__(self, version):
+        self.version = version
+
+    def server_info(self):
+        return {"versionArray": self.version}
+
+
+class FakeDatabase:
+    """
+        Just enough of a pymongo Database to follow the bootstrap decisions.
+    """
+
+    def __init__(self, version=(7, 0, 0), collections=None, documents=None):
+        self.client = FakeClient(list(version))
+        self.collections = collections or {}
+        self.documents = documents or {}
+        self.handles = {}
+
+    def list_collections(self, filter):
+        name = filter["name"]
+        if name in self.collections:
+            return [{"name": name, "type": self.collections[name]}]
+        return []
+
+    def create_collection(self, name, timeseries=None):
+        self.collections[name] = "timeseries" if timeseries else "collection"
+        self.created_with = timeseries
+
+    def __getitem__(self, name):
+        return self.handles.setdefault(name, FakeCollection(self, name))
+
+
+class TestCollectionSetup(unittest.TestCase):
+
+    def test_granularity_follows_sleep_time(self):
+        self.assertEqual(granularity_for(15), "seconds")
+        self.assertEqual(granularity_for(300), "minutes")
+        self.assertEqual(granularity_for(7200), "hours")
+
+    def test_creates_timeseries_collection(self):
+        db = FakeDatabase()
+        self.assertTrue(ensure_results_collection(db, "results", granularity="minutes"))
+        self.assertEqual(db.created_with, {"timeField": "timestamp", "metaField": "gateway_id",
+                                           "granularity": "minutes"})
+        self.assertIn([("gateway_id", 1), ("timestamp", -1)], db["results"].indexes,
+                      "The gateway/time index should be created.")
+
+    def test_migrates_plain_collection(self):
+        db = FakeDatabase(collections={"results": "collection"}, documents={"results": [{"timestamp": 1}] * 3})
+        self.assertTrue(ensure_results_collection(db, "results", batch_size=2))
+
+        legacy = [name for name in db.collections if name.startswith("results_legacy_")]
+        self.assertEqual(len(legacy), 1, "The original collection should be kept under a legacy name.")
+        self.assertEqual(db.collections["results"], "timeseries")
+        self.assertEqual(len(db.documents["results"]), 3, "Every document should be copied across.")
+
+    def test_migrated_documents_get_their_container_as_meta_field(self):
+        documents = [{"timestamp": 1, "container_id": "box1"}, {"timestamp": 2, "container_id": "box1",
+                                                                 "gateway_id": "gw1"}]
+        db = FakeDatabase(collections={"results": "collection"}, documents={"results": documents})
+        ensure_results_collection(db, "results")
+        self.assertEqual(["box1", "gw1"], [document["gateway_id"] for document in db.documents["results"]],
+                         "Legacy documents should join the series new documents of the same container go to.")
+
+    def test_old_server_keeps_plain_collection(self):
+        db = FakeDatabase(version=(4, 4, 0), collections={"results": "collection"})
+        self.assertFalse(ensure_results_collection(db, "results"))
+        self.assertTrue(db["results"].indexes, "Indexes should still be created on older servers.")
+
+    def test_bootstrap_waits_for_the_first_write(self):
+        config = ConfigApp(transport="mongodb", mongo_timeseries=True)
+        started = monotonic()
+        transport = MongoTransport(from_config=config, mongodb_uri="mongodb://127.0.0.1:1/", results_db="tcresults",
+                                   db_collection="results", server_timeout_ms=100)
+        self.assertLess(monotonic() - started, 0.1, "Building the transport should not wait for the server.")
+
+        with self.assertRaises(ServerSelectionTimeoutError):
+            transport.add_data({"container_id": "test", "gateway_check": True})
+        self.assertFalse(transport._bootstrapped, "A failed bootstrap should be tried again with the next write.")
+        transport.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
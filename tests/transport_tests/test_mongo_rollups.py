@@ -0,0 +1,113 @@
+import unittest
+from datetime import datetime, timezone
+from app.transport.mongodb import MongoTransport
+
+
+def evaluate(expression, document: dict, variables: dict):
+    """
+        Evaluates the few aggregation expressions the rollup update uses, in place of a server.
+    """
+    if isinstance(expression, str) and expression.startswith("$"):
+        keys = expression[2:].split(".") if expression.startswith("$$") else expression[1:].split(".")
+        value = variables[keys.pop(0)] if expression.startswith("$$") else document
+        for key in keys:
+            value = value.get(key) if isinstance(value, dict) else None
+        return value
+    if isinstance(expression, list):
+        return [evaluate(item, document, variables) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if len(expression) == 1 and next(iter(expression)).startswith("$"):
+        operator, argument = next(iter(expression.items()))
+        if operator == "$literal":
+            return argument
+        if operator == "$let":
+            inner = dict(variables, **{name: evaluate(value, document, variables)
+                                       for name, value in argument["vars"].items()})
+            return evaluate(argument["in"], document, inner)
+        if operator == "$cond":
+            condition, then, otherwise = argument
+            return evaluate(then if evaluate(condition, document, variables) else otherwise, document, variables)
+        values = evaluate(argument, document, variables)
+        if operator == "$gt":
+            return values[0] is not None and values[0] > values[1]
+        present = [value for value in values if value is not None]
+        operations = {"$min": min, "$max": max, "$add": sum,
+                      "$multiply": lambda items: items[0] * items[1], "$divide": lambda items: items[0] / items[1]}
+        return operations[operator](present)
+    return {key: evaluate(value, document, variables) for key, value in expression.items()}
+
+
+def apply_update(stored: dict, pipeline: list) -> dict:
+    document = dict(stored, metrics=dict(stored.get("metrics", {})))
+    for stage in pipeline:
+        values = {field: evaluate(expression, document, {}) for field, expression in stage["$set"].items()}
+        for field, value in values.items():
+            target = document
+            *parents, last = field.split(".")
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[last] = value
+    return document
+
+
+def rollup(snr: dict) -> dict:
+    return {"level": "hour", "gateway_id": "gw1", "bucket_start": datetime(2026, 1, 1, tzinfo=timezone.utc),
+            "metrics": {"cell_5g_stats_SNRCurrent": snr}}
+
+
+class TestMongoRollups(unittest.TestCase):
+
+    def test_a_bucket_written_twice_is_merged(self):
+        first = rollup({"min": 1.0, "max": 5.0, "mean": 3.0, "count": 2, "last": 5.0, "p50": 3.0})
+        later = rollup({"min": 0.0, "max": 4.0, "mean": 0.0, "count": 2, "last": 0.0, "p50": 0.0})
+        stored = apply_update({"gateway_id": "gw1", "bucket_start": first["bucket_start"]},
+                              MongoTransport.rollup_update(first))
+        self.assertEqual(stored["metrics"]["cell_5g_stats_SNRCurrent"], first["metrics"]["cell_5g_stats_SNRCurrent"],
+                         "A new bucket should be stored as it is.")
+        self.assertEqual(stored["level"], "hour")
+
+        merged = apply_update(stored, MongoTransport.rollup_update(later))["metrics"]["cell_5g_stats_SNRCurrent"]
+        self.assertEqual(merged, {"min": 0.0, "max": 5.0, "mean": 1.5, "count": 4, "last": 0.0, "p50": 0.0})
+
+    def test_buckets_are_upserted_by_gateway_and_start(self):
+        class Collection:
+            requests = None
+
+            def bulk_write(self, requests, ordered=True):
+                Collection.requests = requests
+
+        transport = MongoTransport.__new__(MongoTransport)
+        transport.db_acc = {"results_rollup_hour": Collection()}
+        transport.db_collection = "results"
+        document = rollup({"min": 1.0, "max": 5.0, "mean": 3.0, "count": 2, "last": 5.0})
+        transport.add_rollups("hour", [document])
+
+        request = Collection.requests[0]
+        self.assertEqual(request._filter, {"gateway_id": "gw1", "bucket_start": document["bucket_start"]})
+        self.assertEqual(request._doc, MongoTransport.rollup_update(document))
+        self.assertTrue(request._upsert, "A bucket seen for the first time should be inserted.")
+
+    def test_cell_changes_written_twice_are_stored_once(self):
+        class Collection:
+            requests = []
+
+            def bulk_write(self, requests, ordered=True):
+                Collection.requests += requests
+
+        transport = MongoTransport.__new__(MongoTransport)
+        transport.db_acc = {"results_cell_changes": Collection()}
+        transport.db_collection = "results"
+        change = {"gateway_id": "gw1", "technology": "5g", "field": "cell", "old_value": 311, "new_value": 98,
+                  "changed_at": datetime(2026, 1, 1, tzinfo=timezone.utc), "dwell_seconds": 600.0}
+        transport.add_cell_changes([change])
+        transport.add_cell_changes([change])
+
+        first, second = Collection.requests
+        self.assertEqual(first._filter, second._filter, "A record sent again should replace the stored one.")
+        self.assertEqual(first._filter, {"_id": "gw1/5g/cell/1767225600000"})
+        self.assertTrue(second._upsert)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+from types import SimpleNamespace
+from app.functions.config_init import ConfigApp
+from app.models.config_model import TransportEnum
+from app.transport.registry import TRANSPORTS, load_transport, create_transport, register_transport
+from app.transport.csv import CsvTransport
+
+
+class TestTransportRegistry(unittest.TestCase):
+
+    def test_load_by_enum_or_value(self):
+        self.assertIs(CsvTransport, load_transport(TransportEnum.csv))
+        self.assertIs(CsvTransport, load_transport("csv"))
+        self.assertIsNone(load_transport("api"))
+        with self.assertRaises(ValueError):
+            load_transport("ftp")
+
+    def test_create_from_config(self):
+        csv_path = tempfile.mkdtemp()
+        try:
+            config = SimpleNamespace(csv_path=csv_path, csv_compress=False, csv_flush_interval=1.0,
+                                     csv_flush_bytes=65536, csv_rotate_bytes=0, csv_rotate_daily=False)
+            transport = create_transport("csv", config)
+            self.assertIsInstance(transport, CsvTransport)
+            transport.close()
+            self.assertIsNone(create_transport("api", config))
+        finally:
+            shutil.rmtree(csv_path)
+
+    def test_register_replaces_a_backend(self):
+        previous = TRANSPORTS[TransportEnum.csv]
+        try:
+            register_transport("csv", "app.transport.sql", "SqliteTransport")
+            self.assertEqual("SqliteTransport", load_transport("csv").__name__)
+        finally:
+            TRANSPORTS[TransportEnum.csv] = previous
+
+    def test_unselected_backends_are_not_imported(self):
+        code = ("import sys, app.main; from app.transport.registry import load_transport; load_transport('csv'); "
+                "print(sorted({'pymongo', 'bson', 'asyncio'} & set(sys.modules)))")
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual("[]", output.strip())
+
+    def test_selected_transports(self):
+        single = SimpleNamespace(transport=TransportEnum.csv, transports=None)
+        self.assertEqual([TransportEnum.csv], ConfigApp.selected_transports(single))
+        several = SimpleNamespace(transport=TransportEnum.csv,
+                                  transports=[TransportEnum.sql, TransportEnum.csv, TransportEnum.sql])
+        self.assertEqual([TransportEnum.sql, TransportEnum.csv], ConfigApp.selected_transports(several))
+
+
+if __name__ == '__main__':
+    unittest.main()
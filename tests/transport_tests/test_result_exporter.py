@@ -0,0 +1,150 @@
+import io
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+from os import path
+from copy import deepcopy
+from datetime import datetime, timedelta
+from bson import ObjectId
+from app.transport.delta_codec import DeltaEncoder
+from app.transport.mongodb.exporter import ResultExporter
+
+START = datetime(2026, 1, 1)
+
+
+class FakeCollection:
+    """
+        Answers find and find_one over a list of documents, with the filters, projections and sorts the exporter
+        uses. Timestamps are naive UTC, as pymongo returns them.
+    """
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.finds = []
+
+    @staticmethod
+    def _naive(value):
+        return value.replace(tzinfo=None) if isinstance(value, datetime) and value.tzinfo else value
+
+    def _matches(self, document, query):
+        for field, condition in query.items():
+            value = document.get(field)
+            if isinstance(condition, dict):
+                if "$gte" in condition and not value >= self._naive(condition["$gte"]):
+                    return False
+                if "$lt" in condition and not value < self._naive(condition["$lt"]):
+                    return False
+                if "$lte" in condition and not value <= self._naive(condition["$lte"]):
+                    return False
+            elif value != self._naive(condition):
+                return False
+        return True
+
+    @staticmethod
+    def _project(document, projection):
+        if projection is None:
+            return deepcopy(document)
+        projected = {"_id": document["_id"]}
+        for field in projection:
+            top, _, sub = field.partition(".")
+            if top not in document:
+                continue
+            if sub:
+                if sub in document[top]:
+                    projected.setdefault(top, {})[sub] = deepcopy(document[top][sub])
+            else:
+                projected[top] = deepcopy(document[top])
+        return projected
+
+    def find(self, query, projection=None, sort=None, batch_size=None):
+        self.finds.append({"query": query, "projection": projection, "batch_size": batch_size})
+        found = [document for document in self.documents if self._matches(document, query)]
+        if sort:
+            field, direction = sort[0]
+            found.sort(key=lambda document: document[field], reverse=direction < 0)
+        return (self._project(document, projection) for document in found)
+
+    def find_one(self, query, projection=None, sort=None):
+        return next(self.find(query, projection, sort), None)
+
+
+def stored_documents(count: int = 10, snapshot_every: int = 4) -> list:
+    encoder = DeltaEncoder(snapshot_every=snapshot_every)
+    documents = []
+    for index in range(count):
+        document = {
+            "timestamp": START + timedelta(minutes=index),
+            "container_id": "test",
+            "gateway_id": "gw1",
+            "gateway_check": True,
+            "radio_raw_data": {"cell_5G_stats_cfg": [{"stat": {"SNRCurrent": index, "Band": "n41"}}]},
+            "interface_data_raw": {"WAN": [{"Service": [{"EthernetBytesSent": 1000 + index}]}]},
+            "lan_status_raw": {"lan_ether": [{"Speed": 1000}]}
+        }
+        document = encoder.encode(document, "gw1")
+        # Assigned by insert_one for deltas.
+        document.setdefault("_id", ObjectId())
+        documents.append(document)
+    return documents
+
+
+class TestResultExporter(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection(stored_documents())
+
+    def test_projection_only_reads_the_metric_sources(self):
+        exporter = ResultExporter(self.collection, metrics=["cell_5g_stats_SNRCurrent"])
+        projection = exporter.projection()
+        self.assertIn("radio_raw_data", projection)
+        self.assertIn("delta.radio_raw_data", projection)
+        self.assertNotIn("interface_data_raw", projection)
+        self.assertNotIn("lan_status_raw", projection)
+
+    def test_csv_rebuilds_deltas_in_time_order(self):
+        exporter = ResultExporter(self.collection, metrics=["cell_5g_stats_SNRCurrent", "cell_5g_stats_Band"],
+                                  batch_size=3)
+        stream = io.StringIO()
+        written = exporter.export(exporter.writer("csv", stream=stream), START + timedelta(minutes=2),
+                                  START + timedelta(minutes=9))
+        rows = list(csv.reader(io.StringIO(stream.getvalue())))
+        self.assertEqual(7, written)
+        self.assertEqual(["timestamp", "gateway_id", "gateway_check", "cell_5g_stats_SNRCurrent",
+                          "cell_5g_stats_Band"], rows[0])
+        self.assertEqual([str(float(index)) for index in range(2, 9)], [row[3] for row in rows[1:]])
+        self.assertEqual("2026-01-01T00:02:00+00:00", rows[1][0])
+        self.assertEqual(3, self.collection.finds[0]["batch_size"])
+
+    def test_raw_ndjson_keeps_the_chosen_fields(self):
+        exporter = ResultExporter(self.collection, raw=True, fields=["interface_data_raw"])
+        stream = io.StringIO()
+        exporter.export(exporter.writer("ndjson", stream=stream), gateway_id="gw1")
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(10, len(lines))
+        self.assertEqual(1009, lines[-1]["interface_data_raw"]["WAN"][0]["Service"][0]["EthernetBytesSent"])
+        self.assertNotIn("radio_raw_data", lines[-1])
+
+    def test_parallel_slices_cover_every_document_once(self):
+        out_dir = tempfile.mkdtemp()
+        try:
+            exporter = ResultExporter(self.collection, metrics=["cell_5g_stats_SNRCurrent"])
+            written = exporter.export_files("ndjson", path.join(out_dir, "results.ndjson"), workers=3)
+            self.assertEqual(3, len(written))
+            self.assertEqual(10, sum(written.values()))
+            values = []
+            for file_path in sorted(written):
+                with open(file_path) as f:
+                    values += [json.loads(line)["cell_5g_stats_SNRCurrent"] for line in f]
+            self.assertEqual(list(range(10)), values)
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_unknown_metric(self):
+        with self.assertRaises(ValueError):
+            ResultExporter(self.collection, metrics=["no_such_metric"])
+
+
+if __name__ == '__main__':
+    unittest.main()
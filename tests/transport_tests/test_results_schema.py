@@ -0,0 +1,51 @@
+import unittest
+from logging import getLogger
+from app.transport.mongodb import MongoTransport
+from app.transport.mongodb.results_schema import ResultsSchema
+from tests.gateway_sim import load_fixtures
+
+
+def sample() -> dict:
+    fixtures = load_fixtures()
+    return {
+        "container_id": "test",
+        "gateway_id": "gw1",
+        "gateway_check": True,
+        "radio_raw_data": fixtures["/fastmile_radio_status_web_app.cgi"],
+        "interface_data_raw": fixtures["/statistics_status_web_app.cgi"],
+        "lan_status_raw": None,
+        "timings": {"collect_ms": 12.5},
+        "extra_field": 1
+    }
+
+
+class TestTrustedDocument(unittest.TestCase):
+
+    def test_matches_the_validated_document(self):
+        data = sample()
+        validated = ResultsSchema(**data).dict(by_alias=True)
+        trusted = ResultsSchema.trusted_document(data)
+        validated.pop("timestamp")
+        trusted.pop("timestamp")
+        self.assertEqual(validated, trusted)
+        self.assertIs(data["radio_raw_data"], ResultsSchema.trusted_document(data)["radio_raw_data"])
+
+    def test_required_fields_are_checked(self):
+        with self.assertRaises(ValueError):
+            ResultsSchema.trusted_document({"container_id": "test", "gateway_check": "yes"})
+        with self.assertRaises(ValueError):
+            ResultsSchema.trusted_document({"gateway_check": True})
+
+    def test_prepare_leaves_the_results_unchanged(self):
+        transport = MongoTransport.__new__(MongoTransport)
+        transport.log = getLogger(MongoTransport.__module__)
+        transport.trusted_results = True
+        data = sample()
+        document = transport._prepare(data)
+        self.assertIn("schema_ms", document["timings"])
+        self.assertEqual({"collect_ms": 12.5}, data["timings"])
+        self.assertEqual("gw1", document["gateway_id"])
+
+
+if __name__ == '__main__':
+    unittest.main()
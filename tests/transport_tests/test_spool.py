@@ -0,0 +1,239 @@
+import shutil
+import tempfile
+import unittest
+from os import path, listdir
+from time import sleep, monotonic
+from datetime import datetime, timezone
+from app.transport.spool import Spool, SpoolFull, SpooledTransport
+
+
+def sample(index: int) -> dict:
+    return {
+        "timestamp": datetime(2026, 1, 2, 3, 4, index % 60, tzinfo=timezone.utc),
+        "gateway_id": "gw1",
+        "index": index,
+        "gateway_check": True
+    }
+
+
+class FlakyTransport:
+    """
+    Stands in for a database, it refuses writes while down.
+    """
+
+    def __init__(self):
+        self.down = False
+        self.stored = []
+        self.batches = 0
+
+    def add_many(self, documents: list) -> int:
+        if self.down:
+            raise ConnectionError("transport is down")
+        self.batches += 1
+        self.stored += documents
+        return len(documents)
+
+
+def wait_for(condition, timeout: float = 5) -> bool:
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        if condition():
+            return True
+        sleep(0.01)
+    return False
+
+
+class TestSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.spool_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_path)
+
+    def test_records_survive_a_restart(self):
+        spool = Spool(self.spool_path, fsync_policy="never")
+        for index in range(5):
+            spool.append(sample(index))
+        spool.ack(2)
+        spool.close()
+
+        reopened = Spool(self.spool_path)
+        records = reopened.read(100)
+        self.assertEqual([3, 4, 5], [sequence for sequence, _ in records])
+        self.assertEqual(2, records[0][1]["index"])
+        self.assertEqual(sample(2)["timestamp"], records[0][1]["timestamp"])
+        self.assertEqual(6, reopened.append(sample(5)))
+
+    def test_torn_record_is_cut_off(self):
+        spool = Spool(self.spool_path, fsync_policy="always")
+        spool.append(sample(0))
+        spool.append(sample(1))
+        spool.close()
+
+        segment = path.join(self.spool_path, listdir(self.spool_path)[0])
+        with open(segment, "r+b") as f:
+            f.truncate(path.getsize(segment) - 3)
+
+        reopened = Spool(self.spool_path)
+        self.assertEqual([1], [sequence for sequence, _ in reopened.read(100)])
+        self.assertEqual(2, reopened.append(sample(2)))
+        self.assertEqual([1, 2], [sequence for sequence, _ in reopened.read(100)])
+
+    def test_acked_segments_are_deleted(self):
+        spool = Spool(self.spool_path, segment_bytes=200, fsync_policy="never")
+        for index in range(10):
+            spool.append(sample(index))
+        segments = len([name for name in listdir(self.spool_path) if name.startswith("segment-")])
+        self.assertGreater(segments, 2)
+
+        spool.ack(10)
+        self.assertEqual(1, len([name for name in listdir(self.spool_path) if name.startswith("segment-")]))
+        self.assertEqual([], spool.read(100))
+        self.assertEqual(0, spool.pending())
+
+    def test_reads_continue_after_the_acknowledged_record(self):
+        scanned = []
+
+        class CountingSpool(Spool):
+            @staticmethod
+            def _scan(segment: str, offset: int = 0):
+                for record in Spool._scan(segment, offset):
+                    scanned.append(record[0])
+                    yield record
+
+        spool = CountingSpool(self.spool_path, segment_bytes=1000, fsync_policy="never")
+        for index in range(20):
+            spool.append(sample(index))
+        drained = []
+        while spool.pending():
+            records = spool.read(3)
+            drained += [document["index"] for _, document in records]
+            spool.ack(records[-1][0])
+        self.assertEqual(list(range(20)), drained)
+        self.assertEqual(list(range(1, 21)), scanned, "Acknowledged records should not be read again.")
+
+    def test_quota_refuses_new_records(self):
+        spool = Spool(self.spool_path, quota_bytes=300, fsync_policy="never")
+        with self.assertRaises(SpoolFull):
+            for index in range(10):
+                spool.append(sample(index))
+        stored = spool.pending()
+        self.assertGreater(stored, 0)
+        self.assertEqual(stored, len(spool.read(100)))
+
+
+class TestSpooledTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.spool_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_path)
+
+    def test_replays_after_outage_without_loss_or_duplicates(self):
+        transport = FlakyTransport()
+        transport.down = True
+        spooled = SpooledTransport(transport, Spool(self.spool_path, fsync_policy="never"), retry_interval=0.05)
+        for index in range(20):
+            spooled.add_data(sample(index))
+        self.assertTrue(wait_for(lambda: spooled.failures > 0))
+        self.assertEqual([], transport.stored)
+
+        transport.down = False
+        self.assertTrue(wait_for(lambda: spooled.spool.pending() == 0))
+        self.assertEqual(list(range(20)), [document["index"] for document in transport.stored])
+        self.assertEqual(20, len({document["_id"] for document in transport.stored}))
+        spooled.close()
+
+    def test_restart_resumes_after_the_ack(self):
+        transport = FlakyTransport()
+        transport.down = True
+        spooled = SpooledTransport(transport, Spool(self.spool_path, fsync_policy="never"), retry_interval=60)
+        for index in range(5):
+            spooled.add_data(sample(index))
+        spooled.close(timeout=0.1)
+
+        transport.down = False
+        restarted = SpooledTransport(transport, Spool(self.spool_path), retry_interval=60)
+        self.assertTrue(wait_for(lambda: restarted.spool.pending() == 0))
+        restarted.close()
+
+        again = SpooledTransport(transport, Spool(self.spool_path), retry_interval=60)
+        again.close(timeout=0.1)
+        self.assertEqual(list(range(5)), [document["index"] for document in transport.stored])
+
+    def test_in_doubt_batch_is_checked_after_restart(self):
+        transport = FlakyTransport()
+        spool = Spool(self.spool_path, fsync_policy="never")
+        for index in range(3):
+            spool.append(dict(sample(index), _id=index))
+        spool.close()
+
+        # The first record was written before a crash, its ack was not.
+        transport.stored.append({"_id": 0, "index": 0})
+        transport.missing_documents = lambda documents: [document for document in documents
+                                                         if document["_id"] not in {0}]
+        spooled = SpooledTransport(transport, Spool(self.spool_path), retry_interval=60)
+        self.assertTrue(wait_for(lambda: spooled.spool.pending() == 0))
+        spooled.close()
+        self.assertEqual([0, 1, 2], [document["index"] for document in transport.stored])
+
+    def test_buffering_transport_is_flushed_before_the_ack(self):
+        class BufferingTransport:
+            def __init__(self):
+                self.down = True
+                self.buffered = []
+                self.stored = []
+
+            def add_data(self, document):
+                self.buffered.append(document)
+
+            def missing_documents(self, documents):
+                held = {document["_id"] for document in self.buffered + self.stored}
+                return [document for document in documents if document["_id"] not in held]
+
+            def flush(self):
+                if self.down:
+                    raise ConnectionError("transport is down")
+                self.stored += self.buffered
+                self.buffered = []
+
+        transport = BufferingTransport()
+        spooled = SpooledTransport(transport, Spool(self.spool_path, fsync_policy="never"), retry_interval=0.05)
+        for index in range(5):
+            spooled.add_data(sample(index))
+        self.assertTrue(wait_for(lambda: spooled.failures > 1))
+        self.assertEqual(5, spooled.spool.pending(), "Records only buffered by the transport should not be acked.")
+
+        transport.down = False
+        self.assertTrue(wait_for(lambda: spooled.spool.pending() == 0))
+        spooled.close()
+        self.assertEqual(list(range(5)), [document["index"] for document in transport.stored])
+
+    def test_failed_replay_is_checked_before_it_is_sent_again(self):
+        class PartialTransport(FlakyTransport):
+            def add_many(self, documents):
+                if self.down:
+                    # Half the batch made it in before the connection dropped.
+                    self.stored += documents[:(len(documents) + 1) // 2]
+                    self.down = False
+                    raise ConnectionError("connection reset")
+                return super().add_many(documents)
+
+            def missing_documents(self, documents):
+                stored = {document["_id"] for document in self.stored}
+                return [document for document in documents if document["_id"] not in stored]
+
+        transport = PartialTransport()
+        transport.down = True
+        spooled = SpooledTransport(transport, Spool(self.spool_path, fsync_policy="never"), retry_interval=0.05)
+        for index in range(6):
+            spooled.add_data(sample(index))
+        self.assertTrue(wait_for(lambda: spooled.spool.pending() == 0))
+        spooled.close()
+        self.assertEqual(list(range(6)), [document["index"] for document in transport.stored])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from os import path
+from time import perf_counter, monotonic, sleep
+from datetime import datetime, timezone
+from app.transport.sql import SqliteTransport
+
+SAMPLE = {
+    "timestamp": datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    "gateway_id": "gw1",
+    "gateway_check": True,
+    "radio_raw_data": {"cell_5G_stats_cfg": [{"stat": {"SNRCurrent": 12.5, "PhysicalCellID": 311, "Band": "n41"}}]},
+    "interface_data_raw": {"WAN": [{"Service": [{"EthernetBytesSent": 300}]}]}
+}
+
+
+class TestSqliteTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.sql_dir = tempfile.mkdtemp()
+        self.sql_path = path.join(self.sql_dir, "results.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.sql_dir)
+
+    def test_results_are_batched(self):
+        transport = SqliteTransport(sql_path=self.sql_path, batch_size=3, batch_age=60)
+        transport.add_data(SAMPLE)
+        transport.add_data(SAMPLE)
+        self.assertEqual(transport.rows_written, 0, "Results should wait for a full batch.")
+
+        transport.add_data(SAMPLE)
+        self.assertEqual(transport.rows_written, 3, "A full batch should be written.")
+        transport.close()
+
+    def test_old_results_are_written_without_a_new_one(self):
+        transport = SqliteTransport(sql_path=self.sql_path, batch_size=100, batch_age=0.1)
+        transport.add_data(SAMPLE)
+        deadline = monotonic() + 2
+        while transport.rows_written == 0 and monotonic() < deadline:
+            sleep(0.02)
+        self.assertEqual(transport.rows_written, 1, "The timer should write results once they are batch_age old.")
+        transport.close()
+
+    def test_failed_batch_stays_buffered(self):
+        transport = SqliteTransport(sql_path=self.sql_path, batch_size=100, batch_age=60)
+        transport.add_data(SAMPLE)
+        transport.add_data(SAMPLE)
+        # A second connection holding the write lock makes the commit fail.
+        blocker = sqlite3.connect(self.sql_path, timeout=0)
+        blocker.execute("BEGIN IMMEDIATE")
+        transport.connection.execute("PRAGMA busy_timeout = 0")
+        with self.assertRaises(Exception):
+            transport.flush()
+        blocker.rollback()
+        blocker.close()
+
+        transport.flush()
+        self.assertEqual(transport.rows_written, 2, "The batch should be written once the database is free again.")
+        self.assertEqual(transport.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0], 2)
+        transport.close()
+
+    def test_missing_documents_skips_stored_and_buffered_ids(self):
+        transport = SqliteTransport(sql_path=self.sql_path, batch_size=100, batch_age=60)
+        documents = [dict(SAMPLE, _id=f"doc-{index}") for index in range(3)]
+        transport.add_data(documents[0])
+        transport.flush()
+        transport.add_data(documents[1])
+        self.assertEqual(transport.missing_documents(documents), [documents[2]],
+                         "Stored and buffered documents should not be sent again.")
+        transport.close()
+
+    def test_typed_columns_and_raw_side_table(self):
+        transport = SqliteTransport(sql_path=self.sql_path)
+        transport.add_data(SAMPLE)
+        transport.close()
+
+        connection = sqlite3.connect(self.sql_path)
+        row = connection.execute("SELECT gateway_id, gateway_check, cell_5g_stats_SNRCurrent, "
+                                 "cell_5g_stats_PhysicalCellID, cell_5g_stats_Band, cellular_stats_bytes_sent, "
+                                 "cell_lte_stats_SNRCurrent, timestamp FROM results").fetchone()
+        self.assertEqual(row[:7], ("gw1", 1, 12.5, 311, "n41", 300, None))
+        self.assertEqual(row[7], SAMPLE["timestamp"].timestamp())
+
+        raw = connection.execute("SELECT radio_raw_data FROM raw_results WHERE result_id = 1").fetchone()[0]
+        self.assertEqual(json.loads(raw), SAMPLE["radio_raw_data"])
+        self.assertEqual(connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        connection.close()
+
+    def test_ids_continue_after_reopen(self):
+        transport = SqliteTransport(sql_path=self.sql_path)
+        transport.add_data(SAMPLE)
+        transport.close()
+        transport = SqliteTransport(sql_path=self.sql_path)
+        transport.add_data(SAMPLE)
+        transport.close()
+
+        connection = sqlite3.connect(self.sql_path)
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM raw_results").fetchone()[0], 2)
+        connection.close()
+
+    def test_rollups_merge_and_expire(self):
+        transport = SqliteTransport(sql_path=self.sql_path, retention={"minute": 3600})
+        bucket = {"gateway_id": "gw1", "bucket_start": SAMPLE["timestamp"], "metrics": {
+            "cell_5g_stats_SNRCurrent": {"min": 1.0, "max": 5.0, "mean": 3.0, "count": 2, "last": 5.0, "p50": 3.0}
+        }}
+        later = {"gateway_id": "gw1", "bucket_start": SAMPLE["timestamp"], "metrics": {
+            "cell_5g_stats_SNRCurrent": {"min": 0.0, "max": 4.0, "mean": 0.0, "count": 2, "last": 0.0, "p50": 0.0}
+        }}
+        transport.add_rollups("minute", [bucket])
+        transport.add_rollups("minute", [later])
+
+        row = transport.connection.execute('SELECT "min", "max", mean, count, last FROM rollups').fetchone()
+        self.assertEqual(row, (0.0, 5.0, 1.5, 4, 0.0), "A bucket written twice should be merged.")
+
+        transport.prune(now=SAMPLE["timestamp"].timestamp() + 7200)
+        self.assertEqual(transport.connection.execute("SELECT COUNT(*) FROM rollups").fetchone()[0], 0,
+                         "Rollups past their retention should be deleted.")
+        transport.close()
+
+    def test_events_are_replaced_when_they_end(self):
+        transport = SqliteTransport(sql_path=self.sql_path)
+        started = {"event_id": "gw1/outage//1", "gateway_id": "gw1", "kind": "outage", "metric": None,
+                   "start": SAMPLE["timestamp"], "end": None, "duration_seconds": None}
+        transport.add_events([started])
+        self.assertIsNone(transport.events(gateway_id="gw1")[0]["end"], "A started event should be open.")
+
+        ended = dict(started, end=datetime(2026, 1, 2, 3, 9, 5, tzinfo=timezone.utc), duration_seconds=300.0,
+                     failed_samples=5)
+        transport.add_events([ended])
+        events = transport.events(kind="outage", since=SAMPLE["timestamp"].timestamp())
+        self.assertEqual(len(events), 1, "The ended event should replace the open one.")
+        self.assertEqual(events[0]["duration_seconds"], 300.0)
+        self.assertEqual(events[0]["details"], {"failed_samples": 5})
+        self.assertEqual(transport.events(kind="degradation"), [])
+        transport.close()
+
+    def test_time_on_each_cell(self):
+        transport = SqliteTransport(sql_path=self.sql_path)
+        start = SAMPLE["timestamp"].timestamp()
+        changes = [(None, 311, 0), (311, 98, 600), (98, 311, 900), (311, 98, 3600)]
+        transport.add_cell_changes([
+            {"gateway_id": "gw1", "technology": "5g", "field": "cell", "old_value": old, "new_value": new,
+             "changed_at": datetime.fromtimestamp(start + offset, tz=timezone.utc), "dwell_seconds": None}
+            for old, new, offset in changes
+        ])
+        self.assertEqual(transport.cell_dwell("gw1", since=start + 300, until=start + 1800), {311: 1200.0, 98: 300.0},
+                         "Dwell should be clipped to the window, from the last change before it.")
+        self.assertEqual(transport.cell_dwell("gw1", since=start + 4000, until=start + 4100), {98: 100.0})
+        self.assertEqual(transport.cell_dwell("gw2", since=start, until=start + 100), {})
+        self.assertEqual(transport.connection.execute("SELECT typeof(new_value) FROM cell_changes").fetchone()[0],
+                         "integer", "Cell ids should stay integers.")
+        transport.close()
+
+    def test_sustains_thousands_of_inserts_per_second(self):
+        transport = SqliteTransport(sql_path=self.sql_path, batch_size=500)
+        started = perf_counter()
+        for _ in range(5000):
+            transport.add_data(SAMPLE)
+        transport.close()
+
+        self.assertGreater(5000 / (perf_counter() - started), 2000, "Batched inserts are slower than expected.")
+
+
+if __name__ == '__main__':
+    unittest.main()